@@ -0,0 +1,221 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Helpers shared by the benchmarks. The screen and driver here stand in for a
+running service and a real device, so the benchmarks need neither. Run the
+benchmarks from the source tree, e.g. "python src/benchmarks/theme_fps.py"
+'''
+
+import os
+import sys
+import time
+
+# Allow running from local path
+path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if os.path.exists(path):
+    sys.path.insert(0, path)
+
+import cairo
+import gnome15.g15driver as g15driver
+import gnome15.g15devices as g15devices
+
+"""
+Directory the bundled plugins (and so most of the bundled themes) are in
+"""
+PLUGINS_DIR = os.path.join(path, "plugins")
+
+def measure(function, duration = 2.0, minimum = 10):
+    """
+    Call a function repeatedly for at least the given number of seconds (and
+    at least minimum times). Returns a tuple of ( calls, seconds taken ). The
+    function is passed the number of the call, starting at zero.
+
+    Keyword arguments:
+    function        -- function to call
+    duration        -- number of seconds to run for
+    minimum         -- minimum number of calls
+    """
+    calls = 0
+    started = time.time()
+    while True:
+        function(calls)
+        calls += 1
+        taken = time.time() - started
+        if calls >= minimum and taken >= duration:
+            return calls, taken
+
+def new_canvas(driver):
+    """
+    Create a cairo context on a new image surface the size of the driver's
+    screen, with the driver's antialiasing.
+
+    Keyword arguments:
+    driver          -- driver
+    """
+    width, height = driver.get_size()
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    canvas = cairo.Context(surface)
+    canvas.set_antialias(driver.get_antialias())
+    fo = cairo.FontOptions()
+    fo.set_antialias(driver.get_antialias())
+    canvas.set_font_options(fo)
+    return canvas
+
+class BenchMacroHandler(object):
+    """
+    Counts the macros the key handler would have run
+    """
+    def __init__(self):
+        self.macros = 0
+
+    def handle_macro(self, macro):
+        self.macros += 1
+
+class BenchService(object):
+    """
+    The service settings the screen components and key handler use
+    """
+    def __init__(self):
+        self.disable_svg_glow = False
+        self.scroll_amount = 5
+        self.scroll_delay = 500
+        self.animated_menus = False
+        self.animation_delay = 0.1
+        self.key_hold_duration = 2.0
+        self.macro_handler = BenchMacroHandler()
+
+class BenchKeyHandler(object):
+    def __init__(self):
+        self.action_listeners = []
+
+    def get_key_states(self):
+        return {}
+
+class BenchScreen(object):
+    """
+    Enough of G15Screen for pages and their components to be created and
+    painted. Redraws are counted rather than queued.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.device = driver.device
+        self.conf_client = None
+        self.service = BenchService()
+        self.key_handler = BenchKeyHandler()
+        self.screen_change_listeners = []
+        self.memory_bank = 1
+        self.pages = []
+        self.visible_page = None
+        self.redraws = 0
+
+    def redraw(self, page = None, direction = "up", transitions = True, redraw_content = True, queue = True, damaged_only = False):
+        self.redraws += 1
+
+    def add_page(self, page):
+        self.pages.append(page)
+        if self.visible_page is None:
+            self.visible_page = page
+        return page
+
+    def del_page(self, page):
+        if page in self.pages:
+            self.pages.remove(page)
+        if self.visible_page == page:
+            self.visible_page = None
+
+    def get_page(self, page_id):
+        for page in self.pages:
+            if page.id == page_id:
+                return page
+
+    def get_visible_page(self):
+        return self.visible_page
+
+    def get_memory_bank(self):
+        return self.memory_bank
+
+    def set_priority(self, page, priority, revert_after = 0.0, delete_after = 0.0, do_redraw = True):
+        page.set_priority(priority)
+
+    def resched_cycle(self, arg1 = None, arg2 = None, arg3 = None, arg4 = None):
+        pass
+
+    def page_title_changed(self, page, title):
+        pass
+
+    def configure_canvas(self, canvas):
+        canvas.set_antialias(self.driver.get_antialias())
+        fo = cairo.FontOptions()
+        fo.set_antialias(self.driver.get_antialias())
+        canvas.set_font_options(fo)
+        return fo
+
+class BenchDriver(g15driver.AbstractDriver):
+    """
+    Driver for a model's screen that counts the frames painted instead of
+    sending them anywhere.
+    """
+    def __init__(self, model_id):
+        g15driver.AbstractDriver.__init__(self, "bench")
+        self.device = g15devices.Device(None, None, None, 0, g15devices.get_device_info(model_id))
+        colour = self.device.bpp != 1
+        self.controls = [ g15driver.Control("foreground", "Foreground", (255, 255, 255) if colour else (0, 0, 0),
+                                            hint = g15driver.HINT_FOREGROUND | g15driver.HINT_VIRTUAL),
+                          g15driver.Control("background", "Background", (0, 0, 0) if colour else (255, 255, 255),
+                                            hint = g15driver.HINT_BACKGROUND | g15driver.HINT_VIRTUAL),
+                          g15driver.Control("highlight", "Highlight", (255, 0, 0) if colour else (0, 0, 0),
+                                            hint = g15driver.HINT_HIGHLIGHT | g15driver.HINT_VIRTUAL) ]
+        self.frames = 0
+
+    def get_antialias(self):
+        return cairo.ANTIALIAS_NONE if self.device.bpp == 1 else cairo.ANTIALIAS_SUBPIXEL
+
+    def get_size(self):
+        return self.device.lcd_size
+
+    def get_bpp(self):
+        return self.device.bpp
+
+    def get_controls(self):
+        return self.controls
+
+    def get_key_layout(self):
+        return self.device.key_layout
+
+    def get_action_keys(self):
+        return self.device.action_keys
+
+    def get_name(self):
+        return "Benchmark"
+
+    def get_model_names(self):
+        return [ self.device.model_id ]
+
+    def get_model_name(self):
+        return self.device.model_id
+
+    def process_svg(self, document):
+        pass
+
+    def on_update_control(self, control):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def paint(self, image):
+        self.frames += 1
@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the rate 320x240 frames can be pushed to a G19. Each frame is
+encoded with the same RGB565 encoder the G19 drivers use and copied to a
+string as send_frame_buffer() does before the bulk write. This is done both
+with cairo's 16 bit format and with the PIL conversion used when cairo does
+not have it.
+
+With --device, the frames are also sent to a connected G19, which gives the
+rate the panel actually sustains.
+"""
+
+import os
+import sys
+import optparse
+import benchutil
+
+# Use the local version of pylibg19, as the driver does when run from source
+sys.path.insert(0, os.path.join(benchutil.path, "pylibg19"))
+
+import cairo
+import gnome15.util.g15bitmap as g15bitmap
+from g19.g19 import G19
+from g19.g19 import FRAME_HEADER
+
+WIDTH = 320
+HEIGHT = 240
+
+def create_surfaces(count):
+    """
+    Create some different frames to send, so nothing can be skipped because
+    it is the same as the last frame.
+    """
+    surfaces = []
+    for i in range(0, count):
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(surface)
+        gradient = cairo.LinearGradient(0, 0, WIDTH, HEIGHT)
+        gradient.add_color_stop_rgb(0, float(i) / count, 0.2, 1.0 - float(i) / count)
+        gradient.add_color_stop_rgb(1, 0.0, float(i) / count, 0.5)
+        ctx.set_source(gradient)
+        ctx.paint()
+        ctx.set_source_rgb(1.0, 1.0, 1.0)
+        ctx.rectangle(i * WIDTH / count, HEIGHT / 3, WIDTH / count, HEIGHT / 3)
+        ctx.fill()
+        surfaces.append(surface)
+    return surfaces
+
+def measure_push(surfaces, duration, push):
+    encoder = g15bitmap.RGB565Encoder(WIDTH, HEIGHT, transpose = True, header = FRAME_HEADER)
+
+    def send(frame):
+        push(encoder.encode(surfaces[frame % len(surfaces)]))
+
+    frames, taken = benchutil.measure(send, duration)
+    return frames / taken
+
+def has_rgb16_565():
+    try:
+        cairo.ImageSurface(g15bitmap.FORMAT_RGB16_565, 1, 1)
+        return True
+    except Exception:
+        return False
+
+def report(name, fps, conversion):
+    print "%-24s %-8s %8.1f frames/sec %8.2f ms/frame %8.1f MB/sec" % ( name, conversion, fps, 1000.0 / fps,
+                                                                        fps * ( len(FRAME_HEADER) + WIDTH * HEIGHT * 2 ) / 1048576.0 )
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-D", "--device", action="store_true", dest="device",
+        help="Also send the frames to a connected G19.")
+    parser.add_option("-d", "--duration", dest="duration", type="float", default=5.0,
+        help="Number of seconds to push frames for in each test.")
+    (options, args) = parser.parse_args()
+
+    surfaces = create_surfaces(8)
+    conversion = "16 bit" if has_rgb16_565() else "PIL"
+    copy = lambda frame: str(frame)
+    report("Encode", measure_push(surfaces, options.duration, copy), conversion)
+
+    if conversion != "PIL":
+        # Encode as cairo versions without the 16 bit format would
+        native_format = g15bitmap.FORMAT_RGB16_565
+        g15bitmap.FORMAT_RGB16_565 = -1
+        try:
+            report("Encode", measure_push(surfaces, options.duration, copy), "PIL")
+        finally:
+            g15bitmap.FORMAT_RGB16_565 = native_format
+
+    if options.device:
+        lg19 = G19()
+        try:
+            report("Encode and send to G19", measure_push(surfaces, options.duration, lg19.send_frame_buffer), conversion)
+        finally:
+            lg19.close()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the key events per second G15KeyHandler can handle with a large
+synthetic profile (1,000 macros by default, spread over the three memory
+banks). Macros are bound to single G keys and to combinations of two and
+three, are activated on release, press or hold, and are a mix of uinput
+mappings and ordinary macros. Random combinations are pressed and released
+with the first memory bank active, each event being handled as it would be
+on the macro queue. The uinput events the handler
+emits are only counted, so nothing is typed while the benchmark runs.
+"""
+
+import random
+import time
+import optparse
+import benchutil
+
+import gnome15.g15driver as g15driver
+import gnome15.g15profile as g15profile
+import gnome15.g15keyboard as g15keyboard
+import gnome15.g15uinput as g15uinput
+
+STATES = [ g15driver.KEY_STATE_UP, g15driver.KEY_STATE_DOWN, g15driver.KEY_STATE_HELD ]
+
+def create_profile(device, macro_count, banks, rnd):
+    """
+    Create a profile (that is never saved) with the given number of macros
+    spread over a number of memory banks. Each macro in a bank has a 
+    different key combination and state.
+    """
+    g_keys = [ key for key in device.all_keys if key.startswith("g") and key[1:].isdigit() ]
+    combinations = [ [ key ] for key in g_keys ]
+    for i, a in enumerate(g_keys):
+        for j, b in enumerate(g_keys[i + 1:]):
+            combinations.append([ a, b ])
+            for c in g_keys[i + j + 2:]:
+                combinations.append([ a, b, c ])
+    available = [ ( keys, state ) for keys in combinations for state in STATES ]
+    per_bank = ( macro_count + banks - 1 ) / banks
+    if per_bank > len(available):
+        raise Exception("%s only has enough G keys for %d macros in a bank" % ( device.model_id, len(available) ))
+    profile = g15profile.G15Profile(device)
+    for i in range(0, macro_count):
+        bank = i % banks + 1
+        if bank == 1:
+            bank_macros = iter(rnd.sample(available, per_bank))
+        keys, state = bank_macros.next()
+        macro = g15profile.G15Macro(profile, bank, g15profile.get_keys_key(keys), state)
+        macro.name = "Macro %d" % i
+        if ( i / banks ) % 3 == 0 and state != g15driver.KEY_STATE_HELD:
+            macro.type = g15profile.MACRO_KEYBOARD
+            macro.macro = "KEY_%s" % chr(ord("A") + i % 26)
+        else:
+            macro.type = g15profile.MACRO_SIMPLE
+            macro.macro = "Text %d" % i
+        profile.macros[state][bank - 1].append(macro)
+    return profile, g_keys, combinations
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--model", dest="model", default=g15driver.MODEL_G15_V1,
+        help="Model ID of the device the profile is for.")
+    parser.add_option("-c", "--macros", dest="macros", type="int", default=1000,
+        help="Number of macros in the profile.")
+    parser.add_option("-b", "--banks", dest="banks", type="int", default=3,
+        help="Number of memory banks the macros are spread over.")
+    parser.add_option("-e", "--events", dest="events", type="int", default=100000,
+        help="Number of key events to handle.")
+    (options, args) = parser.parse_args()
+
+    rnd = random.Random(15)
+    screen = benchutil.BenchScreen(benchutil.BenchDriver(options.model))
+    bank = screen.get_memory_bank()
+    profile, g_keys, combinations = create_profile(screen.device, options.macros, options.banks, rnd)
+
+    emitted = [ 0 ]
+    def emit(target, code, value, syn = True):
+        emitted[0] += 1
+    g15uinput.emit = emit
+
+    started = time.time()
+    macro_index = g15keyboard.MacroIndex(screen.device, profile, bank)
+    index_time = time.time() - started
+
+    key_handler = g15keyboard.G15KeyHandler(screen)
+    key_handler._G15KeyHandler__macro_index = macro_index
+
+    # Press and release random combinations, as a player would
+    events = []
+    while len(events) < options.events:
+        keys = rnd.choice(combinations)
+        events.append(( keys, g15driver.KEY_STATE_DOWN ))
+        events.append(( keys, g15driver.KEY_STATE_UP ))
+
+    started = time.time()
+    for keys, state_id in events:
+        key_handler._do_key_received(keys, state_id)
+    taken = time.time() - started
+
+    print "Profile with %d macros on %d G keys, %d of them indexed for memory bank %d" % ( options.macros, len(g_keys),
+                                                                                          len(macro_index.order), bank )
+    print "Built macro index in %.3f ms" % ( index_time * 1000.0 )
+    print "Handled %d key events in %.3f seconds, %.0f events/sec, %.1f us/event" % ( len(events), taken,
+                                                                                       len(events) / taken,
+                                                                                       taken * 1000000.0 / len(events) )
+    print "Ran %d macros and emitted %d uinput events" % ( screen.service.macro_handler.macros, emitted[0] )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures paging through a menu with a lot of items (10,000 by default),
+using the menu themes of the RSS plugin. The time taken to add the items
+and paint the first page is reported, then the menu is paged down to the
+last item and back up again (as the Right and Left keys do), painting the
+page after each move.
+
+Virtual menus are measured by default. With --compare, a normal menu (which
+configures every item when it is added) is measured as well, so use fewer
+items with that.
+"""
+
+import os
+import time
+import optparse
+import benchutil
+
+import gnome15.g15driver as g15driver
+import gnome15.g15theme as g15theme
+
+def create_page(screen, theme_dir, item_count, virtual):
+    """
+    Create a page containing a menu of the given number of items, and a
+    scrollbar for it.
+    """
+    page = g15theme.G15Page("bench", screen, theme = g15theme.G15Theme(theme_dir, "menu-screen"),
+                            theme_properties_callback = lambda: { "title" : "Benchmark",
+                                                                  "alt_title" : "",
+                                                                  "no_items" : item_count == 0 })
+    screen.add_page(page)
+    menu = g15theme.Menu("menu", virtual = virtual)
+    menu.focusable = True
+    page.set_focused_component(menu)
+    menu.set_focused(True)
+    page.add_child(menu)
+    page.add_child(g15theme.MenuScrollbar("viewScrollbar", menu))
+    for i in range(0, item_count):
+        menu.add_child(g15theme.MenuItem("item-%d" % i, name = "Item %d" % i, alt = str(i)))
+    return page, menu
+
+def measure_menu(screen, theme_dir, item_count, duration, virtual):
+    canvas = benchutil.new_canvas(screen.driver)
+    started = time.time()
+    page, menu = create_page(screen, theme_dir, item_count, virtual)
+    page.paint(canvas)
+    first_paint = time.time() - started
+    
+    direction = [ g15driver.G_KEY_RIGHT ]
+    def move(call):
+        if menu.selected == menu.get_child(item_count - 1):
+            direction[0] = g15driver.G_KEY_LEFT
+        elif menu.selected == menu.get_child(0):
+            direction[0] = g15driver.G_KEY_RIGHT
+        menu.handle_key(direction, g15driver.KEY_STATE_DOWN, False)
+        page.paint(canvas)
+    
+    pages, taken = benchutil.measure(move, duration)
+    configured = len([ item for item in menu.get_children() if item.theme is not None ])
+    screen.del_page(page)
+    return first_paint, pages / taken, configured
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--model", dest="model", default=g15driver.MODEL_G19,
+        help="Model ID whose menu themes are drawn.")
+    parser.add_option("-i", "--items", dest="items", type="int", default=10000,
+        help="Number of items in the menu.")
+    parser.add_option("-t", "--theme", dest="theme", default=os.path.join(benchutil.PLUGINS_DIR, "rss", "default"),
+        help="Directory containing the menu themes.")
+    parser.add_option("-c", "--compare", action="store_true", dest="compare",
+        help="Also measure a menu that is not virtual.")
+    parser.add_option("-d", "--duration", dest="duration", type="float", default=5.0,
+        help="Number of seconds to page through each menu for.")
+    (options, args) = parser.parse_args()
+
+    screen = benchutil.BenchScreen(benchutil.BenchDriver(options.model))
+    print "%-10s %8s %16s %12s %12s %12s" % ( "Menu", "Items", "First paint ms", "Pages/sec", "ms/page", "Configured" )
+    for virtual in [ True, False ] if options.compare else [ True ]:
+        first_paint, pages_per_second, configured = measure_menu(screen, options.theme, options.items,
+                                                                 options.duration, virtual)
+        print "%-10s %8d %16.1f %12.1f %12.2f %12d" % ( "virtual" if virtual else "normal", options.items,
+                                                        first_paint * 1000.0, pages_per_second,
+                                                        1000.0 / pages_per_second, configured )
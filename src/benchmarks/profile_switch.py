@@ -0,0 +1,156 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the latency of switching profile when the focused window changes,
+with a number of synthetic profiles (200 by default) that each activate on
+the focus of a different window. A switch finds the profile for the window,
+loads the now active profile and selects the key handler's macro index for
+it, as the screen and key handler do.
+
+"uncached" parses every profile and builds a new macro index on each switch,
+as was done before profiles were cached. "cold" switches straight after all
+cached profiles are discarded, "changed" straight after one profile file has
+changed, and "warm" with everything cached. The profiles are written to a
+temporary directory, so the user's own profiles are not touched.
+"""
+
+import os
+import time
+import random
+import shutil
+import tempfile
+import optparse
+import benchutil
+
+import gnome15.g15driver as g15driver
+import gnome15.g15profile as g15profile
+import gnome15.g15keyboard as g15keyboard
+
+def create_profiles(device, profile_count, macro_count, rnd):
+    """
+    Write the default profile and the given number of profiles that
+    activate on focus, each with some macros bound to random G keys.
+    Returns the list of window names, one for each profile.
+    """
+    g_keys = [ key for key in device.all_keys if key.startswith("g") and key[1:].isdigit() ]
+    default_profile = g15profile.G15Profile(device, "Default")
+    default_profile.name = "Default"
+    default_profile.save()
+    window_names = []
+    for i in range(0, profile_count):
+        profile = g15profile.G15Profile(device, "bench%d" % i)
+        profile.name = "Benchmark %d" % i
+        profile.window_name = "benchapp-%03d" % i
+        profile.activate_on_focus = True
+        used = set()
+        for j in range(0, macro_count):
+            bank = j % 3 + 1
+            keys = sorted(rnd.sample(g_keys, rnd.randint(1, 2)))
+            if ( bank, tuple(keys) ) in used:
+                continue
+            used.add(( bank, tuple(keys) ))
+            macro = g15profile.G15Macro(profile, bank, g15profile.get_keys_key(keys), g15driver.KEY_STATE_UP)
+            macro.name = "Macro %d" % j
+            macro.type = g15profile.MACRO_SIMPLE
+            macro.macro = "Text %d" % j
+            profile.macros[g15driver.KEY_STATE_UP][bank - 1].append(macro)
+        profile.save()
+        window_names.append("%s - Benchmark Application %d" % ( profile.window_name, i ))
+    return window_names
+
+def time_switches(window_names, switch, prepare = None):
+    """
+    Switch to the profile for each window name in turn, returning the
+    average number of milliseconds a switch took. The prepare function
+    is called before each switch, outside of the timing.
+    """
+    taken = 0.0
+    for window_name in window_names:
+        if prepare is not None:
+            prepare(window_name)
+        started = time.time()
+        switch(window_name)
+        taken += time.time() - started
+    return taken * 1000.0 / len(window_names)
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--model", dest="model", default=g15driver.MODEL_G15_V1,
+        help="Model ID of the device the profiles are for.")
+    parser.add_option("-p", "--profiles", dest="profiles", type="int", default=200,
+        help="Number of profiles.")
+    parser.add_option("-c", "--macros", dest="macros", type="int", default=30,
+        help="Number of macros in each profile.")
+    parser.add_option("-s", "--switches", dest="switches", type="int", default=1000,
+        help="Number of switches to time for the cached cases.")
+    (options, args) = parser.parse_args()
+
+    rnd = random.Random(15)
+    screen = benchutil.BenchScreen(benchutil.BenchDriver(options.model))
+    device = screen.device
+    g15profile.conf_dir = tempfile.mkdtemp(prefix = "gnome15-bench")
+    try:
+        window_names = create_profiles(device, options.profiles, options.macros, rnd)
+        switches = [ rnd.choice(window_names) for i in range(0, options.switches) ]
+        
+        # The active profile is normally kept by the configuration backend
+        active = [ "Default" ]
+        def get_active_profile(device, shared = False):
+            return g15profile.get_profile(device, active[0], shared)
+        g15profile.get_active_profile = get_active_profile
+        key_handler = g15keyboard.G15KeyHandler(screen)
+        
+        def switch(window_name):
+            profile = g15profile.find_profile_for_window(device, window_name)
+            if profile is None:
+                profile = g15profile.get_default_profile(device, shared = True)
+            active[0] = profile.id
+            key_handler._reload_active_macros()
+            
+        def switch_uncached(window_name):
+            profile = None
+            for p in g15profile.get_profiles(device):
+                if p.activate_on_focus and len(p.window_name) > 0 and p.window_name.lower() in window_name.lower():
+                    profile = p
+                    break
+            profile = g15profile.get_profile(device, profile.id)
+            g15keyboard.MacroIndex(device, profile, screen.get_memory_bank())
+            
+        def discard_all(window_name):
+            g15profile.invalidate_profile()
+            key_handler._G15KeyHandler__macro_indexes.clear()
+            
+        def discard_one(window_name):
+            profile_id = "bench%d" % rnd.randint(0, options.profiles - 1)
+            g15profile.invalidate_profile(profile_id)
+            key_handler._profile_changed(profile_id, device.uid)
+            
+        # Parsing every profile is slow, so only time a few of these
+        slow_switches = switches[:max(1, options.switches / 100)]
+        results = [ ( "uncached", time_switches(slow_switches, switch_uncached) ),
+                    ( "cold", time_switches(slow_switches, switch, discard_all) ),
+                    ( "changed", time_switches(slow_switches, switch, discard_one) ) ]
+        time_switches(window_names, switch)
+        results.append(( "warm", time_switches(switches, switch) ))
+        
+        print "%d profiles with up to %d macros each" % ( options.profiles, options.macros )
+        for name, ms in results:
+            print "%-10s %10.3f ms/switch" % ( name, ms )
+    finally:
+        shutil.rmtree(g15profile.conf_dir)
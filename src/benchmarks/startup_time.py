@@ -0,0 +1,144 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the time g15-desktop-service takes to start, from launching the
+process until the first frame has been sent to a device. The service is
+polled over D-Bus for when it registers its bus name, when it has finished
+starting up, and when a screen's frame statistics first count a sent frame.
+The service is stopped again after each run.
+
+This needs a session bus and a connected device, and the service must not
+already be running. With --cold, the plugin manifest is deleted before each
+run, so it has to be generated again.
+"""
+
+import os
+import sys
+import time
+import optparse
+import subprocess
+import benchutil
+
+import dbus
+import gnome15.g15globals as g15globals
+
+BUS_NAME = "org.gnome15.Gnome15"
+SERVICE_NAME = "/org/gnome15/Service"
+SERVICE_IF_NAME = "org.gnome15.Service"
+SCREEN_IF_NAME = "org.gnome15.Screen"
+
+"""
+How often (in seconds) the service is polled while it starts
+"""
+POLL_INTERVAL = 0.01
+
+def frame_sent(bus, service):
+    """
+    Get if any screen of the service has sent a frame to its device.
+    """
+    for screen_path in service.GetScreens(dbus_interface = SERVICE_IF_NAME):
+        screen = bus.get_object(BUS_NAME, screen_path)
+        if screen.GetFrameStatistics(dbus_interface = SCREEN_IF_NAME).get("sent", 0) > 0:
+            return True
+    return False
+
+def measure_startup(bus, script, log_level, timeout):
+    """
+    Start the service and wait for it to send its first frame. Returns a
+    tuple of the seconds taken to register on the bus, to finish starting
+    and to send the first frame. Any of these are None if the service did
+    not get that far before the timeout.
+    """
+    registered = None
+    started = None
+    first_frame = None
+    launched = time.time()
+    process = subprocess.Popen([ sys.executable, script, "-f", "-l", log_level ])
+    try:
+        service = None
+        while first_frame is None and time.time() - launched < timeout and process.poll() is None:
+            try:
+                if service is None:
+                    if bus.name_has_owner(BUS_NAME):
+                        service = bus.get_object(BUS_NAME, SERVICE_NAME)
+                        registered = time.time() - launched
+                else:
+                    if started is None and service.IsStarted(dbus_interface = SERVICE_IF_NAME):
+                        started = time.time() - launched
+                    if frame_sent(bus, service):
+                        first_frame = time.time() - launched
+            except dbus.DBusException:
+                # Objects are still being exported
+                pass
+            time.sleep(POLL_INTERVAL)
+    finally:
+        if process.poll() is None:
+            try:
+                bus.get_object(BUS_NAME, SERVICE_NAME).Stop(dbus_interface = SERVICE_IF_NAME)
+                deadline = time.time() + 30
+                while process.poll() is None and time.time() < deadline:
+                    time.sleep(0.1)
+            except dbus.DBusException:
+                pass
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+    return registered, started, first_frame
+
+def format_time(seconds):
+    return "%10.0f" % ( seconds * 1000.0 ) if seconds is not None else "%10s" % "-"
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-s", "--service", dest="service",
+        default=os.path.join(benchutil.path, "scripts", "g15-desktop-service"),
+        help="Path of the g15-desktop-service script to start.")
+    parser.add_option("-r", "--runs", dest="runs", type="int", default=5,
+        help="Number of times to start the service.")
+    parser.add_option("-c", "--cold", action="store_true", dest="cold",
+        help="Delete the plugin manifest before each run.")
+    parser.add_option("-t", "--timeout", dest="timeout", type="float", default=60.0,
+        help="Number of seconds to wait for the first frame.")
+    parser.add_option("-l", "--log", dest="log_level", metavar="INFO,DEBUG,WARNING,ERROR,CRITICAL",
+        default="warning", help="Log level of the service.")
+    (options, args) = parser.parse_args()
+
+    bus = dbus.SessionBus()
+    if bus.name_has_owner(BUS_NAME):
+        print "The desktop service is already running. Stop it before running this benchmark."
+        sys.exit(1)
+        
+    # The manifest g15pluginmanager keeps in the user's cache directory
+    manifest_file = os.path.join(g15globals.user_cache_dir, "plugins.manifest")
+    
+    print "%-6s %10s %10s %10s" % ( "Run", "D-Bus ms", "Started ms", "Frame ms" )
+    frame_times = []
+    for run in range(0, options.runs):
+        if options.cold and os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        registered, started, first_frame = measure_startup(bus, options.service, options.log_level, options.timeout)
+        print "%-6d %s %s %s" % ( run + 1, format_time(registered), format_time(started), format_time(first_frame) )
+        sys.stdout.flush()
+        if first_frame is None:
+            print "No frame was sent within %.0f seconds. Is a device connected?" % options.timeout
+            sys.exit(1)
+        frame_times.append(first_frame)
+        
+    print "Time to first frame: %.0f ms average, %.0f ms best" % ( sum(frame_times) * 1000.0 / len(frame_times),
+                                                                    min(frame_times) * 1000.0 )
@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the frames per second each bundled theme can be drawn at. Every
+frame changes the value of every property the theme references, cycling
+through a fixed number of states (as a clock or meter would).
+
+"full" processes and rasterises the whole document every frame, as every
+theme did before documents were compiled. "compiled" is the normal drawing
+path, which substitutes only the changed values and reuses cached renders.
+"""
+
+import os
+import sys
+import optparse
+import benchutil
+
+import gnome15.g15driver as g15driver
+import gnome15.g15theme as g15theme
+
+def find_themes(model_id, plugin = None):
+    """
+    Get a list of ( plugin, theme directory, variant ) tuples for every
+    bundled theme that has an SVG for the model (or a default SVG).
+    """
+    themes = []
+    for plugin_id in sorted(os.listdir(benchutil.PLUGINS_DIR)):
+        if plugin is not None and plugin_id != plugin:
+            continue
+        plugin_dir = os.path.join(benchutil.PLUGINS_DIR, plugin_id)
+        if not os.path.isdir(plugin_dir):
+            continue
+        for theme_name in sorted(os.listdir(plugin_dir)):
+            theme_dir = os.path.join(plugin_dir, theme_name)
+            if not os.path.isdir(theme_dir):
+                continue
+            variants = set()
+            for filename in os.listdir(theme_dir):
+                name, ext = os.path.splitext(filename)
+                if ext != ".svg":
+                    continue
+                for base in [ model_id, "default" ]:
+                    if name == base:
+                        variants.add(None)
+                    elif name.startswith(base + "-"):
+                        variants.add(name[len(base) + 1:])
+            for variant in sorted(variants):
+                themes.append(( plugin_id, theme_dir, variant ))
+    return themes
+
+def measure_theme(screen, theme_dir, variant, states, duration, full):
+    theme = g15theme.G15Theme(theme_dir, variant)
+    page = g15theme.G15Page("bench", screen, theme = theme)
+    canvas = benchutil.new_canvas(screen.driver)
+    keys = sorted(theme.document_keys | theme.structural_keys)
+    if full:
+        theme.raster_cache_enabled = False
+    g15theme.clear_raster_caches()
+
+    def draw(frame):
+        properties = {}
+        for i, key in enumerate(keys):
+            properties[key] = str(( frame + i ) % states)
+        if full:
+            theme.mark_dirty()
+        canvas.save()
+        theme.draw(canvas, properties, {})
+        canvas.restore()
+
+    frames, taken = benchutil.measure(draw, duration)
+    return frames / taken, theme.get_render_statistics()
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("-m", "--model", dest="model", default=g15driver.MODEL_G19,
+        help="Model ID whose themes are drawn.")
+    parser.add_option("-p", "--plugin", dest="plugin",
+        help="Only draw the themes of this plugin.")
+    parser.add_option("-s", "--states", dest="states", type="int", default=60,
+        help="Number of different values each property cycles through.")
+    parser.add_option("-d", "--duration", dest="duration", type="float", default=2.0,
+        help="Number of seconds to draw each theme for.")
+    (options, args) = parser.parse_args()
+
+    screen = benchutil.BenchScreen(benchutil.BenchDriver(options.model))
+    print "%-36s %10s %10s %8s  %s" % ( "Theme", "Full fps", "Compiled", "Speedup", "Compiled render statistics" )
+    for plugin_id, theme_dir, variant in find_themes(options.model, options.plugin):
+        name = "%s/%s%s" % ( plugin_id, os.path.basename(theme_dir), "" if variant is None else " (%s)" % variant )
+        try:
+            full_fps, __ = measure_theme(screen, theme_dir, variant, options.states, options.duration, True)
+            compiled_fps, statistics = measure_theme(screen, theme_dir, variant, options.states, options.duration, False)
+        except Exception as e:
+            print "%-36s could not be drawn (%s)" % ( name, str(e) )
+            continue
+        print "%-36s %10.1f %10.1f %7.1fx  %s" % ( name, full_fps, compiled_fps, compiled_fps / full_fps,
+                                                ", ".join([ "%s=%d" % i for i in sorted(statistics.items()) ]))
+        sys.stdout.flush()
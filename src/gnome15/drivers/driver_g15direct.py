@@ -28,6 +28,7 @@ import gnome15.g15globals as g15globals
 import gnome15.util.g15scheduler as g15scheduler
 import gnome15.util.g15uigconf as g15uigconf
 import gnome15.util.g15gconf as g15gconf
+import gnome15.util.g15bitmap as g15bitmap
 import gnome15.g15uinput as g15uinput
 import gnome15.g15exceptions as g15exceptions
 import sys
@@ -35,9 +36,6 @@ import os
 import gconf
 import gtk
 import logging
-from PIL import ImageMath
-from PIL import Image
-import array
 logger = logging.getLogger(__name__)
 load_error = None
 try :
@@ -230,6 +228,7 @@ class Driver(g15driver.AbstractDriver):
         self.conf_client = gconf.client_get_default()
         self.last_keys = None
         self.last_ext_keys = None
+        self.encoder = None
         
         # We can only have one instance of this driver active in a single runtime
         self.allow_multiple = False
@@ -306,50 +305,18 @@ class Driver(g15driver.AbstractDriver):
              
         self.lock.acquire()        
         try :           
-            size = self.get_size()
-            
-            # Paint to 565 image provided into an ARGB image surface for PIL's benefit. PIL doesn't support 565?
-            argb_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size[0], size[1])
-            argb_context = cairo.Context(argb_surface)
-            argb_context.set_source_surface(img)
-            argb_context.paint()
-            
-            # Now convert the ARGB to a PIL image so it can be converted to a 1 bit monochrome image, with all
-            # colours dithered. It would be nice if Cairo could do this :( Any suggestions? 
-            pil_img = Image.frombuffer("RGBA", size, argb_surface.get_data(), "raw", "RGBA", 0, 1)
-            pil_img = ImageMath.eval("convert(pil_img,'1')",pil_img=pil_img)
-            pil_img = ImageMath.eval("convert(pil_img,'P')",pil_img=pil_img)
-            pil_img = pil_img.point(lambda i: i >= 250,'1')
-            
-            invert_control = self.get_control("invert_lcd")
-            if invert_control.value == 0:            
-                pil_img = pil_img.point(lambda i: 1^i)
-    
-            # Convert image buffer to string
-            buf = ""
-            for x in list(pil_img.getdata()): 
-                buf += chr(x)
+            if self.encoder is None:
+                width, height = self.get_size()
+                self.encoder = g15bitmap.MonochromeEncoder(width, height, g15bitmap.MSB_FIRST,
+                                                           buffer_length = len(self.empty_buf))
                 
-            if len(buf) != self.device.lcd_size[0] * self.device.lcd_size[1]:
+            # libg15 expects a row major, MSB first pixmap. It converts this to the LCD format itself
+            invert_control = self.get_control("invert_lcd")
+            buf = self.encoder.encode(img, invert = invert_control.value == 0)
+            
+            if len(buf) != len(self.empty_buf):
                 logger.warning("Invalid buffer size")
             else:
-                # TODO Replace with C routine
-                arrbuf = array.array('B', self.empty_buf)
-                width, height = self.get_size() 
-                max_byte_offset = 0
-                for x in range(0, width):
-                    for y in range(0, height):
-                        pixel_offset = y * width + x;
-                        byte_offset = pixel_offset / 8;
-                        max_byte_offset =  max(max_byte_offset, byte_offset)
-                        bit_offset = 7-(pixel_offset % 8);
-                        val = ord(buf[x+(y*160)])
-                        pv = arrbuf[byte_offset]
-                        if val > 0:
-                            arrbuf[byte_offset] = pv | 1 << bit_offset
-                        else:
-                            arrbuf[byte_offset] = pv &  ~(1 << bit_offset)
-                buf = arrbuf.tostring()
                 try :
                     logger.debug("Writing buffer of %d bytes", len(buf))
                     pylibg15.write_pixmap(buf)
@@ -375,6 +342,7 @@ class Driver(g15driver.AbstractDriver):
         self.empty_buf = ""
         for _ in range(0, 861):
             self.empty_buf += chr(0)
+        self.encoder = None
         
         # TODO Enable UINPUT if multimedia key support is required?
         self.timeout = 10000
@@ -21,14 +21,13 @@ with the keyboard
 import gnome15.g15locale as g15locale
 _ = g15locale.get_translation("gnome15-drivers").ugettext
 
-from cStringIO import StringIO
 from threading import RLock
 import cairo
 import gnome15.g15driver as g15driver
 import gnome15.g15globals as g15globals
 import gnome15.util.g15convert as g15convert
 import gnome15.util.g15uigconf as g15uigconf
-import gnome15.util.g15cairo as g15cairo
+import gnome15.util.g15bitmap as g15bitmap
 import gnome15.g15exceptions as g15exceptions
 import sys
 import os
@@ -36,7 +35,6 @@ import gconf
 import gtk
 import usb
 import logging
-import array
 logger = logging.getLogger(__name__)
 
 # Import from local version of pylibg19 if available
@@ -44,6 +42,7 @@ if g15globals.dev:
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "pylibg19"))
 
 from g19.g19 import G19
+from g19.g19 import FRAME_HEADER
 
 
 
@@ -153,6 +152,7 @@ class Driver(g15driver.AbstractDriver):
         self.device = device
         self.lock = RLock()
         self.connected = False
+        self.encoder = None
         self.conf_client = gconf.client_get_default()
     
     def get_antialias(self):
@@ -203,48 +203,15 @@ class Driver(g15driver.AbstractDriver):
         if not self.is_connected():
             return
                 
-        width = img.get_width()
-        height = img.get_height()
-        
-        # Create a new flipped, rotated image. The G19 expects the image to scan vertically, but
-        # the cairo image surface will be horizontal. Rotating then flipping the image is the
-        # quickest way to convert this. 16 bit color (5-6-5) is also required. Unfortunately this format
-        # was disabled for a long time, as was only re-enabled in version 1.8.6.
+        # The G19 expects the image to scan vertically, but the cairo image surface will be
+        # horizontal, so the encoder transposes it. 16 bit color (5-6-5) is also required.
+        if self.encoder is None:
+            self.encoder = g15bitmap.RGB565Encoder(MAX_X, MAX_Y, transpose = True, header = FRAME_HEADER)
         try:
-            back_surface = cairo.ImageSurface (4, height, width)
-        except Exception as e:
-            logger.debug('Could not create ImageSurface. Trying earlier API.', exc_info = e)
-            # Earlier version of Cairo
-            back_surface = cairo.ImageSurface (cairo.FORMAT_ARGB32, height, width)
-        
-        back_context = cairo.Context (back_surface)        
-        g15cairo.rotate_around_center(back_context, width, height, 270)
-        g15cairo.flip_horizontal(back_context, width, height)
-        back_context.set_source_surface(img, 0, 0)
-        back_context.set_operator (cairo.OPERATOR_SOURCE);
-        back_context.paint()
-        
-        if back_surface.get_format() == cairo.FORMAT_ARGB32:
-            file_str = StringIO()
-            data = back_surface.get_data()
-            for i in range(0, len(data), 4):
-                r = ord(data[i + 2])
-                g = ord(data[i + 1])
-                b = ord(data[i + 0])
-                file_str.write(self._rgb_to_uint16(r, g, b))                
-            buf = array.array('B', file_str.getvalue())   
-        else:   
-            buf = array.array('B', str(back_surface.get_data()))   
-                  
-        expected_size = MAX_X * MAX_Y * ( self.get_bpp() / 8 )
-        if len(buf) != expected_size:
-            logger.warning("Invalid buffer size, expected %d, got %d", expected_size, len(buf))
-        else:
-            try:
-                self.lg19.send_frame(buf)
-            except usb.USBError as e:
-                logger.debug("Failed to send buffer.", exc_info = e)
-                self._on_receive_error(e)
+            self.lg19.send_frame_buffer(self.encoder.encode(img))
+        except usb.USBError as e:
+            logger.debug("Failed to send buffer.", exc_info = e)
+            self._on_receive_error(e)
     
     def process_input(self, event):
         if self.callback == None:
@@ -351,17 +318,3 @@ class Driver(g15driver.AbstractDriver):
         except usb.USBError as e:
             logger.debug('Error updating control.', exc_info = e)
             self._on_receive_error(e)
-            
-    def _rgb_to_uint16(self, r, g, b):
-        rBits = r * 32 / 255
-        gBits = g * 64 / 255
-        bBits = b * 32 / 255
-
-        rBits = rBits if rBits <= 31 else 31
-        gBits = gBits if gBits <= 63 else 63
-        bBits = bBits if bBits <= 31 else 31        
-
-        valueH = (rBits << 3) | (gBits >> 3)
-        valueL = (gBits << 5) | bBits
-
-        return chr(valueL & 0xff) + chr(valueH & 0xff)
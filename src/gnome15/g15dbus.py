@@ -14,6 +14,7 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
  
+import os
 import dbus.service
 import g15globals
 import g15theme
@@ -48,10 +49,13 @@ class AbstractG15DBUSService(dbus.service.Object):
     
     def __init__(self, conn=None, object_path=None, bus_name=None):
         dbus.service.Object.__init__(self, conn, object_path, bus_name)
-        self._reserved_keys = []
+        self._reserved_keys = set()
         
     def action_performed(self, binding):
         self.Action(binding.action)
+        
+    def is_handling_keys(self):
+        return len(self._reserved_keys) > 0
                     
     def handle_key(self, keys, state, post):
         if not post:
@@ -255,6 +259,7 @@ class G15DBUSScreenService(AbstractG15DBUSService):
             dbus_page = self._dbus_pages[page.id]
             if dbus_page in page.key_handlers: 
                 page.key_handlers.remove(dbus_page)
+            self._screen.key_handler.resume_fast_path(dbus_page)
             self.PageDeleting(dbus_page._bus_name, )
         else:
             logger.warning("DBUS Page %s is deleting, but it never existed. Huh? %s",
@@ -340,12 +345,17 @@ class G15DBUSScreenService(AbstractG15DBUSService):
         if key_name in self._reserved_keys:
             raise Exception("Already reserved")
         self._reserved_keys.add(key_name)
+        
+        # Reserved keys must always reach the key handlers
+        self._screen.key_handler.suspend_fast_path(self)
             
     @dbus.service.method(SCREEN_IF_NAME, in_signature='s')
     def UnreserveKey(self, key_name):
         if not key_name in self._reserved_keys:
             raise Exception("Not reserved")
         self._reserved_keys.remove(key_name)
+        if len(self._reserved_keys) == 0:
+            self._screen.key_handler.resume_fast_path(self)
     
     @dbus.service.method(SCREEN_IF_NAME, in_signature='', out_signature='ssss')
     def GetDeviceInformation(self):
@@ -357,6 +367,18 @@ class G15DBUSScreenService(AbstractG15DBUSService):
         driver = self._screen.driver
         return ( driver.get_name(), driver.get_model_name(), driver.get_size()[0], driver.get_size()[1], driver.get_bpp() ) if driver != None else None 
     
+    @dbus.service.method(SCREEN_IF_NAME, in_signature='', out_signature='a{st}')
+    def GetFrameStatistics(self):
+        return self._screen.get_frame_statistics()
+    
+    @dbus.service.method(SCREEN_IF_NAME, in_signature='', out_signature='a{sd}')
+    def GetKeyLatencyStatistics(self):
+        return self._screen.key_handler.get_latency_statistics()
+    
+    @dbus.service.method(SCREEN_IF_NAME, in_signature='', out_signature='a{sd}')
+    def GetPluginActivationTimes(self):
+        return self._screen.plugins.get_activation_times()
+    
     @dbus.service.method(SCREEN_IF_NAME, in_signature='', out_signature='s')
     def GetDeviceUID(self):
         return self._screen.device.uid
@@ -594,6 +616,13 @@ class G15DBUSControlAcquisition(AbstractG15DBUSService):
                 client.acquisitions.remove(self._acquisition)            
         self.remove_from_connection()
 
+"""
+Page methods that may be used in a DrawBatch
+"""
+BATCH_COMMANDS = [ "NewSurface", "Save", "Restore", "DrawSurface", "SetLineWidth", "Line",
+                   "Rectangle", "Circle", "Arc", "Foreground", "SetFont", "Text", "Image",
+                   "ImageData", "ImagePixels", "ImagePixelsFd", "SetThemeProperty", "Redraw" ]
+
 class G15DBUSPageService(AbstractG15DBUSService):
     
     def __init__(self, screen_service, page, sequence_number):
@@ -637,6 +666,10 @@ class G15DBUSPageService(AbstractG15DBUSService):
     def IsVisible(self):
         return self._page.is_visible()
             
+    @dbus.service.method(PAGE_IF_NAME, in_signature='', out_signature='a{st}')
+    def GetThemeStatistics(self):
+        return self._page.theme.get_render_statistics() if self._page.theme is not None else {}
+            
     @dbus.service.method(PAGE_IF_NAME, in_signature='', out_signature='b')
     def IsReceiveActions(self):
         return self in self._screen.key_handler.action_listeners
@@ -717,6 +750,54 @@ class G15DBUSPageService(AbstractG15DBUSService):
         img_surface = g15cairo.load_surface_from_file(file_str, None)
         file_str.close()
         self._page.image(img_surface, x, y)
+        
+    @dbus.service.method(PAGE_IF_NAME, in_signature='siiiidd')
+    def ImagePixels(self, path, width, height, stride, offset, x, y):
+        """
+        Paint raw ARGB32 pixels from a file the client has written, usually in 
+        $XDG_RUNTIME_DIR or /dev/shm. Only the path is sent over the bus.
+        """
+        # Non-blocking, so a FIFO cannot hold up the bus (it is then rejected as not a regular file)
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            img_surface = g15cairo.load_surface_from_pixels(fd, width, height, stride, offset)
+        finally:
+            os.close(fd)
+        self._page.image(img_surface, x, y)
+        
+    @dbus.service.method(PAGE_IF_NAME, in_signature='hiiiidd')
+    def ImagePixelsFd(self, fd, width, height, stride, offset, x, y):
+        """
+        Paint raw ARGB32 pixels from a file descriptor passed by the client, 
+        usually a memfd. 
+        """
+        fd = fd.take() if hasattr(fd, "take") else int(fd)
+        try:
+            img_surface = g15cairo.load_surface_from_pixels(fd, width, height, stride, offset)
+        finally:
+            os.close(fd)
+        self._page.image(img_surface, x, y)
+        
+    @dbus.service.method(PAGE_IF_NAME, in_signature='a(sv)', out_signature='u')
+    def DrawBatch(self, commands):
+        """
+        Run a list of drawing commands in a single call. Each command is the 
+        name of one of the methods in BATCH_COMMANDS and its arguments (a 
+        struct, an empty array for methods without arguments, or a single
+        value for methods with one argument). Returns the number of commands 
+        run.
+        """
+        for i, ( name, args ) in enumerate(commands):
+            if not name in BATCH_COMMANDS:
+                raise Exception("Command %d (%s) may not be used in a batch" % ( i, name ))
+            if not isinstance(args, tuple) and not isinstance(args, list):
+                args = ( args, )
+            try:
+                getattr(self, name)(*args)
+            except Exception as e:
+                logger.debug("Batch command %d (%s) failed.", i, name, exc_info = e)
+                raise Exception("Command %d (%s) failed. %s" % ( i, name, str(e) ))
+        return len(commands)
     
     @dbus.service.method(PAGE_IF_NAME, in_signature='')
     def CancelTimer(self):
@@ -763,12 +844,17 @@ class G15DBUSPageService(AbstractG15DBUSService):
         if key_name in self._reserved_keys:
             raise Exception("Already reserved")
         self._reserved_keys.add(key_name)
+        
+        # Reserved keys must always reach the key handlers
+        self._screen.key_handler.suspend_fast_path(self)
             
     @dbus.service.method(PAGE_IF_NAME, in_signature='s')
     def UnreserveKey(self, key_name):
         if not key_name in self._reserved_keys:
             raise Exception("Not reserved")
         self._reserved_keys.remove(key_name)
+        if len(self._reserved_keys) == 0:
+            self._screen.key_handler.resume_fast_path(self)
         
     """
     Callbacks
@@ -937,6 +1023,19 @@ class G15DBUSService(AbstractG15DBUSService):
     def GetServerInformation(self):
         return ( g15globals.name, "Gnome15 Project", g15globals.version, "2.1" )
     
+    @dbus.service.method(IF_NAME, in_signature='', out_signature='a{sa{sd}}')
+    def GetQueueStatistics(self):
+        return g15scheduler.get_statistics()
+    
+    @dbus.service.method(IF_NAME, in_signature='', out_signature='a{sa{st}}')
+    def GetRasterCacheStatistics(self):
+        return g15theme.get_raster_cache_statistics()
+    
+    @dbus.service.method(IF_NAME, in_signature='', out_signature='a{sd}')
+    def GetPluginActivationTimes(self):
+        plugins = self._service.global_plugins
+        return plugins.get_activation_times() if plugins is not None else {}
+    
     @dbus.service.method(IF_NAME, in_signature='', out_signature='')
     def Stop(self):
         g15scheduler.queue("serviceQueue", "dbusShutdown", 0, self._service.shutdown)
@@ -681,6 +681,20 @@ class AbstractDriver(object):
         """
         raise NotImplementedError( "Not implemented" )
     
+    def paint_region(self, image, rects):
+        """
+        Repaint only part of the screen. The image is still the complete frame,
+        rects is a list of pixel aligned (x, y, width, height) tuples that are
+        the only areas that have changed since the last paint. Drivers that can
+        write part of the display should override this, the default repaints
+        everything.
+        
+        Keyword arguments:
+        image        -- complete frame
+        rects        -- list of changed areas
+        """
+        self.paint(image)
+    
     
     def update_control(self, control):
         """
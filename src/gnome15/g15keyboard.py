@@ -19,7 +19,9 @@ This module deals with handling raw key presses from the driver, and turning the
 into Macros or actions. The different types of macro are handled accordingly, as well
 as the repetition functions.
 
-All key events are handled on a queue (one per instance of a key handler). 
+All key events are handled on a queue (one per instance of a key handler),
+except for keys that are simply mapped to a uinput key or button. These are
+emitted straight away on the thread the driver received the key on.
 
 """
 
@@ -32,6 +34,8 @@ import g15driver
 import g15actions
 import g15uinput
 import g15screen
+import time
+from collections import deque
 
 import logging
 logger = logging.getLogger(__name__)
@@ -62,6 +66,149 @@ class KeyState():
     def __repr__(self):
         return "%s = %s [consumed = %s]" % (self.key, g15profile.to_key_state_name(self.state_id), str(self.consumed) )      
     
+class LatencyRecorder():
+    """
+    Keeps the most recent latencies of a kind of key event, so that percentiles
+    may be reported
+    """
+    def __init__(self, size = 1000):
+        self.samples = deque(maxlen = size)
+        self.count = 0
+        
+    def record(self, received):
+        """
+        Record the time taken to handle an event.
+        
+        Keyword arguments:
+        received        -- time the event was received
+        """
+        self.samples.append(time.time() - received)
+        self.count += 1
+        
+    def get_statistics(self, prefix):
+        """
+        Get a dictionary of the number of events and the 50th, 90th and 99th
+        percentile and maximum latencies (in seconds) of the recent events.
+        
+        Keyword arguments:
+        prefix        -- prefix for statistic names
+        """
+        samples = sorted(self.samples)
+        stats = { "%s_count" % prefix : float(self.count) }
+        for percentile in [ 50, 90, 99 ]:
+            stats["%s_p%d" % ( prefix, percentile )] = samples[len(samples) * percentile / 100] if len(samples) > 0 else 0.0
+        stats["%s_max" % prefix] = samples[-1] if len(samples) > 0 else 0.0
+        return stats
+    
+class MacroIndex():
+    """
+    The macros of a profile (and the profiles it inherits from) for a single
+    memory bank, indexed by key. When a key changes state, only the macros
+    that use that key need to be checked. Macros with the same key combination
+    as one already found higher up the profile chain are skipped, and the
+    macros are returned in the order they were found.
+    """
+    def __init__(self, device, profile, bank):
+        """
+        Constructor
+        
+        Keyword arguments:
+        device        -- device
+        profile       -- active profile (or None)
+        bank          -- memory bank
+        """
+        self.bank = bank
+        self.profile_ids = set()
+        self.uinput_macros = {}
+        self.normal_macros = {}
+        self.normal_held_macros = {}
+        self.order = {}
+        self.passthrough_macros = {}
+        if profile is not None:
+            self._build(device, profile, set(), set(), set())
+            self._build_passthrough()
+        
+    def get_uinput_macros(self, keys):
+        return self._get_macros(self.uinput_macros, keys)
+        
+    def get_normal_macros(self, keys):
+        return self._get_macros(self.normal_macros, keys)
+        
+    def get_normal_held_macros(self, keys):
+        return self._get_macros(self.normal_held_macros, keys)
+    
+    """
+    Private
+    """
+    
+    def _build_passthrough(self):
+        """
+        Find the keys that do nothing but press and release a single uinput key,
+        button or joystick direction, with the default repeat. 
+        """
+        for k, macros in self.uinput_macros.items():
+            if len(macros) == 1 and not k in self.normal_macros and not k in self.normal_held_macros:
+                m = macros[0]
+                if len(m.keys) == 1 and m.repeat_mode == g15profile.REPEAT_WHILE_HELD and m.repeat_delay == -1:
+                    self.passthrough_macros[k] = m
+    
+    def _get_macros(self, index, keys):
+        if len(keys) == 1:
+            return index.get(keys[0], [])
+        found = {}
+        for k in keys:
+            for m in index.get(k, []):
+                found[id(m)] = m
+        return sorted(found.values(), key = lambda m: self.order[id(m)])
+        
+    def _add(self, index, macro):
+        self.order[id(macro)] = len(self.order)
+        for k in macro.keys:
+            if not k in index:
+                index[k] = []
+            index[k].append(macro)
+        
+    def _build(self, device, profile, macro_keys, held_macro_keys, down_macro_keys):
+        while profile is not None:
+            self.profile_ids.add(profile.id)
+            for m in profile.macros[g15driver.KEY_STATE_UP][self.bank - 1]:
+                if not m.key_list_key in macro_keys:
+                    self._add(self.uinput_macros if m.is_uinput() else self.normal_macros, m)
+                    macro_keys.add(m.key_list_key)
+                    
+            for m in profile.macros[g15driver.KEY_STATE_DOWN][self.bank - 1]:
+                if not m.key_list_key in down_macro_keys:
+                    self._add(self.uinput_macros if m.is_uinput() else self.normal_macros, m)
+                    down_macro_keys.add(m.key_list_key)
+                    
+            for m in profile.macros[g15driver.KEY_STATE_HELD][self.bank - 1]:
+                if not m.key_list_key in held_macro_keys:
+                    if not m.is_uinput():
+                        self._add(self.normal_held_macros, m)
+                    held_macro_keys.add(m.key_list_key)
+            
+            if profile.base_profile is None or profile.base_profile in self.profile_ids:
+                break
+            
+            # Remember the base profile even if it does not exist yet, so the index is rebuilt if it is created
+            self.profile_ids.add(profile.base_profile)
+            profile = g15profile.get_profile(device, profile.base_profile, shared = True)
+    
+def is_handling_keys(key_handlers):
+    """
+    Get if any of a list of legacy key handlers (objects with a handle_key()
+    function) may currently want to see, or claim, key events. Handlers may 
+    provide is_handling_keys() to say when they do, those that do not are 
+    assumed to always want keys.
+    
+    Keyword arguments:
+    key_handlers    --    list of key handlers
+    """
+    for handler in list(key_handlers):
+        if not hasattr(handler, "is_handling_keys") or handler.is_handling_keys():
+            return True
+    return False
+
 class G15KeyHandler():
     """
     Main class for handling key events. There should be one instance of this
@@ -88,9 +235,16 @@ class G15KeyHandler():
         self.__conf_client = self.__screen.conf_client
         self.__repeat_macros = []
         self.__macro_repeat_timer = None
-        self.__uinput_macros = []
-        self.__normal_macros = []
-        self.__normal_held_macros = []
+        self.__macro_index = MacroIndex(screen.device, None, 1)
+        self.__macro_indexes = {}
+        self.__action_keys = None
+        self.__action_count = 0
+        self.__action_index = {}
+        self.__fast_keys = None
+        self.__fast_keys_down = {}
+        self.__fast_path_suspended = set()
+        self.__fast_latency = LatencyRecorder()
+        self.__queued_latency = LatencyRecorder()
         self.__notify_handles = []
         self.__key_states = {}
         
@@ -135,7 +289,44 @@ class G15KeyHandler():
         keys            --    list of keys to process
         state_id           -- key state ID (g15driver.KEY_STATE_UP, _DOWN and _HELD)
         """
-        g15scheduler.execute(self.queue_name, "KeyReceived", self._do_key_received, keys, state_id)
+        received = time.time()
+        keys = self._handle_fast_keys(keys, state_id)
+        if len(keys) == 0:
+            self.__fast_latency.record(received)
+        else:
+            g15scheduler.execute(self.queue_name, "KeyReceived", self._do_queued_key_received, keys, state_id, received)
+            
+    def suspend_fast_path(self, owner):
+        """
+        Stop keys that are mapped to uinput from bypassing the queue, so that
+        all key events go to the key handlers first. This should be used by
+        anything that needs to see or sink every key press, but is not a key 
+        handler that can say so itself (see is_handling_keys()).
+        
+        Keyword arguments:
+        owner        -- object suspending the fast path
+        """
+        self.__fast_path_suspended.add(owner)
+        
+    def resume_fast_path(self, owner):
+        """
+        Allow the fast path again once no other owner has it suspended.
+        
+        Keyword arguments:
+        owner        -- object that suspended the fast path
+        """
+        self.__fast_path_suspended.discard(owner)
+        
+    def get_latency_statistics(self):
+        """
+        Get a dictionary of the time (in seconds) between keys being received
+        from the driver and being handled. "fast_" statistics are for the keys
+        emitted directly to uinput, "queued_" statistics for all other keys
+        (these do not include the screen redraw that follows).
+        """
+        stats = self.__fast_latency.get_statistics("fast")
+        stats.update(self.__queued_latency.get_statistics("queued"))
+        return stats
             
     def memory_bank_changed(self, bank):
         self._reload_active_macros()
@@ -149,6 +340,10 @@ class G15KeyHandler():
         return 1
 
     def _profile_changed(self, profile_id, device_uid):
+        # Only the indexes that include the changed profile need rebuilding
+        for index_key, index in self.__macro_indexes.items():
+            if profile_id in index.profile_ids:
+                del self.__macro_indexes[index_key]
         self._reload_active_macros()
     
     """
@@ -156,10 +351,83 @@ class G15KeyHandler():
     """
         
     def _reload_active_macros(self):
-        self.__normal_held_macros = []
-        self.__normal_macros = []
-        self.__uinput_macros = []
-        self._build_macros()
+        """
+        Select the macro index for the active profile and memory bank, building
+        it if there is not one already.
+        """
+        profile = g15profile.get_active_profile(self.__screen.device, shared = True)
+        bank = self.__screen.get_memory_bank()
+        if profile is None:
+            self.__macro_index = MacroIndex(self.__screen.device, None, bank)
+            return
+        index_key = ( profile.id, bank )
+        if not index_key in self.__macro_indexes:
+            self.__macro_indexes[index_key] = MacroIndex(self.__screen.device, profile, bank)
+        self.__macro_index = self.__macro_indexes[index_key]
+        
+    def _handle_fast_keys(self, keys, state_id):
+        """
+        Emit the uinput events for keys that are just mapped to uinput. This
+        is called on the driver's thread, so only handles a key press if every
+        key is such a key, none of them already have a state on the queue and
+        no key handler wants to see keys. The held and released events of a 
+        press handled here are always handled here as well. Returns the keys 
+        that still need to be handled on the queue.
+        
+        Keyword arguments:
+        keys        --    list of keys
+        state_id    --    key state (g15driver.KEY_STATE_UP, _DOWN and _HELD)
+        """
+        fast_keys_down = self.__fast_keys_down
+        if state_id != g15driver.KEY_STATE_DOWN and len(fast_keys_down) > 0:
+            # Keys pressed on the fast path are held and released on it too, so
+            # no handler ever sees only part of a key press 
+            down = [ key for key in keys if key in fast_keys_down ]
+            if len(down) > 0:
+                if state_id == g15driver.KEY_STATE_UP:
+                    for key in down:
+                        macro = fast_keys_down.pop(key)
+                        g15uinput.emit(macro.type, macro.get_uinput_code(), 0)
+                # With the default repeat the OS repeats held keys itself
+                return [ key for key in keys if not key in down ]
+            
+        if state_id != g15driver.KEY_STATE_DOWN or len(self.__fast_path_suspended) > 0 or \
+                is_handling_keys(self.key_handlers):
+            return keys
+        fast_keys = self._get_fast_keys()
+        key_states = self.__key_states
+        macros = []
+        for key in keys:
+            if not key in fast_keys or key in key_states:
+                return keys
+            macros.append(fast_keys[key])
+        for key, macro in zip(keys, macros):
+            fast_keys_down[key] = macro
+            g15uinput.emit(macro.type, macro.get_uinput_code(), 1)
+        return []
+    
+    def _get_fast_keys(self):
+        """
+        Get the macros that may be emitted directly, keyed by key. Keys that
+        are also bound to actions are left out.
+        """
+        macro_index = self.__macro_index
+        action_index = self._get_action_index()
+        fast_keys = self.__fast_keys
+        if fast_keys is None or fast_keys[0] is not macro_index or fast_keys[1] is not action_index:
+            passthrough = {}
+            for k, m in macro_index.passthrough_macros.items():
+                if not k in action_index:
+                    passthrough[k] = m
+            fast_keys = ( macro_index, action_index, passthrough )
+            self.__fast_keys = fast_keys
+        return fast_keys[2]
+        
+    def _do_queued_key_received(self, keys, state_id, received):
+        try:
+            self._do_key_received(keys, state_id)
+        finally:
+            self.__queued_latency.record(received)
         
     def _do_key_received(self, keys, state_id):
         """
@@ -197,17 +465,17 @@ class G15KeyHandler():
                     a press of the Macro key equals a "press" of the virtual key,
                     a release of the Macro key equals a "release" of the virtual key etc.  
                     """
-                    self._handle_uinput_macros()
+                    self._handle_uinput_macros([ key ])
                     
                     """
                     Now the ordinary macros, processed on key_up
                     """
-                    self._handle_normal_macros()
+                    self._handle_normal_macros([ key ])
                     
                     """
                     Now the actions
                     """
-                    self._handle_actions()
+                    self._handle_actions([ key ])
                 
             """
             Now do the legacy 'post' handling.
@@ -230,16 +498,18 @@ class G15KeyHandler():
             """
             self.__screen.redraw()
             
-    def _handle_actions(self):
+    def _handle_actions(self, keys):
         """
         This handles the default action bindings. The actions may have
         already re-mapped as a macro, in which case they will be ignored 
         here.
+        
+        Keyword arguments:
+        keys        -- keys that have changed state
         """
-        action_keys = self.__screen.driver.get_action_keys()
-        if action_keys:
-            for action in action_keys:
-                binding = action_keys[action]
+        action_index = self._get_action_index()
+        for key in keys:
+            for binding in action_index.get(key, []):
                 f = 0
                 for k in binding.keys:
                     if k in self.__key_states and \
@@ -251,12 +521,36 @@ class G15KeyHandler():
                     for k in binding.keys:
                         self.__key_states[k].consume_until_release = True
         
-    def _handle_normal_macros(self):
+    def _get_action_index(self):
+        """
+        Get the driver's action bindings indexed by key. 
+        """
+        driver = self.__screen.driver
+        action_keys = driver.get_action_keys() if driver is not None else None
+        if action_keys is not self.__action_keys or len(action_keys) != self.__action_count:
+            action_index = {}
+            if action_keys:
+                for action in action_keys:
+                    binding = action_keys[action]
+                    for k in binding.keys:
+                        if not k in action_index:
+                            action_index[k] = []
+                        action_index[k].append(binding)
+            self.__action_index = action_index
+            self.__action_keys = action_keys
+            self.__action_count = len(action_keys) if action_keys else 0
+        return self.__action_index
+        
+    def _handle_normal_macros(self, keys):
         """
         First check for any KEY_STATE_HELD macros. We do these first so KEY_STATE_UP
         macros don't consume the key states
+        
+        Keyword arguments:
+        keys        -- keys that have changed state
         """        
-        for m in self.__normal_held_macros:
+        macro_index = self.__macro_index
+        for m in macro_index.get_normal_held_macros(keys):
             held = []
             for k in m.keys:
                 if k in self.__key_states:
@@ -272,7 +566,7 @@ class G15KeyHandler():
         Search for all the non-uinput macros that would be activated by the
         current key state. In this case, KEY_STATE_UP macros are looked for
         """
-        for m in self.__normal_macros:
+        for m in macro_index.get_normal_macros(keys):
             up = []
             held = []
             down = []
@@ -294,13 +588,18 @@ class G15KeyHandler():
                 self._handle_macro(m, g15driver.KEY_STATE_HELD, held)
                 
             
-    def _handle_uinput_macros(self):
+    def _handle_uinput_macros(self, keys = None):
         """
         Search for all the uinput macros that would be activated by the
         current key state, and emit events of the same type.
+        
+        Keyword arguments:
+        keys        -- keys that have changed state (None for all keys that have a state)
         """
+        if keys is None:
+            keys = self.__key_states.keys()
         uinput_repeat = False
-        for m in self.__uinput_macros:
+        for m in self.__macro_index.get_uinput_macros(keys):
             down = []
             up = []
             held = []
@@ -415,44 +714,6 @@ class G15KeyHandler():
                 self._get_all_macros(profile, macro_list, macro_keys, mapped_to_key, state)
         return macro_list
     
-    def _build_macros(self, profile = None, macro_keys = None, held_macro_keys = None, down_macro_keys = None):
-        if profile is None:
-            profile = g15profile.get_active_profile(self.__screen.device)
-        if macro_keys is None:
-            macro_keys = []
-        if held_macro_keys is None:
-            held_macro_keys = []
-        if down_macro_keys is None:
-            down_macro_keys = []
-            
-        bank = self.__screen.get_memory_bank()
-        for m in profile.macros[g15driver.KEY_STATE_UP][bank - 1]:
-            if not m.key_list_key in macro_keys:
-                if m.is_uinput():
-                    self.__uinput_macros.append(m)
-                else:
-                    self.__normal_macros.append(m)
-                macro_keys.append(m.key_list_key)
-                
-        for m in profile.macros[g15driver.KEY_STATE_DOWN][bank - 1]:
-            if not m.key_list_key in down_macro_keys:
-                if m.is_uinput():
-                    self.__uinput_macros.append(m)
-                else:
-                    self.__normal_macros.append(m)
-                down_macro_keys.append(m.key_list_key)
-                
-        for m in profile.macros[g15driver.KEY_STATE_HELD][bank - 1]:
-            if not m.key_list_key in held_macro_keys:
-                if not m.is_uinput():
-                    self.__normal_held_macros.append(m)
-                held_macro_keys.append(m.key_list_key)
-                
-        if profile.base_profile is not None:
-            profile = g15profile.get_profile(self.__screen.device, profile.base_profile)
-            if profile is not None:
-                self._build_macros(profile, macro_keys, held_macro_keys, down_macro_keys)
-                
     def _check_key_state(self, new_state_id, key_state):
         """
         Sanity check
@@ -495,7 +756,7 @@ class G15KeyHandler():
             self.__macro_repeat_timer = g15scheduler.queue(self.queue_name, "MacroRepeat", macro.repeat_delay, self._repeat_uinput, self._reload_macro_instance(macro), uc, uinput_repeat)
             
     def _reload_macro_instance(self, macro):
-        p = g15profile.get_profile(macro.profile.device, macro.profile.id)
+        p = g15profile.get_profile(macro.profile.device, macro.profile.id, shared = True)
         if p:
             return p.get_macro(macro.activate_on, macro.memory, macro.keys)
         logger.warning("Could not reload macro %s, using old instance.", macro.name)
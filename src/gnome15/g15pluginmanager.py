@@ -41,9 +41,12 @@ Plugins are looked for in a number of locations.
                         
 The lifecycle of all plugins consists of 5 stages. 
 
-1. Loading - When the python module is loaded. This happens to all plugins,
-regardless of whether they are enabled or not. Any plugins that fail this
-stage will not be visible.
+1. Loading - When the python module is loaded. The descriptive attributes
+of every plugin (name, supported models, actions etc) are kept in a manifest
+in the user's cache directory, so a plugin is only imported when it is first
+needed (e.g. when it is enabled for a device, or to show its preferences), or
+when it is new or has changed since the manifest was written. Any plugins that
+fail to import when building the manifest will not be visible.
 
 2. Initialise - This is when the plugin instance is created. All enabled
 plugins will go through this stage *once*. If a plugin is de-activated, and
@@ -52,6 +55,9 @@ attached to is completely stopped (not necessarily because of shutdown).
 
 3. Activation - Occurs during start-up of all enabled plugins. If a plugin is
 de-activated, and then re-activated. The activate() function is called again.
+During start-up, plugins are activated concurrently by a small pool of worker 
+threads, except for those that set needs_gobject_thread, which are activated
+on the GObject thread. The time each plugin took is recorded.
 
 4. De-activation - Occurs when the plugin is de-activated for some reason. 
 This may be because the user disabled it, or if the device is attached to is
@@ -64,9 +70,15 @@ or if Gnome15 itself is closing down.
  
 import os.path
 import sys
+import imp
+import time
+import cPickle
 import g15globals
 import g15driver
 import g15actions
+import g15locale
+import util.g15os as g15os
+import util.g15scheduler as g15scheduler
 import gconf
 import threading
 
@@ -81,6 +93,32 @@ This list may be added to dynamically to add new plugin locations
 """
 extra_plugin_dirs = []
 
+"""
+Module attributes that describe a plugin and are kept in the manifest (as 
+are any actions_<model> attributes)
+"""
+MANIFEST_ATTRIBUTES = [ "id", "name", "description", "author", "copyright", "site",
+                        "has_preferences", "default_enabled", "supported_models",
+                        "unsupported_models", "needs_network", "global_plugin",
+                        "passive", "single_instance", "needs_gobject_thread", 
+                        "activate_after", "actions" ]
+
+"""
+Increase when the format of the manifest changes
+"""
+MANIFEST_VERSION = 3
+
+"""
+Maximum number of plugins that are activated at the same time
+"""
+ACTIVATION_WORKERS = 4
+
+"""
+Number of seconds a plugin may take to activate before start-up stops waiting
+for it. The plugin carries on activating in the background.
+"""
+ACTIVATION_TIMEOUT = 30.0
+
 # Plugin manager states
 UNINITIALISED = 0
 STARTING = 1
@@ -193,6 +231,27 @@ def is_passive_plugin(plugin_module):
     """
     return getattr(plugin_module, 'passive', False)
  
+def is_needs_gobject_thread(plugin_module):
+    """
+    Get if the provided plugin_module instance must be activated on the
+    GObject thread rather than concurrently with other plugins.
+    
+    Keyword arguments:
+    plugin_module -- plugin module instance
+    """
+    return getattr(plugin_module, 'needs_gobject_thread', False)
+ 
+def get_activate_after(plugin_module):
+    """
+    Get the IDs of the plugins that must have finished activating (or timed
+    out) before the provided plugin_module instance is activated. Plugins that
+    are not being activated at the same time are ignored.
+    
+    Keyword arguments:
+    plugin_module -- plugin module instance
+    """
+    return getattr(plugin_module, 'activate_after', [])
+ 
 def get_actions(plugin_module, device):
     """
     Get a dictionary of all the "Actions" this plugin uses. The key is
@@ -215,44 +274,209 @@ def get_actions(plugin_module, device):
 
 
 
-"""
-Loads the python modules for all plugins for all known locations. This is done
-in two phases.
+class PluginModule(object):
+    """
+    Stands in for the python module of a plugin. The attributes that describe
+    the plugin come from the manifest, and the module is imported the first
+    time anything else (such as create()) is used.
+    """
+    
+    def __init__(self, plugin_dir, module_name, metadata, unstored = [], module = None):
+        """
+        Constructor
+        
+        Keyword arguments:
+        plugin_dir    -- directory of the plugin
+        module_name   -- name of the main module
+        metadata      -- dictionary of the manifest attributes the module has
+        unstored      -- names of manifest attributes that could not be stored
+        module        -- the module if it has already been imported
+        """
+        self.__dict__.update(metadata)
+        self.__file__ = os.path.join(plugin_dir, "%s.py" % module_name)
+        self.__name__ = module_name
+        self._plugin_dir = plugin_dir
+        self._module_name = module_name
+        self._unstored = unstored
+        self._module = module
+        
+    def is_imported(self):
+        """
+        Get if the plugin's module has been imported yet.
+        """
+        return self._module is not None
+    
+    def get_module(self):
+        """
+        Get the plugin's module, importing it if required.
+        """
+        if self._module is None:
+            _import_lock.acquire()
+            try:
+                if self._module is None:
+                    logger.info("Importing plugin module %s", self._module_name)
+                    self._module = __import__(self._module_name)
+            finally:
+                _import_lock.release()
+        return self._module
+    
+    def __getattr__(self, name):
+        if ( name in MANIFEST_ATTRIBUTES or name.startswith("actions_") ) and not name in self._unstored:
+            # Described by the manifest, so the module does not have it
+            raise AttributeError(name)
+        if name.startswith("__") and name.endswith("__"):
+            # Do not import just because something is inspecting this object
+            raise AttributeError(name)
+        return getattr(self.get_module(), name)
+    
+    def __repr__(self):
+        return "<plugin %s from %s>" % ( self._module_name, self._plugin_dir )
 
-Firstly, the paths of all plugins are added to the python search path.
+class PluginImporter(object):
+    """
+    Finds the modules and packages that are in plugin directories, so those
+    directories do not need to be added to sys.path. Plugins may import their
+    own modules and those of other plugins by name as before, while every
+    other import is unaffected.
+    """
+    
+    def __init__(self):
+        self.locations = {}
+        
+    def add_directory(self, plugin_dir):
+        """
+        Make the modules in a directory importable. The first directory added
+        that contains a module name is the one it will be imported from.
+        
+        Keyword arguments:
+        plugin_dir    -- directory
+        """
+        for name in os.listdir(plugin_dir):
+            path = os.path.join(plugin_dir, name)
+            if name.endswith(".py"):
+                self.locations.setdefault(name[:-3], plugin_dir)
+            elif name.endswith(".so") and not "." in name[:-3]:
+                self.locations.setdefault(name[:-3], plugin_dir)
+            elif os.path.exists(os.path.join(path, "__init__.py")):
+                self.locations.setdefault(name, plugin_dir)
+        
+    def find_module(self, fullname, path = None):
+        if path is None and fullname in self.locations:
+            return self
+        
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        fileobj, pathname, description = imp.find_module(fullname, [ self.locations[fullname] ])
+        try:
+            return imp.load_module(fullname, fileobj, pathname, description)
+        finally:
+            if fileobj is not None:
+                fileobj.close()
 
-Secondly, all of these directories are scanned for python files with the same
-name as the directory they are in. Each one of these is the main plugin module.
+def _get_manifest_file():
+    return os.path.join(g15globals.user_cache_dir, "plugins.manifest")
 
-TODO - These should really be using __init__.py
-"""
-all_plugin_directories = get_extra_plugin_dirs() + \
-                         list_plugin_dirs(os.path.expanduser("~/.gnome15/plugins")) + \
-                         list_plugin_dirs(os.path.join(g15globals.user_config_dir, "plugins")) + \
-                         list_plugin_dirs(os.path.join(g15globals.user_data_dir, "plugins")) + \
-                         list_plugin_dirs(g15globals.plugin_dir)
-            
-# Phase 1
-for plugindir in all_plugin_directories:
-    if not plugindir in sys.path:
-        sys.path.insert(0, plugindir)
-       
-# Phase 2
-for plugindir in all_plugin_directories: 
-    plugin_name = os.path.basename(plugindir)
-    pluginfiles = [fname[:-3] for fname in os.listdir(plugindir) if fname == plugin_name + ".py"]
-    if not plugindir in sys.path:
-        sys.path.insert(0, plugindir)
-    try :
-        for mod in ([__import__(fname) for fname in pluginfiles]):
+def _get_plugin_mtime(plugin_dir, module_file):
+    return max(os.path.getmtime(plugin_dir), os.path.getmtime(module_file))
+
+def _get_metadata(module):
+    metadata = {}
+    unstored = []
+    for name in dir(module):
+        if name in MANIFEST_ATTRIBUTES or name.startswith("actions_"):
+            value = getattr(module, name)
+            try:
+                cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+                metadata[name] = value
+            except Exception as e:
+                logger.debug("Could not store %s of %s in the manifest", name, module.__name__, exc_info = e)
+                unstored.append(name)
+    return metadata, unstored
+
+def _load_manifest():
+    try:
+        manifest_file = open(_get_manifest_file(), "rb")
+        try:
+            manifest = cPickle.load(manifest_file)
+        finally:
+            manifest_file.close()
+        if manifest.get("version") == MANIFEST_VERSION and manifest.get("languages") == g15locale.languages:
+            return manifest["plugins"]
+    except Exception as e:
+        logger.debug("No usable plugin manifest, all plugins will be imported", exc_info = e)
+    return {}
+
+def _save_manifest(plugins):
+    # Written to a temporary file first as other processes may be reading it
+    try:
+        g15os.mkdir_p(g15globals.user_cache_dir)
+        manifest_file_name = _get_manifest_file()
+        temp_file_name = "%s.%d" % ( manifest_file_name, os.getpid() )
+        manifest_file = open(temp_file_name, "wb")
+        try:
+            cPickle.dump({ "version" : MANIFEST_VERSION, "languages" : g15locale.languages, "plugins" : plugins }, 
+                         manifest_file, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            manifest_file.close()
+        os.rename(temp_file_name, manifest_file_name)
+    except Exception as e:
+        logger.warning("Could not save plugin manifest", exc_info = e)
+
+def _load_plugins():
+    """
+    Loads the plugins for all known locations. Each directory contains a python
+    file with the same name as the directory, this is the main plugin module.
+    Plugins that are in the manifest and have not changed since are not imported.
+    
+    TODO - These should really be using __init__.py
+    """
+    started = time.time()
+    imported = 0
+    manifest = _load_manifest()
+    new_manifest = {}
+    for plugindir in all_plugin_directories:
+        plugin_importer.add_directory(plugindir)
+    for plugindir in all_plugin_directories: 
+        plugin_name = os.path.basename(plugindir)
+        module_file = os.path.join(plugindir, plugin_name + ".py")
+        if not os.path.exists(module_file):
+            continue
+        try :
+            mtime = _get_plugin_mtime(plugindir, module_file)
+            entry = manifest.get(plugindir)
+            if entry is not None and entry["mtime"] == mtime and entry["module"] == plugin_name:
+                mod = PluginModule(plugindir, plugin_name, entry["metadata"], entry["unstored"])
+            else:
+                module = __import__(plugin_name)
+                imported += 1
+                metadata, unstored = _get_metadata(module)
+                entry = { "mtime" : mtime, "module" : plugin_name, "metadata" : metadata, "unstored" : unstored }
+                mod = PluginModule(plugindir, plugin_name, metadata, unstored, module)
+            new_manifest[plugindir] = entry
             imported_plugins.append(mod)
             # TODO - we need to be registering actions for a particular device
             actions = get_actions(mod, None)
             for a in actions:
                 if not a in g15actions.actions:
                     g15actions.actions.append(a)
-    except Exception as e:
-        logger.error("Failed to load plugin module %s.", plugindir, exc_info = e)
+        except Exception as e:
+            logger.error("Failed to load plugin module %s.", plugindir, exc_info = e)
+    if new_manifest != manifest:
+        _save_manifest(new_manifest)
+    logger.info("Found %d plugins in %.3f seconds, %d had to be imported", 
+                len(imported_plugins), time.time() - started, imported)
+
+_import_lock = threading.RLock()
+plugin_importer = PluginImporter()
+sys.meta_path.append(plugin_importer)
+
+all_plugin_directories = get_extra_plugin_dirs() + \
+                         list_plugin_dirs(os.path.expanduser("~/.gnome15/plugins")) + \
+                         list_plugin_dirs(os.path.join(g15globals.user_config_dir, "plugins")) + \
+                         list_plugin_dirs(os.path.join(g15globals.user_data_dir, "plugins")) + \
+                         list_plugin_dirs(g15globals.plugin_dir)
+_load_plugins()
 
 
 class G15Plugins():
@@ -282,6 +506,8 @@ class G15Plugins():
         self.conf_client.add_dir(self._get_plugin_key(), gconf.CLIENT_PRELOAD_NONE)
         self.module_map = {}
         self.plugin_map = {}
+        self.activation_times = {}
+        self.activation_timeouts = []
         self.state = UNINITIALISED
         
     def is_activated(self):
@@ -359,12 +585,13 @@ class G15Plugins():
                         # Only actually activate if the plugin is not passive and the network
                         # is in the right state
                         
+                        # Plugins are only imported if they are enabled and support the model 
                         if self.conf_client.get_bool(key) and \
-                          not is_passive_plugin(mod):
+                          not is_passive_plugin(mod) and \
+                          ( self.screen is None or self.screen.driver.get_model_name() in get_supported_models(mod) ):
                             try :
                                 instance = self._create_instance(mod, plugin_dir_key)
-                                if self.screen is None or self.screen.driver.get_model_name() in get_supported_models(mod):
-                                    self.started.append(instance)
+                                self.started.append(instance)
                             except Exception as e:
                                 self.conf_client.set_bool(key, False)
                                 logger.error("Failed to load plugin %s.", mod.id, exc_info = e)
@@ -377,6 +604,18 @@ class G15Plugins():
             self.lock.release()
         logger.info("Started plugin manager")
     
+    def is_handling_keys(self):
+        """
+        Get if any started plugin that handles keys may currently want to see
+        key events. Plugins with a handle_key() function may provide 
+        is_handling_keys() to say when they do, otherwise they always do.
+        """
+        for plugin in list(self.started):
+            if hasattr(plugin, 'handle_key') and \
+                    ( not hasattr(plugin, 'is_handling_keys') or plugin.is_handling_keys() ):
+                return True
+        return False
+    
     def handle_key(self, key, state, post=False):
         """
         Pass the provided key event to all plugins. For each key event, this
@@ -418,7 +657,7 @@ class G15Plugins():
             try :
                 self.state = ACTIVATING
                 self.activated = []
-                idx = 0
+                to_activate = []
                 for plugin in plugin if isinstance(plugin, list) else self.started:
                     mod = self.plugin_map[plugin]
                     
@@ -428,9 +667,8 @@ class G15Plugins():
                     needs_net = is_needs_network(mod)
                     if not needs_net or ( needs_net and \
                             self.network_manager.is_network_available() ):
-                        self._activate_instance(plugin, callback, idx)
-                        
-                    idx += 1           
+                        to_activate.append(plugin)
+                self._activate_concurrently(to_activate, callback)
                 self.state = ACTIVATED
             except Exception as e:           
                 self.state = STARTED
@@ -468,6 +706,21 @@ class G15Plugins():
         else:
             self._deactivate_instance(plugin)
     
+    def get_activation_times(self):
+        """
+        Get a dictionary of the number of seconds each plugin took to activate,
+        keyed by plugin module ID. Plugins that timed out (see 
+        activation_timeouts) have the time waited for them.
+        """
+        return dict(self.activation_times)
+    
+    def get_activation_report(self):
+        """
+        Get a list of ( plugin module ID, seconds ) tuples for the plugins 
+        activated, slowest first.
+        """
+        return sorted(self.activation_times.items(), key = lambda t: t[1], reverse = True)
+    
     def destroy(self):
         """
         Destroy all plugins that are currently started.
@@ -542,6 +795,10 @@ class G15Plugins():
             self.lock.release()
             
     def _activate_instance(self, instance, callback=None, idx=0):
+        if self._call_activate(instance, callback, idx):
+            self._record_activated(instance)
+            
+    def _call_activate(self, instance, callback=None, idx=0):
         mod = self.plugin_map[instance] 
         logger.info("Activating %s", mod.id)
         try :             
@@ -552,11 +809,162 @@ class G15Plugins():
             if callback != None:
                 callback(idx, len(self.started), mod.name)
             instance.activate()
-            self.service.active_plugins[mod.id] = True
-            self.activated.append(instance)
+            return True
         except Exception as e:
             logger.error("Failed to activate plugin %s.", mod.id, exc_info = e)
-            self.conf_client.set_bool(self._get_plugin_key("%s/enabled" % mod.id), False)              
+            self.conf_client.set_bool(self._get_plugin_key("%s/enabled" % mod.id), False)
+            return False
+            
+    def _record_activated(self, instance):
+        self.lock.acquire()
+        try :
+            self.service.active_plugins[self.plugin_map[instance].id] = True
+            self.activated.append(instance)
+        finally:
+            self.lock.release()
+        
+    def _activate_concurrently(self, plugins, callback = None):
+        """
+        Activate a list of plugins, each on its own thread (or the GObject 
+        thread for those that require it) with up to ACTIVATION_WORKERS 
+        running at once, waiting until they have all completed or timed out.
+        A plugin is not started until those named by its activate_after 
+        attribute have completed or timed out. The callback is invoked on this
+        thread as each plugin completes. 
+        
+        Must be called with the lock held. A plugin that completes after it
+        has timed out is recorded by its own thread once it can take the lock.
+        """
+        self.activation_times = {}
+        self.activation_timeouts = []
+        if len(plugins) == 0:
+            return
+        condition = threading.Condition()
+        completed = []
+        waiting = [ True ]
+        
+        def activate(plugin, plugin_started):
+            activated = self._call_activate(plugin)
+            condition.acquire()
+            try:
+                if waiting[0]:
+                    completed.append(( plugin, activated, time.time() ))
+                    condition.notify()
+                    return
+            finally:
+                condition.release()
+            self._activated_late(plugin, activated, time.time() - plugin_started)
+            
+        ids = set([ self.plugin_map[plugin].id for plugin in plugins ])
+        queued = list(plugins)
+        running = set()
+        plugin_starts = {}
+        finished = set()
+        done = 0
+        started = time.time()
+        try:
+            while len(finished) < len(plugins):
+                for plugin in list(queued):
+                    if len(running) >= ACTIVATION_WORKERS:
+                        break
+                    mod = self.plugin_map[plugin]
+                    if len(( set(get_activate_after(mod)) & ids ) - finished) > 0:
+                        continue
+                    queued.remove(plugin)
+                    running.add(plugin)
+                    plugin_starts[plugin] = self._start_activation(activate, plugin)
+                    
+                if len(running) == 0:
+                    # Whatever is left is waiting on each other 
+                    plugin = queued.pop(0)
+                    logger.warning("%s has circular activate_after dependencies, activating anyway",
+                                   self.plugin_map[plugin].id)
+                    running.add(plugin)
+                    plugin_starts[plugin] = self._start_activation(activate, plugin)
+                
+                now = time.time()
+                wait = min([ ACTIVATION_TIMEOUT - ( now - plugin_starts[plugin] ) for plugin in running ])
+                condition.acquire()
+                try:
+                    if len(completed) == 0 and wait > 0:
+                        condition.wait(wait)
+                    results = list(completed)
+                    del completed[:]
+                finally:
+                    condition.release()
+                    
+                for plugin, activated, plugin_finished in results:
+                    mod = self.plugin_map[plugin]
+                    taken = plugin_finished - plugin_starts[plugin]
+                    if mod.id in finished:
+                        self._activated_late(plugin, activated, taken)
+                        continue
+                    running.remove(plugin)
+                    finished.add(mod.id)
+                    done += 1
+                    self.activation_times[mod.id] = taken
+                    if activated:
+                        self._record_activated(plugin)
+                    if callback != None:
+                        callback(done, len(plugins), "%s (%.1fs)" % ( mod.name, taken ))
+                    
+                now = time.time()
+                for plugin in list(running):
+                    if now - plugin_starts[plugin] >= ACTIVATION_TIMEOUT:
+                        mod = self.plugin_map[plugin]
+                        logger.warning("%s has taken more than %d seconds to activate, no longer waiting for it", 
+                                       mod.id, ACTIVATION_TIMEOUT)
+                        running.remove(plugin)
+                        finished.add(mod.id)
+                        self.activation_timeouts.append(mod.id)
+                        self.activation_times[mod.id] = now - plugin_starts[plugin]
+        finally:
+            condition.acquire()
+            try:
+                waiting[0] = False
+                results = list(completed)
+            finally:
+                condition.release()
+            for plugin, activated, plugin_finished in results:
+                self._activated_late(plugin, activated, plugin_finished - plugin_starts[plugin])
+                
+        report = self.get_activation_report()
+        logger.info("Activated %d plugins in %.3f seconds. Slowest were %s", len(plugins), time.time() - started,
+                    ", ".join([ "%s (%.3fs)" % t for t in report[:5] ]))
+        if callback != None and len(report) > 0:
+            callback(len(plugins), len(plugins), "Slowest plugin %s (%.1fs)" % report[0])
+            
+    def _start_activation(self, activate, plugin):
+        plugin_started = time.time()
+        if is_needs_gobject_thread(self.plugin_map[plugin]):
+            if not g15scheduler.run_on_gobject(activate, plugin, plugin_started):
+                activate(plugin, plugin_started)
+        else:
+            t = threading.Thread(target = activate, args = ( plugin, plugin_started ))
+            t.name = "PluginActivation"
+            t.setDaemon(True)
+            t.start()
+        return plugin_started
+    
+    def _activated_late(self, plugin, activated, taken):
+        """
+        Record a plugin that completed activation after start-up stopped 
+        waiting for it, or de-activate it again if the plugins have been
+        de-activated in the meantime.
+        """
+        mod = self.plugin_map[plugin]
+        logger.warning("%s finally activated after %.3f seconds", mod.id, taken)
+        if not activated:
+            return
+        self.lock.acquire()
+        try :
+            if self.state in [ ACTIVATING, ACTIVATED ]:
+                self._record_activated(plugin)
+            else:
+                logger.info("Plugins are no longer active, de-activating %s", mod.id)
+                plugin.deactivate()
+        finally:
+            self.lock.release()
         
     def _is_single_instance(self, module):
         return getattr(module, 'single_instance', False)
@@ -28,6 +28,7 @@ import util.g15convert as g15convert
 import util.g15gconf as g15gconf
 import util.g15os as g15os
 import util.g15icontools as g15icontools
+import util.g15matcher as g15matcher
 import g15globals
 import g15actions
 import g15devices
@@ -42,6 +43,7 @@ import logging
 import re
 import zipfile
 from cStringIO import StringIO
+from threading import RLock
  
 logger = logging.getLogger(__name__)
 active_profile = None
@@ -77,6 +79,7 @@ class EventHandler(pyinotify.ProcessEvent):
     def _notify(self, event):
         ids = self._get_profile_ids(event)
         if ids:
+            invalidate_profile(ids[0])
             for profile_listener in profile_listeners:
                 profile_listener(ids[0], ids[1])
         
@@ -134,6 +137,22 @@ DEFAULT_REPEAT_DELAY = -1.0
 
 __profile_dirs = []
 
+'''
+Shared profiles. Profiles requested with shared=True are only loaded from 
+disk the first time they are needed, or after the inotify watch (or saving
+the profile) has invalidated them. Shared profiles must not be changed.
+'''
+_cache_lock = RLock()
+_cache_generation = 0
+_profile_cache = {}
+_profiles_cache = {}
+_matchers = {}
+
+'''
+Maximum number of window names remembered by each device's matcher 
+'''
+MAX_MEMOISED_WINDOWS = 256
+
 def add_profile_dir(profile_dir):
     '''
     Add a new location to search for macro profiles. This allows plugins to
@@ -142,6 +161,7 @@ def add_profile_dir(profile_dir):
     profile_dir    -- profile directory to register
     '''
     __profile_dirs.append(profile_dir)
+    invalidate_profile()
 
 def remove_profile_dir(profile_dir):
     '''
@@ -151,8 +171,92 @@ def remove_profile_dir(profile_dir):
     profile_dir    -- profile directory to de-register
     '''
     __profile_dirs.remove(profile_dir)
+    invalidate_profile()
+    
+def invalidate_profile(profile_id = None):
+    '''
+    Discard the shared copy of a profile, so it is loaded from disk again the
+    next time it is needed. The list of profiles and the window name index
+    are always discarded.
+    
+    profile_id    -- ID of profile that changed, or None for all profiles
+    '''
+    global _cache_generation
+    _cache_lock.acquire()
+    try:
+        _cache_generation += 1
+        if profile_id is None:
+            _profile_cache.clear()
+        else:
+            for key in _profile_cache.keys():
+                if key[1] == str(profile_id):
+                    del _profile_cache[key]
+        _profiles_cache.clear()
+        _matchers.clear()
+    finally:
+        _cache_lock.release()
+        
+def find_profile_for_window(device, window_name):
+    '''
+    Find the first profile that activates on focus and whose window name is
+    part of the provided window name (ignoring case). The default profile is
+    never returned. The profile returned is shared and must not be changed.
+    
+    Keyword arguments:
+    device        -- device
+    window_name   -- name of window (or application) that now has focus
+    '''
+    return _get_matcher(device).find_for_window(window_name)
+    
+def _get_matcher(device):
+    _cache_lock.acquire()
+    try:
+        if device.uid in _matchers:
+            return _matchers[device.uid]
+        generation = _cache_generation
+    finally:
+        _cache_lock.release()
+        
+    matcher = _ProfileMatcher(get_profiles(device, shared = True), 
+                              get_default_profile(device, shared = True))
     
-def get_profile_by_name(device, name):
+    _cache_lock.acquire()
+    try:
+        if generation == _cache_generation:
+            _matchers[device.uid] = matcher
+    finally:
+        _cache_lock.release()
+    return matcher
+
+class _ProfileMatcher():
+    '''
+    Finds profiles by window name or launch command line for one device. Built
+    from the shared profiles, and discarded whenever they change.
+    '''
+    
+    def __init__(self, profiles, default_profile):
+        self.window_profiles = [ p for p in profiles if p != default_profile and \
+                                p.activate_on_focus and len(p.window_name) > 0 ]
+        self.window_matcher = g15matcher.SubstringMatcher([ p.window_name.lower() for p in self.window_profiles ])
+        self.launch_profiles = profiles
+        self.launch_matcher = g15matcher.RegexMatcher([ p.launch_pattern for p in profiles ])
+        self.window_memo = {}
+        
+    def find_for_window(self, window_name):
+        if window_name in self.window_memo:
+            return self.window_memo[window_name]
+        index = self.window_matcher.match(window_name.lower())
+        profile = self.window_profiles[index] if index is not None else None
+        if len(self.window_memo) >= MAX_MEMOISED_WINDOWS:
+            self.window_memo.clear()
+        self.window_memo[window_name] = profile
+        return profile
+    
+    def find_for_command(self, command_line):
+        index = self.launch_matcher.match(command_line)
+        return self.launch_profiles[index] if index is not None else None
+
+def get_profile_by_name(device, name, shared = False):
     """
     Get a profile given it's name. If there is more than one profile with
     the same name, the first will be return. If no profile is found, None
@@ -161,18 +265,37 @@ def get_profile_by_name(device, name):
     Keyword arguments:
     device        -- device associated with profile
     name          -- profile name to find
+    shared        -- return the shared (cached) instance, which must not be changed
     """
-    for profile in get_profiles(device):
+    for profile in get_profiles(device, shared):
         if profile.name == name:
             return profile
 
-def get_profiles(device):
+def get_profiles(device, shared = False):
     '''
     Get list of all configured macro profiles for the specified device.
     
     Keyword arguments:
     device        -- device associated with profiles
+    shared        -- return the shared (cached) list, the profiles in which must not be changed
     '''
+    if shared:
+        _cache_lock.acquire()
+        try:
+            if device.uid in _profiles_cache:
+                return _profiles_cache[device.uid]
+            generation = _cache_generation
+        finally:
+            _cache_lock.release()
+        profiles = get_profiles(device)
+        _cache_lock.acquire()
+        try:
+            if generation == _cache_generation:
+                _profiles_cache[device.uid] = profiles
+        finally:
+            _cache_lock.release()
+        return profiles
+    
     profiles = []
     for profile_dir in get_all_profile_dirs(device):
         if os.path.exists(profile_dir):
@@ -235,39 +358,61 @@ def create_profile(profile):
 def generate_profile_id():
     return long(time.time())
     
-def get_profile(device, profile_id):
+def get_profile(device, profile_id, shared = False):
     """
     Get a profile given the device it is associated with and it's ID. The
     profile will be fully loaded on return. The object returned will be a 
-    new instance.
+    new instance, unless shared is True, in which case the same instance
+    is returned until the profile changes on disk. 
     
     Keyword arguments:
     device        -- device associated with profile
     profile_id    -- ID of profile to load
+    shared        -- return the shared (cached) instance, which must not be changed
     """
+    if shared:
+        key = ( device.uid, str(profile_id) )
+        _cache_lock.acquire()
+        try:
+            if key in _profile_cache:
+                return _profile_cache[key]
+            generation = _cache_generation
+        finally:
+            _cache_lock.release()
+        profile = get_profile(device, profile_id)
+        _cache_lock.acquire()
+        try:
+            # Don't keep it if the profile changed while it was being loaded
+            if generation == _cache_generation:
+                _profile_cache[key] = profile
+        finally:
+            _cache_lock.release()
+        return profile
+    
     for profile_dir in get_all_profile_dirs(device):
         path = "%s/%s.macros" % ( profile_dir, profile_id )
         if os.path.exists(path):
             return G15Profile(device, profile_id, file_path = path);
 
-def get_active_profile(device):
+def get_active_profile(device, shared = False):
     """
     Get the currently active profile for the specified device. This will
     be retrieved from the configuration backend.
     
     Keyword arguments:
     device        -- device associated with profile
+    shared        -- return the shared (cached) instance, which must not be changed
     """
     val= conf_client.get("/apps/gnome15/%s/active_profile" % device.uid)
     profile = None
     if val != None and val.type == gconf.VALUE_INT:
         # This is just here for compatibility with <= 0.7.x
-        profile = get_profile(device, str(val.get_int()))
+        profile = get_profile(device, str(val.get_int()), shared)
     elif val != None and val.type == gconf.VALUE_STRING:
-        profile = get_profile(device, val.get_string())
+        profile = get_profile(device, val.get_string(), shared)
 
     if profile is None:
-        profile = get_default_profile(device)
+        profile = get_default_profile(device, shared)
         
     if profile is None:
         profile = create_default(device)
@@ -295,17 +440,18 @@ def set_locked(device, locked):
     """
     conf_client.set_bool("/apps/gnome15/%s/locked" % device.uid, locked)
       
-def get_default_profile(device):
+def get_default_profile(device, shared = False):
     """
     Get the default profile for the specified device. 
     
     Keyword arguments:
     device        -- device associated with default profile
+    shared        -- return the shared (cached) instance, which must not be changed
     """
-    old_default = get_profile(device, "0")
+    old_default = get_profile(device, "0", shared)
     if old_default is not None:
         return old_default
-    return get_profile(device, "Default")
+    return get_profile(device, "Default", shared)
 
 def get_keys_from_key(key_list_key):
     """
@@ -379,9 +525,7 @@ def find_profile_for_command(args, device):
         
     logger.info("Processed command '%s'", command_line)
     
-    for p in get_profiles(device):
-        if p.can_launch(command_line):
-            return p
+    return _get_matcher(device).find_for_command(command_line)
         
 def to_key_state_name(key_state_id):
     """
@@ -895,6 +1039,7 @@ class G15Profile(object):
         Delete this macro profile
         """
         os.remove(self.filename)
+        invalidate_profile(self.id)
         
     def delete_macro(self, activate_on, memory, keys):
         """
@@ -1159,6 +1304,9 @@ class G15Profile(object):
                 os.utime(save_file, None)
             finally:
                 fhandle.close()
+                
+            # Don't wait for inotify, the shared copy is out of date now 
+            invalidate_profile(self.id)
         else:
             self.parser.write(save_file)
         
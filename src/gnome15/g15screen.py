@@ -50,6 +50,7 @@ import util.g15scheduler as g15scheduler
 import util.g15pythonlang as g15pythonlang
 import util.g15gconf as g15gconf
 import util.g15cairo as g15cairo
+import util.g15framegate as g15framegate
 import util.g15icontools as g15icontools
 import g15profile
 import g15globals
@@ -94,6 +95,26 @@ def run_on_redraw(cb, *args):
     """
     g15scheduler.queue(REDRAW_QUEUE, "Redraw", 0, cb, *args)
         
+class RedrawRequest():
+    """
+    Redraw requests that have been merged while waiting to run on the redraw
+    queue. A page of None means the current page.
+    """
+    def __init__(self, page, direction, transitions, redraw_content, damaged_only):
+        self.pages = [ page ]
+        self.direction = direction
+        self.transitions = transitions
+        self.redraw_content = redraw_content
+        self.damaged_only = damaged_only
+        
+    def merge(self, page, direction, transitions, redraw_content, damaged_only):
+        if not page in self.pages:
+            self.pages.append(page)
+        self.direction = direction
+        self.transitions = self.transitions or transitions
+        self.redraw_content = self.redraw_content or redraw_content
+        self.damaged_only = self.damaged_only and damaged_only
+        
 class ScreenChangeAdapter():
     """
     Adapter class for screen change listeners to save such listeners having to
@@ -287,6 +308,12 @@ class G15Screen():
         self.acquired_controls = {}
         self.painters = []
         self.fader = None
+        self.frame_gate = None
+        self.redraw_lock = RLock()
+        self.pending_redraw = None
+        self.last_redraw = 0
+        self.redraws_merged = 0
+        self.redraws_run = 0
         self.mkey = 1
         self.temp_acquired_controls = {}
         self.key_handler = g15keyboard.G15KeyHandler(self)
@@ -314,15 +341,12 @@ class G15Screen():
             choose_profile = None
             # Active window has changed, see if we have a profile that matches it
             if application_name is not None:
-                for profile in g15profile.get_profiles(self.device):
-                    if not profile.get_default() and profile.activate_on_focus and len(profile.window_name) > 0 and application_name.lower().find(profile.window_name.lower()) != -1:
-                        choose_profile = profile 
-                        break
+                choose_profile = g15profile.find_profile_for_window(self.device, application_name)
                 
             # No applicable profile found. Look for a default profile, and see if it is set to activate by default
-            active_profile = g15profile.get_active_profile(self.device)
+            active_profile = g15profile.get_active_profile(self.device, shared = True)
             if choose_profile == None:
-                default_profile = g15profile.get_default_profile(self.device)
+                default_profile = g15profile.get_default_profile(self.device, shared = True)
                 
                 if (active_profile == None or active_profile.id != default_profile.id) and default_profile.activate_on_focus:
                     default_profile.make_active()
@@ -361,6 +385,7 @@ class G15Screen():
         self.notify_handles.append(self.conf_client.notify_add("%s/cycle_screens" % screen_key, self.resched_cycle))
         self.notify_handles.append(self.conf_client.notify_add("%s/active_profile" % screen_key, self.active_profile_changed))
         self.notify_handles.append(self.conf_client.notify_add("%s/driver" % screen_key, self.driver_changed))
+        self.notify_handles.append(self.conf_client.notify_add("%s/max_fps" % screen_key, self._max_fps_changed))
         for control in self.driver.get_controls():
             self.notify_handles.append(self.conf_client.notify_add("%s/%s" % (screen_key, control.id), self._control_changed))
         logger.info("Starting for %s is complete.", self.device.uid)
@@ -836,7 +861,7 @@ class G15Screen():
         
     def active_profile_changed(self, client, connection_id, entry, args):
         # Check if the active profile has change)
-        new_profile = g15profile.get_active_profile(self.device)
+        new_profile = g15profile.get_active_profile(self.device, shared = True)
         if new_profile == None:
             logger.info("No profile active")
             self.deactivate_profile()
@@ -881,6 +906,16 @@ class G15Screen():
         for listener in self.screen_change_listeners:
             g15pythonlang.call_if_exists(listener, "attention_requested", message)
     
+    def is_handling_keys(self):
+        """
+        Get if the visible page or any plugin may currently want to see key
+        events (see g15keyboard.is_handling_keys()).
+        """
+        visible = self.get_visible_page()
+        if visible != None and g15keyboard.is_handling_keys(visible.key_handlers):
+            return True
+        return self.plugins.is_handling_keys()
+    
     def handle_key(self, keys, state_id, post):
         """
         Do not call. This is invoked by the key handler
@@ -939,6 +974,9 @@ class G15Screen():
         self.height = self.driver.get_size()[1]
         
         self.surface = cairo.ImageSurface (cairo.FORMAT_ARGB32, self.width, self.height)
+        if self.frame_gate != None:
+            self.frame_gate.reset()
+        self.frame_gate = g15framegate.FrameGate(self.driver, REDRAW_QUEUE, self._get_max_fps())
         self.size = (self.width, self.height)
         self.available_size = (0, 0, self.size[0], self.size[1])
         
@@ -946,6 +984,7 @@ class G15Screen():
         self.draw_lock = threading.Lock()
         self.visible_page = None
         self.old_canvas = None
+        self.old_surface = None
         self.transition_function = None
         self.painter_function = None
         self.mkey = 1
@@ -957,8 +996,19 @@ class G15Screen():
         control_id = entry.get_key().split("/")[-1]
         control = self.driver.get_control(control_id)
         control.set_from_configuration(self.driver.device, self.conf_client)
+        
+        # The encoded frame may change even though the page does not 
+        if self.frame_gate != None:
+            self.frame_gate.reset()
         if self.visible_page:
             self.visible_page.mark_dirty()
+            
+    def _max_fps_changed(self, client, connection_id, entry, args):
+        if self.frame_gate != None:
+            self.frame_gate.set_max_fps(self._get_max_fps())
+            
+    def _get_max_fps(self):
+        return g15gconf.get_int_or_default(self.conf_client, "/apps/gnome15/%s/max_fps" % self.device.uid, g15framegate.DEFAULT_MAX_FPS)
         
     def _cancel_timer(self):
         self.reschedule_lock.acquire()
@@ -1040,7 +1090,7 @@ class G15Screen():
             return
                 
         to_activate = []   
-        choose_profile = g15profile.get_active_profile(self.device)
+        choose_profile = g15profile.get_active_profile(self.device, shared = True)
         
         """
         Decide what plugins should de-activated or activated
@@ -1127,37 +1177,76 @@ class G15Screen():
     def set_painter(self, painter):
         o_painter = self.painter_function
         self.painter_function = painter
+        if self.frame_gate != None:
+            self.frame_gate.reset()
         return o_painter
     
+    def get_frame_statistics(self):
+        """
+        Get a dictionary of counters for the frames requested, rendered,
+        deduplicated, coalesced and sent to the driver since it was connected,
+        the number of redraw requests that were merged and run, and the number
+        of jobs currently waiting on the redraw queue.
+        """
+        stats = self.frame_gate.get_statistics() if self.frame_gate != None else {}
+        stats["redraws_merged"] = self.redraws_merged
+        stats["redraws_run"] = self.redraws_run
+        stats["redraw_queue_depth"] = g15scheduler.get_queue_size(REDRAW_QUEUE)
+        return stats
+    
     def set_transition(self, transition):
         o_transition = self.transition_function
         self.transition_function = transition
         return o_transition
     
     def cycle_to(self, page, transitions=True):
-        g15scheduler.clear_jobs(REDRAW_QUEUE)
+        self._clear_redraws()
         g15scheduler.execute(REDRAW_QUEUE, "cycleTo", self._do_cycle_to, page, transitions)
             
     def cycle(self, number, transitions=True):
-        g15scheduler.clear_jobs(REDRAW_QUEUE)
+        self._clear_redraws()
         g15scheduler.execute(REDRAW_QUEUE, "doCycle", self._do_cycle, number, transitions)
             
-    def redraw(self, page=None, direction="up", transitions=True, redraw_content=True, queue=True):
+    def redraw(self, page=None, direction="up", transitions=True, redraw_content=True, queue=True, damaged_only=False):
+        """
+        Redraw a page (or the current page). If damaged_only is True, and the
+        page is already showing, only the areas the page has recorded as damaged
+        are painted and sent to the driver.
+        
+        Queued requests are merged with any request that is still waiting to
+        run, and are run at most once per frame (see the max_fps setting).
+        """
         if page:
             logger.debug("Redrawing %s", page.id)
         else:
             logger.debug("Redrawing current page")
+        if self.frame_gate != None:
+            self.frame_gate.frame_requested()
         if queue:
-            g15scheduler.execute(REDRAW_QUEUE, "redraw", self._do_redraw, page, direction, transitions, redraw_content)
+            self.redraw_lock.acquire()
+            try:
+                if self.pending_redraw != None:
+                    self.pending_redraw.merge(page, direction, transitions, redraw_content, damaged_only)
+                    self.redraws_merged += 1
+                    return
+                self.pending_redraw = RedrawRequest(page, direction, transitions, redraw_content, damaged_only)
+                interval = self.frame_gate.interval if self.frame_gate != None else 0 
+                delay = self.last_redraw + interval - time.time()
+            finally:
+                self.redraw_lock.release()
+            if delay > 0:
+                g15scheduler.queue(REDRAW_QUEUE, "redraw", delay, self._do_pending_redraw)
+            else:
+                g15scheduler.execute(REDRAW_QUEUE, "redraw", self._do_pending_redraw)
         else:
-            self._do_redraw(page, direction, transitions, redraw_content)
+            self._do_redraw(page, direction, transitions, redraw_content, damaged_only)
             
         
     def set_color_for_mkey(self):
         control = self.driver.get_control_for_hint(g15driver.HINT_DIMMABLE)
         rgb = None
         if control != None and not isinstance(control.value, int):
-            profile = g15profile.get_active_profile(self.device)
+            profile = g15profile.get_active_profile(self.device, shared = True)
             if profile != None:
                 rgb = profile.get_mkey_color(self.mkey)
         
@@ -1291,7 +1380,7 @@ class G15Screen():
     Private functions
     '''
     
-    def _draw_page(self, visible_page, direction="down", transitions=True, redraw_content=True):
+    def _draw_page(self, visible_page, direction="down", transitions=True, redraw_content=True, damaged_only=False):
         self.draw_lock.acquire()
         try:
             if self.driver == None or not self.driver.is_connected():
@@ -1303,6 +1392,11 @@ class G15Screen():
             
             surface = self.surface
             
+            # Only the damaged areas need painting if the page is already showing
+            damage_rects = self._get_damage_rects(visible_page, damaged_only)
+            if damage_rects is not None:
+                surface = self.old_surface
+            
             painters = sorted(self.painters, key=lambda painter: painter.z_order)
             
             # If the visible page is changing, creating a new surface. Both surfaces are
@@ -1315,6 +1409,8 @@ class G15Screen():
                 
             self.local_data.surface = surface
             canvas = cairo.Context (surface)
+            if damage_rects is not None:
+                self._clip_to_rects(canvas, damage_rects)
             self.clear_canvas(canvas)
             
             # Background painters
@@ -1349,7 +1445,15 @@ class G15Screen():
             
                          
                 # Paint the content to a new surface so it can be cached
-                if self.content_surface == None or redraw_content:
+                if damage_rects is not None:
+                    content_canvas = cairo.Context(self.content_surface)
+                    self._clip_to_rects(content_canvas, damage_rects)
+                    content_canvas.set_operator(cairo.OPERATOR_CLEAR)
+                    content_canvas.paint()
+                    content_canvas.set_operator(cairo.OPERATOR_OVER)
+                    self.configure_canvas(content_canvas)
+                    self.visible_page.paint(content_canvas)
+                elif self.content_surface == None or redraw_content:
                     self.content_surface = cairo.ImageSurface (cairo.FORMAT_ARGB32, self.width, self.height)
                     content_canvas = cairo.Context(self.content_surface)
                     self.configure_canvas(content_canvas)
@@ -1391,11 +1495,18 @@ class G15Screen():
                     
             # Run any transitions
             if transitions and self.transition_function != None and self.old_canvas != None:
+                if self.frame_gate != None:
+                    self.frame_gate.reset()
                 self.transition_function(self.old_surface, surface, old_page, self.visible_page, direction)
                 
             # Now apply any global transformations and paint
             if self.painter_function != None:
+                if self.frame_gate != None:
+                    self.frame_gate.reset()
                 self.painter_function(surface)
+            elif self.frame_gate != None:
+                # Identical frames are dropped, and bursts are limited to the maximum frame rate
+                self.frame_gate.paint(surface, damage_rects)
             else:
                 self.driver.paint(surface)
                 
@@ -1403,6 +1514,33 @@ class G15Screen():
             self.old_surface = surface
         finally:
             self.draw_lock.release()
+            
+    def _get_damage_rects(self, visible_page, damaged_only):
+        """
+        Get the pixel aligned areas to repaint for a damage only redraw, or None
+        if the whole screen must be painted. Any damage recorded by the page is
+        discarded either way, as a full paint covers it.
+        """
+        if visible_page == None:
+            return None
+        damage = visible_page.take_damage()
+        if not damaged_only or len(damage) == 0 or visible_page != self.visible_page or \
+           self.painter_function != None or self.content_surface == None or \
+           self.old_surface == None or self.available_size != (0, 0, self.width, self.height):
+            return None
+        rects = []
+        for rect in damage:
+            if rect == None:
+                return None
+            rect = g15cairo.to_pixel_rect(rect, self.width, self.height)
+            if rect != None and not rect in rects:
+                rects.append(rect)
+        return rects if len(rects) > 0 else None
+    
+    def _clip_to_rects(self, canvas, rects):
+        for rect in rects:
+            canvas.rectangle(*rect)
+        canvas.clip()
         
     def configure_canvas(self, canvas):        
         canvas.set_antialias(self.driver.get_antialias())
@@ -1478,12 +1616,46 @@ class G15Screen():
         if len(self.pages) > 0:            
             self._cycle_pages(number, self._get_pages_of_priority(PRI_NORMAL))
                 
-    def _do_redraw(self, page=None, direction="up", transitions=True, redraw_content=True):
+    def _clear_redraws(self):
+        self.redraw_lock.acquire()
+        try:
+            g15scheduler.clear_jobs(REDRAW_QUEUE)
+            self.pending_redraw = None
+            
+            # A frame being held back must still be sent
+            if self.frame_gate != None:
+                self.frame_gate.requeue()
+        finally:
+            self.redraw_lock.release()
+            
+    def _do_pending_redraw(self):
+        self.redraw_lock.acquire()
+        try:
+            request = self.pending_redraw
+            self.pending_redraw = None
+            self.last_redraw = time.time()
+        finally:
+            self.redraw_lock.release()
+        if request == None:
+            # Cleared, or already run
+            return
+        self.redraws_run += 1
+        self.page_model_lock.acquire()
+        try :           
+            current_page = self._get_next_page_to_display()
+            if None in request.pages or current_page in request.pages:
+                self._draw_page(current_page, request.direction, request.transitions, request.redraw_content, request.damaged_only)
+            elif len([p for p in request.pages if p.panel_painter != None]) > 0:
+                self._draw_page(current_page, request.direction, request.transitions, False)
+        finally:    
+            self.page_model_lock.release()
+                
+    def _do_redraw(self, page=None, direction="up", transitions=True, redraw_content=True, damaged_only=False):
         self.page_model_lock.acquire()
         try :           
             current_page = self._get_next_page_to_display()
             if page == None or page == current_page:
-                self._draw_page(current_page, direction, transitions, redraw_content)
+                self._draw_page(current_page, direction, transitions, redraw_content, damaged_only)
             elif page != None and page.panel_painter != None:
                 self._draw_page(current_page, direction, transitions, False)
         finally:    
@@ -157,6 +157,12 @@ class MacroHandler(object):
         """
         self.cancelled = True
         
+    def is_handling_keys(self):
+        """
+        Get if any macro is waiting for key events
+        """
+        return len(self.buffered_executions) > 0
+        
     def handle_key(self, keys, state_id, post):
         """
         Handle raw keys. We use this to complete any macros waiting for another
@@ -843,6 +849,7 @@ class G15Service(g15desktop.G15AbstractService):
         self.notify_handles.append(self.conf_client.notify_add("/apps/gnome15/key_hold_duration", self._hidden_configuration_changed))
         self.notify_handles.append(self.conf_client.notify_add("/apps/gnome15/use_x_test", self._hidden_configuration_changed))
         self.notify_handles.append(self.conf_client.notify_add("/apps/gnome15/disable_svg_glow", self._hidden_configuration_changed))
+        self.notify_handles.append(self.conf_client.notify_add("/apps/gnome15/raster_cache_frames", self._hidden_configuration_changed))
         
             
         # Monitor active application    
@@ -1076,6 +1083,7 @@ class G15Service(g15desktop.G15AbstractService):
         self.key_hold_duration = g15gconf.get_int_or_default(self.conf_client, '/apps/gnome15/key_hold_duration', 2000) / 1000.0
         self.macro_handler.use_x_test = g15gconf.get_bool_or_default(self.conf_client, '/apps/gnome15/use_x_test', True)
         self.disable_svg_glow = g15gconf.get_bool_or_default(self.conf_client, '/apps/gnome15/disable_svg_glow', False)
+        self.raster_cache_frames = g15gconf.get_int_or_default(self.conf_client, '/apps/gnome15/raster_cache_frames', 32)
         self.fade_screen_on_close = g15gconf.get_bool_or_default(self.conf_client, '/apps/gnome15/fade_screen_on_close', True)
         self.all_off_on_disconnect = g15gconf.get_bool_or_default(self.conf_client, '/apps/gnome15/all_off_on_disconnect', True)
         self.fade_keyboard_backlight_on_close = g15gconf.get_bool_or_default(self.conf_client, '/apps/gnome15/fade_keyboard_backlight_on_close', True)
@@ -18,17 +18,36 @@ import pango
 import pangocairo
 import cairo
 import gobject
+import util.g15cache as g15cache
 import logging
 logger = logging.getLogger(__name__)
 
 # Shared pango context
 pango_context = pangocairo.cairo_font_map_get_default().create_context()
+
+"""
+Number of font descriptions (with their metrics) and laid out texts that are
+kept for re-use. Unchanged text (such as a scrolling ticker or a menu) is then 
+not shaped again on every frame 
+"""
+MAX_CACHED_FONTS = 32
+MAX_CACHED_LAYOUTS = 256
+
+_fonts = g15cache.LRUCache(MAX_CACHED_FONTS)
+_layouts = g15cache.LRUCache(MAX_CACHED_LAYOUTS)
  
 """
 Handles drawing and measuring of text on a screen. 
 """
 
 
+def get_cache_statistics():
+    """
+    Get the counters of the font and layout caches.
+    """
+    return { "fonts" : _fonts.get_statistics(),
+             "layouts" : _layouts.get_statistics() }
+
 def new_text(screen = None):
     """
     Create a new text handler. This should be used rather than directly constructing
@@ -66,6 +85,24 @@ class G15Text(object):
         if self.antialias == cairo.ANTIALIAS_NONE:
             fo.set_hint_style(cairo.HINT_STYLE_NONE)
             fo.set_hint_metrics(cairo.HINT_METRICS_OFF)            
+            
+class _CachedLayout(object):
+    """
+    A layout that is ready to draw, along with the metrics of its font. The
+    extents are only calculated once.
+    """
+    
+    def __init__(self, layout, metrics):
+        self.layout = layout
+        self.metrics = metrics
+        self.extents = None
+        
+    def get_extents(self):
+        if self.extents is None:
+            text_extents = self.layout.get_extents()[1]
+            self.extents = ( text_extents[0] / pango.SCALE, text_extents[1] / pango.SCALE, \
+                             text_extents[2] / pango.SCALE, text_extents[3] / pango.SCALE )
+        return self.extents
     
 class G15PangoText(G15Text):
     
@@ -73,9 +110,9 @@ class G15PangoText(G15Text):
         G15Text.__init__(self, antialias)
         pangocairo.context_set_font_options(pango_context, self._create_font_options())   
         self.__pango_cairo_context = None
-        self.__layout = None
         self.valign = pango.ALIGN_CENTER
-        self.__layout = pango.Layout(pango_context)
+        self.metrics = None
+        self.__layout = _CachedLayout(pango.Layout(pango_context), None)
         
     def set_canvas(self, canvas):           
         G15Text.set_canvas(self, canvas)
@@ -86,20 +123,12 @@ class G15PangoText(G15Text):
             weight = None, style = None, font_pt_size = None,
             valign = None, pxwidth = None):
         
-        logger.debug("Text: %s, bounds = %s, wrap = %s, align = %s, width = %s, " \
-                     "attributes = %s, spacing = %s, font_desc = %s, weight = %s, " \
-                     "style = %s, font_pt_size = %s",
-                     str(text),
-                     str(bounds),
-                     str(wrap),
-                     str(align),
-                     str(width),
-                     str(attributes),
-                     str(spacing),
-                     str(font_desc),
-                     str(weight),
-                     str(style),
-                     str(font_pt_size))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Text: %s, bounds = %s, wrap = %s, align = %s, width = %s, " \
+                         "attributes = %s, spacing = %s, font_desc = %s, weight = %s, " \
+                         "style = %s, font_pt_size = %s",
+                         text, bounds, wrap, align, width, attributes, spacing,
+                         font_desc, weight, style, font_pt_size)
         
         G15Text.set_attributes(self, text, bounds)
         self.valign = valign
@@ -111,30 +140,23 @@ class G15PangoText(G15Text):
             font_desc_name += " %s" % style
         if font_pt_size:
             font_desc_name += " " + str(font_pt_size)
-        font_desc = pango.FontDescription(font_desc_name)
-        if font_absolute_size is not None:
-            font_desc.set_absolute_size(font_absolute_size)
-        self.__layout.set_font_description(font_desc)        
-        
-        if align != None:
-            self.__layout.set_alignment(align)
-        if spacing != None:
-            self.__layout.set_spacing(spacing)
-        if width != None:
-            self.__layout.set_width(width)
-        if pxwidth != None:
-            self.__layout.set_width(int(pango.SCALE * pxwidth))
-        if wrap:
-            self.__layout.set_wrap(wrap)
-        if attributes:
-            self.__layout.set_attributes(attributes)
             
-        self.__layout.set_text(text)
-        self.metrics = pango_context.get_metrics(self.__layout.get_font_description())
+        if attributes:
+            # Attribute lists can't be compared, so these layouts are never re-used
+            self.__layout = self._create_layout(text, font_desc_name, font_absolute_size, align, \
+                                                spacing, width, pxwidth, wrap, attributes)
+        else:
+            key = ( text, font_desc_name, font_absolute_size, align, spacing, width, pxwidth, wrap, self.antialias )
+            cached = _layouts.get(key)
+            if cached is None:
+                cached = self._create_layout(text, font_desc_name, font_absolute_size, align, \
+                                             spacing, width, pxwidth, wrap, None)
+                _layouts.put(key, cached)
+            self.__layout = cached
+        self.metrics = self.__layout.metrics
         
     def measure(self):
-        text_extents = self.__layout.get_extents()[1]
-        return text_extents[0] / pango.SCALE, text_extents[1] / pango.SCALE, text_extents[2] / pango.SCALE, text_extents[3] / pango.SCALE
+        return self.__layout.get_extents()
     
     def draw(self, x = None, y = None):
         self.__pango_cairo_context.save()
@@ -156,6 +178,39 @@ class G15PangoText(G15Text):
         if x is not None and y is not None:                
             self.__pango_cairo_context.move_to(x, y)
             
-        self.__pango_cairo_context.show_layout(self.__layout)
+        self.__pango_cairo_context.show_layout(self.__layout.layout)
         self.__pango_cairo_context.restore()
         
+    """
+    Private
+    """
+    def _create_layout(self, text, font_desc_name, font_absolute_size, align, spacing, width, pxwidth, wrap, attributes):
+        font_desc, metrics = self._get_font(font_desc_name, font_absolute_size)
+        layout = pango.Layout(pango_context)
+        layout.set_font_description(font_desc)
+        if align != None:
+            layout.set_alignment(align)
+        if spacing != None:
+            layout.set_spacing(spacing)
+        if width != None:
+            layout.set_width(width)
+        if pxwidth != None:
+            layout.set_width(int(pango.SCALE * pxwidth))
+        if wrap:
+            layout.set_wrap(wrap)
+        if attributes:
+            layout.set_attributes(attributes)
+        layout.set_text(text)
+        return _CachedLayout(layout, metrics)
+        
+    def _get_font(self, font_desc_name, font_absolute_size):
+        key = ( font_desc_name, font_absolute_size )
+        font = _fonts.get(key)
+        if font is None:
+            font_desc = pango.FontDescription(font_desc_name)
+            if font_absolute_size is not None:
+                font_desc.set_absolute_size(font_absolute_size)
+            font = ( font_desc, pango_context.get_metrics(font_desc) )
+            _fonts.put(key, font)
+        return font
+        
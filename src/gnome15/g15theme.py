@@ -52,22 +52,101 @@ import g15locale
 import util.g15cairo as g15cairo
 import util.g15svg as g15svg
 import util.g15icontools as g15icontools
+import util.g15cache as g15cache
 import xml.sax.saxutils as saxutils
 import base64
 import dbusmenu
 import logging
 import time
+import math
+import bisect
 logger = logging.getLogger(__name__)
 from string import Template
 from copy import deepcopy
 from cStringIO import StringIO
 from lxml import etree
 from threading import RLock
+from collections import OrderedDict
 import ConfigParser
 
 BASE_PX=18.0
 DEBUG_SVG=False
 
+# Whether themes keep the rasterised output of their last render so unchanged frames are a single blit
+CACHE_RASTER=True
+
+# How many rasterised renders each shared document keeps for all of the themes using it
+MAX_SHARED_RASTERS=32
+
+# How many full screen renders the raster cache of each model may hold, unless the model has a budget in RASTER_CACHE_BUDGETS
+DEFAULT_RASTER_CACHE_FRAMES=32
+
+# Maximum bytes of cached renders (rasters and the documents they were drawn from) kept for each model (by model name), overriding the size derived from DEFAULT_RASTER_CACHE_FRAMES
+RASTER_CACHE_BUDGETS={}
+
+# Estimate of the bytes each element of a processed document takes in memory, not counting its text
+DOCUMENT_ELEMENT_BYTES=300
+
+# How many damaged areas a page records before it treats the whole page as damaged
+MAX_DAMAGE_RECTS=16
+
+# Parsed and processed SVG files shared by all themes using the same file on the same driver
+_shared_documents = {}
+_shared_documents_lock = RLock()
+
+# Rasterised renders of recurring theme states, one cache per model
+_raster_caches = {}
+_raster_caches_lock = RLock()
+
+def get_raster_cache_statistics():
+    """
+    Get a dictionary of the raster cache counters (see g15cache.LRUCache.get_statistics()),
+    keyed by model name.
+    """
+    _raster_caches_lock.acquire()
+    try:
+        return dict([ ( model_name, cache.get_statistics() ) for model_name, cache in _raster_caches.items() ])
+    finally:
+        _raster_caches_lock.release()
+        
+def clear_raster_caches():
+    """
+    Discard all rasterised renders of recurring theme states.
+    """
+    _raster_caches_lock.acquire()
+    try:
+        for cache in _raster_caches.values():
+            cache.clear()
+    finally:
+        _raster_caches_lock.release()
+        
+def _get_raster_cache(model_name, max_bytes):
+    _raster_caches_lock.acquire()
+    try:
+        cache = _raster_caches.get(model_name)
+        if cache is None:
+            cache = g15cache.LRUCache(max_cost = max_bytes, cost_function = _get_raster_cost)
+            _raster_caches[model_name] = cache
+        elif cache.max_cost != max_bytes:
+            cache.set_limits(max_cost = max_bytes)
+        return cache
+    finally:
+        _raster_caches_lock.release()
+        
+def _get_raster_cost(entry):
+    render, raster = entry
+    surface = raster[2]
+    xml_bytes = len(raster[1])
+    cost = surface.get_stride() * surface.get_height() + xml_bytes
+    
+    # The render keeps the processed document and its compiled template as
+    # well, which hold about as much text as the serialized document
+    if render.document is not None:
+        cost += xml_bytes + sum(1 for __ in render.document.iter()) * DOCUMENT_ELEMENT_BYTES
+    if render.template is not None:
+        cost += xml_bytes
+    return cost
+
 # The color in SVG theme files that by default gets replaced with the current 'highlight' color
 DEFAULT_HIGHLIGHT_COLOR="#ff0000"
 
@@ -139,12 +218,120 @@ def get_themes(model_id, plugin_module):
     return themes
             
 class Render(object):
-    def __init__(self, document, properties, text_boxes, attributes, processing_result):
+    def __init__(self, document, properties, text_boxes, attributes, processing_result, image_boxes = []):
         self.document = document
         self.properties = properties
         self.text_boxes = text_boxes
+        self.image_boxes = image_boxes
         self.attributes = attributes
         self.processing_result = processing_result
+        self.template = None
+        self.xml = None
+        
+    def invalidate(self):
+        """
+        Discard the compiled template, should be called whenever the processed
+        document is changed after it was created (e.g. by scrolling)
+        """
+        self.template = None
+        self.xml = None
+        
+class CompiledTemplate(object):
+    """
+    A processed SVG document that has been serialized once and split into its
+    literal fragments and the ${property} placeholders found between them.
+    Substituting properties for each frame is then a single join, and only
+    the properties the document actually references are encoded.
+    """
+    
+    def __init__(self, xml):
+        self.parts = []
+        self.slots = []
+        self.keys = set()
+        pos = 0
+        for match in Template.pattern.finditer(xml):
+            key = match.group("named") or match.group("braced")
+            if key is None and match.group("escaped") is None:
+                # Invalid placeholder, safe_substitute() leaves these alone
+                continue
+            self.parts.append(xml[pos:match.start()])
+            if key is None:
+                self.parts.append(Template.delimiter)
+            else:
+                self.slots.append((len(self.parts), key, match.group()))
+                self.parts.append(None)
+                self.keys.add(key)
+            pos = match.end()
+        self.parts.append(xml[pos:])
+        
+    def substitute(self, properties):
+        """
+        Get the document text with all known placeholders replaced by their 
+        XML encoded property values. Unknown placeholders are left as is.
+        
+        Keyword arguments:
+        properties    -- theme properties
+        """
+        parts = list(self.parts)
+        for index, key, placeholder in self.slots:
+            if key in properties:
+                parts[index] = saxutils.escape(str(properties[key]))
+            else:
+                parts[index] = placeholder
+        return "".join(parts)
+        
+class SharedDocument(object):
+    """
+    An SVG theme file that has been parsed and processed for a driver. Any 
+    number of themes (e.g. every item in a menu) may use the same instance,
+    so the document must not be changed. Rasterised renders are also kept 
+    here, so themes with identical properties only render once.
+    """
+    
+    def __init__(self, document, bounds, structural_keys, document_keys):
+        self.document = document
+        self.bounds = bounds
+        self.structural_keys = structural_keys
+        self.document_keys = document_keys
+        self.rasters = OrderedDict()
+        self.lock = RLock()
+        
+    def get_raster(self, xml, extents):
+        """
+        Get a previously rasterised render, or None if there is none.
+        
+        Keyword arguments:
+        xml        -- document text that was rendered
+        extents    -- area that was rendered
+        """
+        self.lock.acquire()
+        try:
+            key = ( xml, extents )
+            surface = self.rasters.pop(key, None)
+            if surface is not None:
+                # Most recently used goes to the end
+                self.rasters[key] = surface
+            return surface
+        finally:
+            self.lock.release()
+            
+    def add_raster(self, xml, extents, surface):
+        """
+        Keep a rasterised render, discarding the least recently used if there
+        are too many.
+        
+        Keyword arguments:
+        xml        -- document text that was rendered
+        extents    -- area that was rendered
+        surface    -- rendered surface
+        """
+        self.lock.acquire()
+        try:
+            self.rasters[( xml, extents )] = surface
+            while len(self.rasters) > MAX_SHARED_RASTERS:
+                self.rasters.popitem(last = False)
+        finally:
+            self.lock.release()
         
 class ScrollState(object):
     
@@ -198,6 +385,17 @@ class VerticalWrapScrollState(ScrollState):
     def transform_elements(self):
         self.text_box.base = self.val
 
+class ImageBox(object):
+    """
+    An image property that is painted directly over the rendered SVG instead
+    of being embedded in the document
+    """
+    def __init__(self, surface, matrix, bounds, scale_to_fit):
+        self.surface = surface
+        self.matrix = matrix
+        self.bounds = bounds
+        self.scale_to_fit = scale_to_fit
+        
 class TextBox(object):
     def __init__(self):
         self.bounds = ( )
@@ -304,7 +502,10 @@ class Component(object):
         return self.showing
     
     def set_showing(self, showing):
-        self.showing = showing
+        if showing != self.showing:
+            self.showing = showing
+            if self.parent is not None:
+                self.parent._layout_changed()
         
     def get_showing_count(self):
         i = 0
@@ -337,17 +538,53 @@ class Component(object):
             theme._set_component(self)
             self.view_bounds = theme.bounds
             for c in self.get_children():
-                c.configure(self)
+                self._configure_child(c)
+            if self.parent is not None:
+                self.parent._layout_changed(self)
         finally:
             self.get_tree_lock().release()
         
     def mark_dirty(self):
-        if self.theme is not None:
-            self.theme.mark_dirty()
-        for c in self.get_children():
-            c.mark_dirty()
-            if c.scrollbar is not None:
-                c.scrollbar.mark_dirty()
+        self._mark_dirty()
+        self.add_damage()
+        
+    def add_damage(self):
+        """
+        Record the area of the page this component occupies as damaged, so a
+        subsequent damage only redraw of the page will repaint it.
+        """
+        root = self.get_root()
+        if root is not None and hasattr(root, "add_damage_rect"):
+            root.add_damage_rect(self.get_absolute_bounds())
+            
+    def get_absolute_bounds(self):
+        """
+        Get the area of the page (x, y, width, height) this component paints in,
+        clipped to the bounds of all of its ancestors. None is returned if the
+        bounds are not known.
+        """
+        chain = []
+        c = self
+        while c is not None:
+            chain.insert(0, c)
+            c = c.parent
+        x = 0
+        y = 0
+        clip = None
+        for c in chain:
+            if c.view_bounds:
+                x += c.view_bounds[0]
+                y += c.view_bounds[1]
+                bounds = ( x, y, c.view_bounds[2], c.view_bounds[3] )
+                clip = bounds if clip is None else g15cairo.intersect_rect(clip, bounds)
+                if clip is None:
+                    # Entirely clipped by an ancestor
+                    return ( x, y, 0, 0 )
+            elif c == self:
+                return None
+            if c != self:
+                y -= c.base
+        return clip
         
     def get_allow_scrolling(self):
         c = self
@@ -358,14 +595,15 @@ class Component(object):
         return True
     
     def do_scroll(self):
-        for c in self._children:
+        for c in self._get_active_children():
             c.do_scroll()
         if self.theme and self.get_allow_scrolling():
-            self.theme.do_scroll()
+            if self.theme.do_scroll():
+                self.add_damage()
     
     def check_for_scroll(self):
         scroll = False
-        for c in self._children:
+        for c in self._get_active_children():
             if c.check_for_scroll():
                 scroll = True
         if self.theme and self.get_allow_scrolling() and self.theme.is_scroll_required():
@@ -404,7 +642,7 @@ class Component(object):
         return self.child_map[id] if id in self.child_map else None
         
     def contains_child(self, child):
-        return child in self._children
+        return child is not None and self.child_map.get(child.id) is child
         
     def get_child_count(self):
         return len(self._children)
@@ -438,7 +676,7 @@ class Component(object):
             if child.id in self.child_map:
                 raise Exception("Child with ID of %s already exists in component %s. Trying to add %s, but %s exists" % (child.id, self.id, str(child), str(self.child_map[child.id])))
             self._check_has_parent()
-            child.configure(self)
+            self._configure_child(child)
             self.child_map[child.id] = child
             if index == -1:
                 self._children.append(child)
@@ -494,9 +732,9 @@ class Component(object):
         if theme == None:
             logger.warning("No theme for component with ID of %s", self.id)
         else:
-            self.view_element = theme.get_element(self.id) 
+            self.view_element = theme._find_element(self.id) 
             if self.view_element is None:
-                self.view_element = theme.get_element()
+                self.view_element = theme._find_element()
             self.view_bounds  = g15svg.get_actual_bounds(self.view_element) if self.view_element is not None else None
         
     def is_visible(self):
@@ -557,17 +795,7 @@ class Component(object):
                 self.paint_theme(canvas, properties, self.get_theme_attributes())
                 canvas.restore()
                 
-            # Layout any children
-            if self.layout_manager != None:
-                self.layout_manager.layout(self)
-                
-            # Paint children
-            for c in self._children:
-                if c.is_showing():
-                    canvas.save()
-                    if not self.do_clip or c.view_bounds is None or self.overlaps(self.view_bounds, c.view_bounds):
-                        c.paint(canvas)
-                    canvas.restore()
+            self._paint_children(canvas)
             
             canvas.restore()
         finally:
@@ -602,6 +830,47 @@ class Component(object):
     '''
     Private
     '''
+    def _mark_dirty(self):
+        if self.theme is not None:
+            self.theme.mark_dirty()
+        for c in list(self._get_active_children()):
+            c._mark_dirty()
+            if c.scrollbar is not None:
+                c.scrollbar._mark_dirty()
+                
+    def _paint_children(self, canvas):
+        # Layout any children
+        if self.layout_manager != None:
+            self.layout_manager.layout(self)
+            
+        # Paint children
+        for c in self._children:
+            if c.is_showing():
+                canvas.save()
+                if not self.do_clip or c.view_bounds is None or self.overlaps(self.view_bounds, c.view_bounds):
+                    c.paint(canvas)
+                canvas.restore()
+                
+    def _configure_child(self, child):
+        child.configure(self)
+        
+    def _get_active_children(self):
+        """
+        Get the children that have been configured and so may need to be
+        marked dirty or scrolled.
+        """
+        return self._children
+                
+    def _layout_changed(self, child = None):
+        """
+        Called when a child has been shown or hidden, or when a child's theme
+        has changed (and so possibly its size).
+        
+        Keyword arguments:
+        child        -- child whose theme changed, or None
+        """
+        pass
+        
     def _check_has_parent(self):
 #        if not self.parent:
 #            raise Exception("%s must be added to a parent before children can be added to it." % self.id)
@@ -645,6 +914,8 @@ class G15Page(Component):
         self.theme_attributes_callback = theme_attributes_callback
         self.screen = screen
         self.scroll_lock = RLock()
+        self.damage = []
+        self.damage_lock = RLock()
         self.focused_component = None
         self.text_handler = g15text.new_text(screen)
         if theme:
@@ -660,10 +931,44 @@ class G15Page(Component):
         if not self.focused_component and component.focusable:
             self.next_focus(False)  
             
-    def redraw(self, queue = True):
+    def redraw(self, queue = True, damaged_only = False):
         screen = self.get_screen()
         if screen:
-            screen.redraw(self, queue)
+            screen.redraw(self, queue = queue, damaged_only = damaged_only)
+            
+    def add_damage_rect(self, rect):
+        """
+        Record an area of this page (x, y, width, height) that has changed since
+        it was last painted. None indicates the whole page has changed. Pages
+        that are not visible are not painted, so once too many areas have been
+        recorded the whole page is treated as damaged instead.
+        
+        Keyword arguments:
+        rect        -- damaged area
+        """
+        self.damage_lock.acquire()
+        try:
+            if self.damage == [ None ]:
+                return
+            if rect is None or len(self.damage) >= MAX_DAMAGE_RECTS:
+                self.damage = [ None ]
+            else:
+                self.damage.append(rect)
+        finally:
+            self.damage_lock.release()
+            
+    def take_damage(self):
+        """
+        Get and clear the list of damaged areas recorded since this was last
+        called.
+        """
+        self.damage_lock.acquire()
+        try:
+            damage = self.damage
+            self.damage = []
+            return damage
+        finally:
+            self.damage_lock.release()
             
     def next_focus(self, redraw = True):
         focus_list = self._add_to_focus_list(self, [])
@@ -806,7 +1111,7 @@ class G15Page(Component):
         try:
             self.do_scroll()
             self.theme_scroll_timer = None
-            self.redraw()
+            self.redraw(damaged_only = True)
         finally:
             self.scroll_lock.release()
             
@@ -919,7 +1224,16 @@ class Scrollbar(Component):
         self._configure_track_and_bounds(theme, element)
 
 class Menu(Component):
-    def __init__(self, component_id):
+    def __init__(self, component_id, virtual = False):
+        """
+        Constructor
+        
+        Keyword arguments:
+        component_id    -- component ID
+        virtual         -- only configure (and so create themes for) the items
+                           that are in view. Recommended for menus that may have
+                           a lot of items
+        """
         Component.__init__(self, component_id)
         self.selected = None
         self.on_selected = None
@@ -928,6 +1242,18 @@ class Menu(Component):
         self.do_clip = True
         self.layout_manager = GridLayoutManager(1)
         self.scroll_timer = None
+        self.virtual = virtual
+        self.scroll_values = ( 0, 0, 0 )
+        
+        # Y position of each item (and the total height at the end), and the index of each item 
+        self._offsets = None
+        self._indexes = None
+        
+        # Heights of items that have been configured at some point (virtual menus only)
+        self._heights = {}
+        self._item_height = None
+        self._configured = set()
+        self._centre_pending = False
         
     def set_scrollbar(self, scrollbar):
         scrollbar.values_callback = self.get_scroll_values
@@ -936,13 +1262,19 @@ class Menu(Component):
     def select_last_item(self):
         c = self.get_child_count()
         if c > 0:
-            self.set_selected_item(self.get_children()[c - 1])
+            self.set_selected_item(self.get_child(c - 1))
         
     def set_selected_item(self, item):
         i = self.index_of_child(item)
         if i >= 0:
             self.i = i
             self._do_selected()
+            
+    def index_of_child(self, child):
+        i = self._get_indexes().get(child)
+        if i is None:
+            raise ValueError("%s is not a child of %s" % (child, self.id))
+        return i
         
     def add_separator(self):
         self.add_child(MenuSeparator())
@@ -953,6 +1285,10 @@ class Menu(Component):
     def on_configure(self):        
         menu_theme = self.load_theme()
         if menu_theme:
+            # Item heights may be different in the new theme
+            self._heights = {}
+            self._item_height = None
+            self._layout_changed()
             self.set_theme(menu_theme)
             
     def configure(self, parent):
@@ -970,36 +1306,33 @@ class Menu(Component):
     
     def add_child(self, child, index = -1):
         Component.add_child(self, child, index)
-        self.select_first()
-        self._recalc_scroll_values()
-        self.centre_on_selected()
+        self._child_added(child, index)
+        self._contents_changed()
     
     def remove_child(self, child):
         Component.remove_child(self, child)
-        self.select_first()
-        self._recalc_scroll_values()
-        self.centre_on_selected()
+        self._configured.discard(child)
+        self._heights.pop(child, None)
+        self._layout_changed()
+        self._contents_changed()
     
     def set_children(self, children):
         was_selected = self.selected
         Component.set_children(self, children)
-        if was_selected in self.get_children():
+        self._layout_changed()
+        if self.contains_child(was_selected):
             self.selected = was_selected
         else:
             self.select_first()
         self.centre_on_selected()
             
     def centre_on_selected(self):
-        y = 0
-        c = self.get_children()
-        for r in range(0, self._get_selected_index()):
-            if c[r].is_showing():
-                y += self.get_item_height(c[r], True)
-        self.base = max(0, y - ( self.view_bounds[3] / 2 ))
-        self._recalc_scroll_values()
+        self._centre()
         self.get_root().redraw()
         
     def get_scroll_values(self):
+        if self._centre_pending:
+            self._centre()
         return self.scroll_values
         
     def get_item_height(self, item, group = False):
@@ -1014,18 +1347,14 @@ class Menu(Component):
         self.get_tree_lock().acquire()
         try:    
             
-            self.select_first()                 
+            self.select_first()
+            if self._centre_pending:
+                self._centre()
             
             # Get the Y position of the selected item
-            y = 0 
             selected_y = -1
-            for item in self.get_children():
-                # Only include items that are "showing"
-                if item.is_showing():
-                    ih = self.get_item_height(item, True)
-                    if item == self.selected:
-                        selected_y = y
-                    y += ih
+            if self.selected != None and self.contains_child(self.selected):
+                selected_y = self._get_offsets()[self.index_of_child(self.selected)]
                     
             new_base = self.base
                     
@@ -1034,7 +1363,7 @@ class Menu(Component):
                 
             # If the position of the selected item is offscreen below, change the offset so it is just visible
             if self.selected != None:
-                ih = self.get_item_height(self.selected, True)
+                ih = self._get_height(self.selected)
                 if selected_y >= new_base + v_space - ih:
                     new_base = ( selected_y + ih ) - v_space
                 # If the position of the selected item is offscreen above base, change the offset so it is just visible
@@ -1067,10 +1396,10 @@ class Menu(Component):
     def get_items_per_page(self):
         self.get_tree_lock().acquire()
         try:
-            total_size = 0
-            for item in self.get_children():
-                total_size += self.get_item_height(item, True)            
-            avg_size = total_size / self.get_child_count()
+            count = self.get_child_count()
+            if count == 0:
+                return 0
+            avg_size = max(1, self._get_offsets()[-1] / count)
             return int(self.view_bounds[3] / avg_size)
         finally:
             self.get_tree_lock().release()
@@ -1144,15 +1473,172 @@ class Menu(Component):
     '''
     
     def _recalc_scroll_values(self):
-        max_val = 0
-        for item in self.get_children():
-            if item.is_showing():
-                max_val += self.get_item_height(item, True)
-                
+        max_val = self._get_offsets()[-1]
         self.scroll_values = max(max_val, self.view_bounds[3]), self.view_bounds[3], self.base
+        
+    def _centre(self):
+        self._centre_pending = False
+        i = self._get_selected_index()
+        y = self._get_offsets()[i] if i > 0 else 0
+        self.base = max(0, y - ( self.view_bounds[3] / 2 ))
+        self._recalc_scroll_values()
+        
+    def _contents_changed(self):
+        self.select_first()
+        if self.virtual:
+            # Adding or removing lots of items is common, so wait until the next paint
+            self._centre_pending = True
+            self.get_root().redraw()
+        else:
+            self._recalc_scroll_values()
+            self.centre_on_selected()
+            
+    def _child_added(self, child, index):
+        if index == -1 and self._offsets is not None:
+            h = self._get_height(child) if child.is_showing() else 0
+            # Measuring the item may have changed the layout
+            if self._offsets is not None:
+                self._indexes[child] = len(self._offsets) - 1
+                self._offsets.append(self._offsets[-1] + h)
+                return
+        self._layout_changed()
+        
+    def _layout_changed(self, child = None):
+        if child is not None and self._offsets is not None:
+            i = self._indexes.get(child)
+            if i is not None and self._offsets[i + 1] - self._offsets[i] == ( self._get_height(child) if child.is_showing() else 0 ):
+                # Same size, nothing has moved
+                return
+        self._offsets = None
+        self._indexes = None
+        
+    def _get_indexes(self):
+        if self._indexes is None:
+            self._get_offsets()
+        return self._indexes
+        
+    def _get_offsets(self):
+        """
+        Get the Y position of every item, followed by the total height of all
+        items. Items that are not showing have no height.
+        """
+        if self._offsets is None:
+            offsets = [ 0 ]
+            indexes = {}
+            y = 0
+            for i, item in enumerate(self._children):
+                indexes[item] = i
+                if item.is_showing():
+                    y += self._get_height(item)
+                offsets.append(y)
+            self._offsets = offsets
+            self._indexes = indexes
+        return self._offsets
+        
+    def _get_height(self, item):
+        if self.virtual and item.theme is None:
+            h = self._heights.get(item)
+            return h if h is not None else self._estimate_height()
+        return self.get_item_height(item, True)
+    
+    def _estimate_height(self):
+        """
+        Get the height to use for items in a virtual menu that have never been
+        configured. This is the height of the first showing item.
+        """
+        if self._item_height is None:
+            for item in self._children:
+                if item.is_showing():
+                    if item.theme is None and not self._configure_item(item):
+                        break
+                    self._item_height = self.get_item_height(item, True)
+                    return self._item_height
+            return 10
+        return self._item_height
+        
+    def _configure_child(self, child):
+        if not self.virtual:
+            Component._configure_child(self, child)
+        else:
+            # Items are configured when they come into view
+            self._release_item(child)
+            child.parent = self
+            
+    def _configure_item(self, item):
+        if self.get_theme() is None:
+            return False
+        item.configure(self)
+        self._configured.add(item)
+        self._heights[item] = self.get_item_height(item, True)
+        return True
+    
+    def _release_item(self, item):
+        """
+        Release the theme of an item in a virtual menu, leaving just the item
+        itself (and its height)
+        """
+        if item.theme is not None:
+            item.theme._component_removed()
+            item.theme = None
+        item.view_element = None
+        item.view_bounds = None
+        self._configured.discard(item)
+        
+    def _get_active_children(self):
+        if self.virtual:
+            return list(self._configured)
+        return Component._get_active_children(self)
+        
+    def _paint_children(self, canvas):
+        if not self.virtual:
+            Component._paint_children(self, canvas)
+            return
+        
+        # Configure the items in view first, they may turn out to be a different size
+        for i in self._get_visible_range():
+            item = self._children[i]
+            if item.theme is None and item.is_showing():
+                self._configure_item(item)
+        
+        first = -1
+        last = -1
+        offsets = self._get_offsets()
+        for i in self._get_visible_range():
+            item = self._children[i]
+            if not item.is_showing():
+                continue
+            if item.theme is None and not self._configure_item(item):
+                continue
+            if first == -1:
+                first = i
+            last = i
+            bounds = item.view_bounds
+            if bounds is None:
+                logger.warning("No bounds on component %s", item.id)
+                continue
+            item.view_bounds = ( 0, offsets[i], bounds[2], bounds[3] )
+            canvas.save()
+            item.paint(canvas)
+            canvas.restore()
+            
+        # Keep the themes of items up to a page either side of the view, release the rest
+        if first > -1:
+            page = last - first + 1
+            indexes = self._get_indexes()
+            for item in list(self._configured):
+                if item != self.selected and item.get_child_count() == 0:
+                    i = indexes.get(item)
+                    if i is None or i < first - page or i > last + page:
+                        self._release_item(item)
+                        
+    def _get_visible_range(self):
+        offsets = self._get_offsets()
+        start = max(0, bisect.bisect_right(offsets, self.base) - 1)
+        end = bisect.bisect_left(offsets, self.base + self.view_bounds[3], start)
+        return range(start, min(end, len(self._children)))
     
     def _check_selected(self):
-        if not self.selected in self.get_children():
+        if not self.contains_child(self.selected):
             if self.i >= self.get_child_count():
                 return
             self.selected = self.get_child(self.i)
@@ -1167,9 +1653,8 @@ class Menu(Component):
         self.get_root().redraw()
         
     def _get_selected_index(self):
-        c = self.get_children()
-        if not self.selected in c:
-            return 0 if len(c) > 0 else -1
+        if not self.contains_child(self.selected):
+            return 0 if self.get_child_count() > 0 else -1
         else:
             return self.index_of_child(self.selected)
         
@@ -1457,6 +1942,15 @@ class G15Theme(object):
         self.component = None
         self.auto_dirty = auto_dirty
         self.render = None
+        self.raster = None
+        self.raster_cache_enabled = CACHE_RASTER
+        self.raster_token = object()
+        self.shared = None
+        self.document_shared = False
+        self.structural_keys = set()
+        self.document_keys = set()
+        self.document_keys_stale = False
+        self.render_statistics = { "draws" : 0, "processed" : 0, "substituted" : 0, "rasterised" : 0, "skipped" : 0, "cached" : 0 }
         self.scroll_state = {}
         self.nsmap = {
             'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
@@ -1500,6 +1994,8 @@ class G15Theme(object):
                 self.page.on_shown_listeners.append(self._page_visibility_changed)
                 self.page.on_hidden_listeners.append(self._page_visibility_changed)
                 
+            self.shared = None
+            self.document_shared = False
             if self.page is None:
                 self.document = None
                 self.screen = None
@@ -1529,8 +2025,13 @@ class G15Theme(object):
                     actual_variant = os.path.splitext(os.path.basename(path))[0]
                     self.translation = g15locale.get_translation(actual_variant, self.dir)
                     
-                    self.document = etree.parse(path)
-                    
+                    if self.instance is None:
+                        # Nothing else should change the document, so it may be shared
+                        self.shared = self._get_shared_document(path)
+                        self.document = self.shared.document
+                        self.document_shared = True
+                    else:
+                        self.document = etree.parse(path)
                         
                     # Give the python portion of the theme chance to initialize
                     if self.instance is not None and hasattr(self.instance, 'create'):
@@ -1544,8 +2045,14 @@ class G15Theme(object):
                 else:
                     raise Exception("Must either supply theme directory or SVG text")
                     
-                self.process_svg()
-                self.bounds = g15svg.get_bounds(self.document.getroot())
+                if self.shared is not None:
+                    self.bounds = self.shared.bounds
+                    self.structural_keys = self.shared.structural_keys
+                    self.document_keys = self.shared.document_keys
+                else:
+                    self._process_document()
+            self.raster = None
+            self.raster_token = object()
         finally:
             self.render_lock.release()
         
@@ -1671,28 +2178,66 @@ class G15Theme(object):
 
     def get_element(self, element_id = None, root = None):
         if root == None:
-            root = self.document.getroot()
-        if element_id is None:
-            return root
-        els = root.xpath('//svg:*[@id=\'%s\']' % str(element_id),namespaces=self.nsmap)
-        return els[0] if len(els) > 0 else None
+            # The caller may change the element, so the theme needs its own document
+            root = self._get_own_document().getroot()
+        return self._find_element(element_id, root)
 
     def get_element_by_tag(self, tag, root = None):
         if root == None:
-            root = self.document.getroot()
+            root = self._get_own_document().getroot()
         els = root.xpath('svg:%s' % str(tag),namespaces=self.nsmap)
         return els[0] if len(els) > 0 else None
     
     def mark_dirty(self):
         self.dirty = True
             
+    def get_render_statistics(self):
+        """
+        Get a dictionary of counters showing how much work drawing this theme
+        has needed. "draws" is the total number of draws, "processed" how many
+        processed the document again, "substituted" how many substituted the
+        placeholders, "rasterised" how many rendered the SVG, "skipped" how
+        many had no changes to any property the document references, so the 
+        last rasterised render was reused, and "cached" how many were a state
+        already in the raster cache.
+        """
+        return dict(self.render_statistics)
+            
     def draw(self, canvas, properties = {}, attributes = {}):
+        self.render_statistics["draws"] += 1
         if self.render != None and self.auto_dirty:
-            if self.render.properties != properties or self.render.attributes != attributes or \
-               self.render.properties.values() != properties.values() or self.render.attributes.values() != attributes.values():
+            if self.render.attributes != attributes or self.render.attributes.values() != attributes.values():
                 self.dirty = True
+            else:
+                changed = self._get_changed_keys(self.render.properties, properties)
+                if self._is_structural_change(changed):
+                    self.dirty = True
+                elif len(changed) > 0:
+                    # Only placeholder values changed, these are substituted at render time
+                    self.render.xml = None
+                    
+                # The python portion of the theme may use any property when painting the foreground.
+                # Pages may change their properties in place, so keep a copy to compare against
+                self.render.properties = dict(properties)
+                
+        # A state that has been seen before may still be in the raster cache
+        fingerprint = None
+        cached = None
+        if self.render == None or self.dirty or self.render.xml is None:
+            fingerprint = self._get_fingerprint(properties, attributes)
+            if fingerprint is not None:
+                cached = self._get_raster_cache().get(fingerprint)
+                if cached is not None:
+                    render, raster = cached
+                    render.properties = dict(properties)
+                    render.xml = raster[1]
+                    self.render = render
+                    self.raster = raster
+                    self.dirty = False
+                    self.render_statistics["cached"] += 1
         
         if self.render == None or self.dirty:
+            self.render_statistics["processed"] += 1
             self.render_lock.acquire()
             
             if self.document is None:
@@ -1718,7 +2263,8 @@ class G15Theme(object):
                 self._process_components(root)
                 self._set_progress_bars(root, properties) 
                 self._set_relative_image_paths(root)
-                self._convert_image_urls(root, properties)
+                image_boxes = []
+                self._convert_image_urls(root, properties, image_boxes)
                 self._do_shadow("shadow", self.screen.driver.get_color_as_hexrgb(g15driver.HINT_BACKGROUND, (255, 255,255)), root)
                 self._do_shadow("reverseshadow", self.screen.driver.get_color_as_hexrgb(g15driver.HINT_FOREGROUND, (0, 0, 0)), root)
                 self._set_highlight_color(root)
@@ -1742,7 +2288,7 @@ class G15Theme(object):
                     
                 self._set_default_style(root)
                     
-                self.render = Render(document, properties, text_boxes, attributes, processing_result)
+                self.render = Render(document, dict(properties), text_boxes, attributes, processing_result, image_boxes)
                 self.dirty = False
             finally:
                 self.render_lock.release()
@@ -1750,6 +2296,10 @@ class G15Theme(object):
             self.text.set_canvas(canvas)
             
         self._render_document(canvas, self.render)
+        if fingerprint is not None and cached is None and not self.is_scroll_required():
+            raster = self.raster
+            if raster is not None and raster[1] is self.render.xml:
+                self._get_raster_cache().put(fingerprint, ( self.render, raster ))
         return self.render.document
             
     def is_scroll_required(self):
@@ -1761,6 +2311,8 @@ class G15Theme(object):
             if len(self.scroll_state) > 0:
                 for key in self.scroll_state:
                     self.scroll_state[key].next()
+                if self.render is not None:
+                    self.render.invalidate()
                 return True
         finally:
             self.render_lock.release()
@@ -1769,6 +2321,198 @@ class G15Theme(object):
     Private
     """
     
+    def _find_element(self, element_id = None, root = None):
+        """
+        Find an element without taking a copy of a shared document, so the
+        element must not be changed.
+        """
+        if root == None:
+            root = self.document.getroot()
+        if element_id is None:
+            return root
+        els = root.xpath('//svg:*[@id=\'%s\']' % str(element_id),namespaces=self.nsmap)
+        return els[0] if len(els) > 0 else None
+    
+    def _get_own_document(self):
+        self.render_lock.acquire()
+        try:
+            if self.document_shared:
+                self.document = deepcopy(self.document)
+                self.document_shared = False
+                
+            # The caller may add or remove placeholders, or change anything else
+            self.document_keys_stale = True
+            self.raster_token = object()
+            return self.document
+        finally:
+            self.render_lock.release()
+            
+    def _process_document(self):
+        self.process_svg()
+        self.bounds = g15svg.get_bounds(self.document.getroot())
+        self.structural_keys = self._get_structural_keys(self.document.getroot())
+        self.document_keys = CompiledTemplate(etree.tostring(self.document)).keys
+        self.document_keys_stale = False
+    
+    def _get_shared_document(self, path):
+        """
+        Get the shared, processed document for an SVG file, loading it if this
+        is the first theme to use it for this driver (or the file has changed).
+        
+        Keyword arguments:
+        path        -- path of SVG file
+        """
+        key = ( path, os.path.getmtime(path), self.driver.id, self.driver.get_model_name(), 
+                self.driver.get_bpp(), self.screen.service.disable_svg_glow )
+        _shared_documents_lock.acquire()
+        try:
+            if key in _shared_documents:
+                return _shared_documents[key]
+            
+            # Forget earlier versions of the same file
+            for old_key in [ k for k in _shared_documents if k[0] == path and k[1] != key[1] ]:
+                del _shared_documents[old_key]
+                
+            self.document = etree.parse(path)
+            self._process_document()
+            shared = SharedDocument(self.document, self.bounds, self.structural_keys, self.document_keys)
+            _shared_documents[key] = shared
+            return shared
+        finally:
+            _shared_documents_lock.release()
+    
+    def _get_structural_keys(self, root):
+        """
+        Get the property keys that change the structure of the processed document,
+        i.e. those used for deletes, progress bars, images and measured text. Changes
+        to any other property only require the placeholders to be substituted again.
+        
+        Keyword arguments:
+        root        -- root of document
+        """
+        keys = set()
+        for element in root.xpath('//svg:*[@title]',namespaces=self.nsmap):
+            args = element.get("title").split(" ")
+            if args[0] == "del" and len(args) > 1:
+                keys.add(args[1][1:] if args[1].startswith("!") else args[1])
+        for element in root.xpath('//svg:image[@title]',namespaces=self.nsmap):
+            keys.add(element.get("title"))
+        for element in root.xpath('//svg:rect[@class=\'progress\']',namespaces=self.nsmap):
+            id = element.get("id")
+            if id and id.endswith("_progress"):
+                keys.add(id[:-9])
+        for element in root.xpath('//svg:rect[@class=\'textbox\']',namespaces=self.nsmap):
+            keys.add(element.get("id"))
+        for element in root.xpath('//svg:text[@clip-path]',namespaces=self.nsmap):
+            for text in element.itertext():
+                keys.update(CompiledTemplate(text).keys)
+        return keys
+    
+    def _is_processed_externally(self):
+        """
+        Get if anything other than the theme itself may manipulate the document
+        when it is processed, in which case it may depend on any property.
+        """
+        return self.svg_processor is not None or \
+           ( self.component is not None and len(self.component.child_map) > 0 ) or \
+           ( self.instance is not None and ( hasattr(self.instance, 'process_svg') or \
+                                             hasattr(self.instance, 'paint_background') ) )
+    
+    def _get_changed_keys(self, old_properties, new_properties):
+        """
+        Get the set of keys of the properties referenced by the document that 
+        differ between two sets of properties. Properties the document does not
+        reference (such as the key_ properties for every key pressed) are 
+        ignored. If the document may depend on any property, all keys are
+        compared.
+        
+        Keyword arguments:
+        old_properties    -- properties of the last render
+        new_properties    -- properties about to be rendered
+        """
+        if self._is_processed_externally():
+            keys = set(old_properties) | set(new_properties)
+        else:
+            keys = self._get_referenced_keys()
+            if self.render is not None and self.render.template is not None:
+                keys = keys | self.render.template.keys
+        changed = set()
+        missing = ( None, )
+        for key in keys:
+            old_value = old_properties.get(key, missing)
+            new_value = new_properties.get(key, missing)
+            if old_value != new_value or type(old_value) != type(new_value):
+                changed.add(key)
+        return changed
+    
+    def _get_referenced_keys(self):
+        """
+        Get the keys of the properties referenced by the document, either as
+        placeholders or by the processing the theme does itself.
+        """
+        if self.document_keys_stale:
+            self.document_keys = CompiledTemplate(etree.tostring(self.document)).keys
+            self.document_keys_stale = False
+        return self.structural_keys | self.document_keys
+    
+    def _get_fingerprint(self, properties, attributes):
+        """
+        Get the key in the raster cache for the render of a set of properties
+        and attributes, or None if the render may not be cached. Only the 
+        properties the document references are used, along with the colors 
+        the document is processed with.
+        
+        Keyword arguments:
+        properties    -- theme properties
+        attributes    -- theme attributes
+        """
+        if not self.raster_cache_enabled or not CACHE_RASTER or self._is_processed_externally() or \
+           self.is_scroll_required():
+            return None
+        keys = sorted(self._get_referenced_keys())
+        driver = self.screen.driver
+        try:
+            fingerprint = ( self.raster_token,
+                            tuple([ ( key, type(properties[key]), properties[key] ) for key in keys if key in properties ]),
+                            tuple(sorted(attributes.items())),
+                            driver.get_color_as_hexrgb(g15driver.HINT_HIGHLIGHT, (255, 0, 0 )),
+                            driver.get_color_as_hexrgb(g15driver.HINT_FOREGROUND, (0, 0, 0)),
+                            driver.get_color_as_hexrgb(g15driver.HINT_BACKGROUND, (255, 255, 255)) )
+            hash(fingerprint)
+            return fingerprint
+        except TypeError:
+            # A property or attribute that cannot be a key, e.g. a list
+            return None
+        
+    def _get_raster_cache(self):
+        """
+        Get the raster cache for this theme's model, which may hold rasterised
+        renders totalling RASTER_CACHE_BUDGETS bytes for the model, or the size
+        of a number of full screen renders (see the raster_cache_frames setting).
+        """
+        model_name = self.driver.get_model_name()
+        max_bytes = RASTER_CACHE_BUDGETS.get(model_name)
+        if max_bytes is None:
+            frames = getattr(self.screen.service, "raster_cache_frames", DEFAULT_RASTER_CACHE_FRAMES)
+            width, height = self.driver.get_size()
+            max_bytes = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width) * height * frames
+        return _get_raster_cache(model_name, max_bytes)
+    
+    def _is_structural_change(self, changed_keys):
+        """
+        Get if a change to properties requires the document to be processed 
+        again. This is always the case if anything other than the theme itself
+        may manipulate the document.
+        
+        Keyword arguments:
+        changed_keys      -- keys of the properties that changed (see _get_changed_keys)
+        """
+        if len(changed_keys) == 0:
+            return False
+        if self._is_processed_externally():
+            return True
+        return not self.structural_keys.isdisjoint(changed_keys)
+    
     def _process_components(self, root):
         """
         Find all elements that are associated with child components in the component this
@@ -1859,21 +2603,30 @@ class G15Theme(object):
                 href = os.path.join(self.dir, href)
                 element.set("{http://www.w3.org/1999/xlink}href", href)
     
-    def _convert_image_urls(self, root, properties):
+    def _convert_image_urls(self, root, properties, image_boxes):
         """
         Inserts either a local file URL or an embedded image URL into all
         elements that have 'title' attribute whose value exists as a property
-        in the theme properties.
+        in the theme properties. Image surfaces that can be painted directly
+        are removed from the document and added to the list of image boxes
+        instead, so they do not need to be encoded as PNG for every render.
         
         Keyword arguments:
         root        -- root of document
         properties  -- theme properties
+        image_boxes -- list to add images that will be painted directly to
         """
         for element in root.xpath('//svg:image',namespaces=self.nsmap):
             id = element.get("title")
             if id != None and id in properties and properties[id] != None:
-                file_str = StringIO()
                 val = properties[id]
+                if isinstance(val, cairo.ImageSurface):
+                    image_box = self._get_image_box(element, val, properties)
+                    if image_box is not None:
+                        image_boxes.append(image_box)
+                        element.getparent().remove(element)
+                        continue
+                file_str = StringIO()
                 if isinstance(val, str) and str(val).startswith("file:"):
                     file_str.write(val[5:])
                 elif isinstance(val, str) and str(val).startswith("/"):
@@ -1888,6 +2641,71 @@ class G15Theme(object):
                         file_str.write(val)
                 element.set("{http://www.w3.org/1999/xlink}href", file_str.getvalue())
     
+    def _get_image_box(self, element, surface, properties):
+        """
+        Get an ImageBox for an image element if painting the surface over the
+        rendered SVG would give the same result as embedding it, i.e. the image
+        is not clipped, masked, filtered, transparent, rotated or aligned other
+        than centrally, and no later rectangle or image overlaps it.
+        
+        Keyword arguments:
+        element        -- image element
+        surface        -- image surface
+        properties     -- theme properties
+        """
+        if element.get("preserveAspectRatio") not in [ None, "xMidYMid", "xMidYMid meet", "none" ]:
+            return None
+        el = element
+        while el is not None:
+            for attr in [ "clip-path", "mask", "filter", "opacity" ]:
+                if el.get(attr) is not None:
+                    return None
+            style = el.get("style")
+            if style is not None and ( "opacity" in style or "filter" in style or "clip-path" in style or "mask" in style ):
+                return None
+            el = el.getparent()
+        try:
+            matrix = g15svg.get_matrix(element)
+            if matrix is None:
+                return None
+            bounds = g15svg.get_document_bounds(element, matrix)
+            for later in element.xpath('following::svg:rect|following::svg:image', namespaces = self.nsmap):
+                title = later.get("title")
+                if later.tag == element.tag and title in properties and isinstance(properties[title], cairo.ImageSurface):
+                    # Will also be painted directly, in order
+                    continue
+                if len(later.xpath('ancestor::svg:defs|ancestor::svg:clipPath|ancestor::svg:mask|ancestor::svg:pattern', namespaces = self.nsmap)) > 0:
+                    # Not drawn where it is defined
+                    continue
+                later_bounds = g15svg.get_document_bounds(later)
+                if later_bounds is None or g15cairo.intersect_rect(bounds, later_bounds) is not None:
+                    return None
+            return ImageBox(surface, matrix, g15svg.get_bounds(element), element.get("preserveAspectRatio") != "none")
+        except Exception as e:
+            logger.debug("Could not get bounds of image, embedding it instead", exc_info = e)
+            return None
+    
+    def _paint_image_boxes(self, canvas, image_boxes):
+        for image_box in image_boxes:
+            x, y, width, height = image_box.bounds
+            surface_width = image_box.surface.get_width()
+            surface_height = image_box.surface.get_height()
+            if width <= 0 or height <= 0 or surface_width < 1 or surface_height < 1:
+                continue
+            scale_x = float(width) / surface_width
+            scale_y = float(height) / surface_height
+            if image_box.scale_to_fit:
+                scale_x = scale_y = min(scale_x, scale_y)
+            canvas.save()
+            canvas.transform(image_box.matrix)
+            canvas.rectangle(x, y, width, height)
+            canvas.clip()
+            canvas.translate(x + ( width - surface_width * scale_x ) / 2.0, y + ( height - surface_height * scale_y ) / 2.0)
+            canvas.scale(scale_x, scale_y)
+            canvas.set_source_surface(image_box.surface)
+            canvas.paint()
+            canvas.restore()
+    
     def _set_default_style(self, root):        
         """
         Set the default fill color to be the default foreground. If elements don't specify their
@@ -2058,30 +2876,53 @@ class G15Theme(object):
         pass
             
     def _render_document(self, canvas, render):
-            
-        encoded_properties = {}
-        # Encode entities in all the property values
-        for key in render.properties.keys():
-            encoded_properties[key] = saxutils.escape(str(render.properties[key]))
-                
-        xml = etree.tostring(render.document)
-        t = Template(xml)
-        xml = t.safe_substitute(encoded_properties)       
-        svg = rsvg.Handle()
-        try :
-            svg.write(xml)
-            if DEBUG_SVG:
-                print "------------------------------------------------------"
-                print xml
-                print "------------------------------------------------------"
-        except Exception as e:
-            logger.debug("Could not write SVG", exc_info = e)
-        try :
-            svg.close()
-        except Exception as e:
-            logger.debug("Could not close SVG", exc_info = e)
         
-        svg.render_cairo(canvas)
+        # The processed document is only serialized again if it has changed
+        template = render.template
+        if template is None:
+            template = CompiledTemplate(etree.tostring(render.document))
+            render.template = template
+        xml = render.xml
+        if xml is None:
+            xml = template.substitute(render.properties)
+            render.xml = xml
+            self.render_statistics["substituted"] += 1
+        
+        extents = self._get_raster_extents(canvas) if CACHE_RASTER else None
+        if extents is None:
+            self._load_svg(xml).render_cairo(canvas)
+            self.render_statistics["rasterised"] += 1
+        else:
+            self.render_lock.acquire()
+            try:
+                raster = self.raster
+                if raster is None or raster[1] != xml or \
+                   g15cairo.intersect_rect(raster[0], extents) != extents:
+                    surface = self.shared.get_raster(xml, extents) if self.shared is not None else None
+                    if surface is None:
+                        x, y, width, height = extents
+                        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+                        raster_canvas = cairo.Context(surface)
+                        raster_canvas.set_antialias(canvas.get_antialias())
+                        raster_canvas.set_font_options(canvas.get_font_options())
+                        raster_canvas.translate(-x, -y)
+                        self._load_svg(xml).render_cairo(raster_canvas)
+                        self.render_statistics["rasterised"] += 1
+                        if self.shared is not None:
+                            self.shared.add_raster(xml, extents, surface)
+                    raster = ( extents, xml, surface )
+                    self.raster = raster
+                elif raster[1] is xml:
+                    self.render_statistics["skipped"] += 1
+            finally:
+                self.render_lock.release()
+            canvas.save()
+            canvas.set_source_surface(raster[2], raster[0][0], raster[0][1])
+            canvas.paint()
+            canvas.restore()
+            
+        if len(render.image_boxes) > 0:
+            self._paint_image_boxes(canvas, render.image_boxes)
          
         if len(render.text_boxes) > 0:
             rgb = self.screen.driver.get_color_as_ratios(g15driver.HINT_FOREGROUND, ( 0, 0, 0 ))
@@ -2099,6 +2940,43 @@ class G15Theme(object):
             except Exception as e:
                 logger.debug("Error painting foreground", exc_info = e)
             
+    def _load_svg(self, xml):
+        svg = rsvg.Handle()
+        try :
+            svg.write(xml)
+            if DEBUG_SVG:
+                print "------------------------------------------------------"
+                print xml
+                print "------------------------------------------------------"
+        except Exception as e:
+            logger.debug("Could not write SVG", exc_info = e)
+        try :
+            svg.close()
+        except Exception as e:
+            logger.debug("Could not close SVG", exc_info = e)
+        return svg
+    
+    def _get_raster_extents(self, canvas):
+        """
+        Get the pixel aligned area (in user space) of the canvas that may be painted,
+        or None if the canvas is scaled or otherwise transformed such that a cached
+        rasterised render could not be blitted without changing the result.
+        
+        Keyword arguments:
+        canvas        -- canvas
+        """
+        xx, yx, xy, yy, x0, y0 = canvas.get_matrix()
+        if xx != 1 or yy != 1 or yx != 0 or xy != 0 or x0 != int(x0) or y0 != int(y0):
+            return None
+        x1, y1, x2, y2 = canvas.clip_extents()
+        x = int(math.floor(x1))
+        y = int(math.floor(y1))
+        width = int(math.ceil(x2)) - x
+        height = int(math.ceil(y2)) - y
+        if width < 1 or height < 1:
+            return None
+        return ( x, y, width, height )
+            
     def _render_text_box(self, canvas, text_box, rgb, bg_rgb):
         self._update_text(text_box, text_box.wrap)
         
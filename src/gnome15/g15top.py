@@ -21,36 +21,56 @@ is the GObject based bindings, which would be great except it means converting
 ALL of Gnome15 to use such bindings.
 
 This class is stop gap until a better solution can be found
+
+The system wide files (/proc/stat, /proc/meminfo and /proc/net/dev) are read
+by a single Sampler, which keeps them open and parses each of them once per 
+sample. The python-gtop compatible functions re-use the latest sample if it
+is recent enough, and plugins may subscribe to receive new samples at their 
+own rate.
 """
 
 import os
 import time
+import util.g15scheduler as g15scheduler
+from collections import deque
+from threading import RLock
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+How old (in seconds) a sample may be before the compatible functions (cpu(),
+mem(), netlist() and netload()) sample again. 
+"""
+MAX_SAMPLE_AGE = 0.5
+
+"""
+Number of samples kept in the history
+"""
+HISTORY_SIZE = 60
 
 class CPU():
-    def __init__(self, name):
+    def __init__(self, name, times = None):
         self.name = name
         self.user = 0
         self.nice = 0
         self.sys = 0
         self.idle = 0
+        if times is not None:
+            self.user, self.nice, self.sys, self.idle = times
 
 class CPUS(CPU):
-    def __init__(self):
+    def __init__(self, sample = None):
         CPU.__init__(self, "CPUS")
-        cpudata = open('/proc/stat')
+        if sample is None:
+            sample = get_sampler().get_sample()
         self.cpus = []
-        try:
-            for line in cpudata:
-                if line.startswith("cpu"):
-                    (name, cuse, cn, csys, idle, tail) = line.split(None, 5)
-                    cpu = self if name == "cpu" else CPU(name)
-                    self.user = int(cuse)
-                    self.nice = int(cn)
-                    self.sys = int(csys)
-                    self.idle = int(idle)
-                    self.cpus.append(cpu)
-        finally:
-            cpudata.close()
+        for name, times in sample.cpus:
+            if name == "cpu":
+                self.user, self.nice, self.sys, self.idle = times
+            else:
+                self.cpus.append(CPU(name, times))
             
 class ProcState():
     
@@ -79,24 +99,276 @@ class NetworkLoad():
         
 class Mem():
     
-    def __init__(self):
-        self.total = 0
-        self.free = 0
-        self.cached = 0
-        memdata = open('/proc/meminfo')
+    def __init__(self, sample = None):
+        if sample is None:
+            sample = get_sampler().get_sample()
+        self.total, self.free, self.cached = sample.mem
+        
+class Sample():
+    """
+    The state of the system at a point in time. 
+    """
+    
+    def __init__(self, sample_time, cpus, mem, nets):
+        """
+        Constructor
+        
+        Keyword arguments:
+        sample_time    -- time the sample was taken
+        cpus           -- list of (name, (user, nice, sys, idle)), the first being the total of all CPUs
+        mem            -- (total, free, cached) in bytes
+        nets           -- list of (name, bytes_in, bytes_out)
+        """
+        self.time = sample_time
+        self.cpus = cpus
+        self.mem = mem
+        self.nets = nets
+        self.net_map = dict([ ( n[0], n ) for n in nets ])
+        
+class ProcFile():
+    """
+    A file in /proc that is kept open and read again from the start each time 
+    it is needed, saving an open() and close() per read. os.pread() is not 
+    available on Python 2, so the descriptor is rewound instead. 
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.buffer_size = 4096
+        
+    def read(self):
+        """
+        Get the current contents of the file
+        """
         try:
-            for line in memdata:
-                if line.startswith("MemTotal"):
-                    self.total = self._get_value(line)
-                elif line.startswith("MemFree"):
-                    self.free = self._get_value(line)
-                elif line.startswith("Cached"):
-                    self.cached = self._get_value(line)
+            return self._read()
+        except OSError as e:
+            # Try once more with a new descriptor
+            logger.debug("Could not read %s, re-opening", self.path, exc_info = e)
+            self.close()
+            return self._read()
+        
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError as e:
+                logger.debug("Could not close %s", self.path, exc_info = e)
+            self.fd = None
+            
+    def _read(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, self.buffer_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        if len(chunks) > 1:
+            # Read it all at once next time
+            self.buffer_size = sum([ len(c) for c in chunks ]) * 2
+        return "".join(chunks)
+    
+class Subscription():
+    
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval
+        self.due = 0
+        
+class Sampler():
+    """
+    Reads the system wide /proc files once per sample, keeping a history of 
+    the most recent samples. 
+    """
+    
+    def __init__(self, history_size = HISTORY_SIZE):
+        """
+        Constructor
+        
+        Keyword arguments:
+        history_size    -- number of samples to keep
+        """
+        self.lock = RLock()
+        self.stat_file = ProcFile("/proc/stat")
+        self.meminfo_file = ProcFile("/proc/meminfo")
+        self.netdev_file = ProcFile("/proc/net/dev")
+        self.history = deque(maxlen = history_size)
+        self.latest = None
+        self.subscriptions = []
+        self.timer = None
+        self.samples = 0
+        
+    def get_sample(self, max_age = MAX_SAMPLE_AGE):
+        """
+        Get the latest sample if it is no older than the maximum age, otherwise
+        take a new one.
+        
+        Keyword arguments:
+        max_age        -- maximum age in seconds
+        """
+        self.lock.acquire()
+        try:
+            if self.latest is not None and time.time() - self.latest.time <= max_age:
+                return self.latest
+            return self.sample()
         finally:
-            memdata.close()
+            self.lock.release()
             
-    def _get_value(self, line):
+    def sample(self):
+        """
+        Read all of the files and return the new sample, which is also added
+        to the history.
+        """
+        self.lock.acquire()
+        try:
+            sample = Sample(time.time(), self._read_cpus(), self._read_mem(), self._read_nets())
+            self.history.append(sample)
+            self.latest = sample
+            self.samples += 1
+            return sample
+        finally:
+            self.lock.release()
+            
+    def get_history(self):
+        """
+        Get a list of the samples in the history, oldest first
+        """
+        self.lock.acquire()
+        try:
+            return list(self.history)
+        finally:
+            self.lock.release()
+            
+    def subscribe(self, callback, interval):
+        """
+        Have a function called with a new sample every interval seconds. All 
+        subscribers that are due at the same time share the same sample. The 
+        subscription object returned is used to unsubscribe.
+        
+        Keyword arguments:
+        callback        -- function to call, with the sample as the only argument
+        interval        -- how often to call (in seconds)
+        """
+        subscription = Subscription(callback, interval)
+        self.lock.acquire()
+        try:
+            self.subscriptions.append(subscription)
+            self._reschedule()
+        finally:
+            self.lock.release()
+        return subscription
+            
+    def unsubscribe(self, subscription):
+        """
+        Stop a function being called with new samples
+        
+        Keyword arguments:
+        subscription        -- subscription returned by subscribe()
+        """
+        self.lock.acquire()
+        try:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+            self._reschedule()
+        finally:
+            self.lock.release()
+            
+    """
+    Private
+    """
+            
+    def _reschedule(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if len(self.subscriptions) > 0:
+            delay = max(0, min([ s.due for s in self.subscriptions ]) - time.time())
+            self.timer = g15scheduler.schedule("SystemSampler", delay, self._tick)
+        else:
+            for f in [ self.stat_file, self.meminfo_file, self.netdev_file ]:
+                f.close()
+        
+    def _tick(self):
+        self.lock.acquire()
+        try:
+            self.timer = None
+            now = time.time()
+            due = [ s for s in self.subscriptions if s.due <= now ]
+            sample = self.sample() if len(due) > 0 else None
+            for s in due:
+                s.due = now + s.interval
+        finally:
+            self.lock.release()
+        
+        for s in due:
+            try:
+                s.callback(sample)
+            except Exception as e:
+                logger.warning("Sample subscriber failed", exc_info = e)
+                
+        self.lock.acquire()
+        try:
+            if self.timer is None:
+                self._reschedule()
+        finally:
+            self.lock.release()
+            
+    def _read_cpus(self):
+        cpus = []
+        for line in self.stat_file.read().splitlines():
+            if not line.startswith("cpu"):
+                # The CPU lines are always first
+                break
+            fields = line.split(None, 5)
+            cpus.append(( fields[0], ( int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4]) ) ))
+        return cpus
+    
+    def _read_mem(self):
+        total = 0
+        free = 0
+        cached = 0
+        for line in self.meminfo_file.read().splitlines():
+            if line.startswith("MemTotal"):
+                total = self._get_kb(line)
+            elif line.startswith("MemFree"):
+                free = self._get_kb(line)
+            elif line.startswith("Cached"):
+                cached = self._get_kb(line)
+        return ( total, free, cached )
+    
+    def _get_kb(self, line):
         return int(line[line.index(':') + 1:line.index('kB')]) * 1024
+    
+    def _read_nets(self):
+        nets = []
+        for line in self.netdev_file.read().splitlines():
+            if not ":" in line:
+                # Headers
+                continue
+            name, data = line.split(":", 1)
+            data = data.split()
+            nets.append(( name.strip(), int(data[0]), int(data[8]) ))
+        return nets
+    
+_sampler = None
+_sampler_lock = RLock()
+
+def get_sampler():
+    """
+    Get the shared sampler, creating it if this is the first time it is needed
+    """
+    global _sampler
+    _sampler_lock.acquire()
+    try:
+        if _sampler is None:
+            _sampler = Sampler()
+        return _sampler
+    finally:
+        _sampler_lock.release()
             
 def netload(net):
     """
@@ -106,32 +378,16 @@ def netload(net):
     Keyword arguments:
     net        --    network interface name
     """
-    prefix = '%6s:' % net
-    netdata = open('/proc/net/dev')
-    try:
-        for line in netdata:
-            if line.startswith(prefix):
-                data = line[line.index(':') + 1:].split()
-                return NetworkLoad(net, int(data[0]), int(data[8]))
-    finally:
-        netdata.close()
+    data = get_sampler().get_sample().net_map.get(net)
+    if data is not None:
+        return NetworkLoad(net, data[1], data[2])
     
             
 def netlist():
     """
     Returns a list of Net objects, one for each available network interface 
     """
-    nets = []
-    f = open("/proc/net/dev", "r")
-    tmp = f.readlines(2000)
-    f.close()
-    for line in tmp:
-        line = line.strip()
-        line = line.split(' ')
-        if len(line) > 0 and line[0].endswith(":"):
-            nets.append(line[0][:-1])
-            
-    return nets
+    return [ n[0] for n in get_sampler().get_sample().nets ]
     
 def cpu():
     """
@@ -145,17 +401,131 @@ def mem():
     """
     return Mem()
 
+class Process():
+    """
+    Details of a running process that do not change while it runs
+    """
+    
+    def __init__(self, pid, start_time, uid, name, args):
+        """
+        Constructor
+        
+        Keyword arguments:
+        pid            -- process ID
+        start_time     -- time the process started, in clock ticks after boot
+        uid            -- real user ID
+        name           -- executable name
+        args           -- list of arguments (empty for kernel threads)
+        """
+        self.pid = pid
+        self.start_time = start_time
+        self.uid = uid
+        self.name = name
+        self.args = args
+        
+class ProcessTable():
+    """
+    Keeps track of the running processes. Each scan lists /proc and only reads
+    the details of processes that were not present on the previous scan, 
+    returning what was added and removed. 
+    
+    Processes are identified by their process ID and start time, so a process
+    ID that is re-used between two scans is returned as the old process having
+    finished and the new one having started.
+    """
+    
+    def __init__(self):
+        self.processes = {}
+        self.lock = RLock()
+        
+    def scan(self):
+        """
+        Update the table, returning a tuple of the list of processes that have 
+        started and the list of processes that have finished since the last 
+        scan.
+        """
+        self.lock.acquire()
+        try:
+            processes = {}
+            added = []
+            for pid in sorted(proclist()):
+                stat = self._read_stat(pid)
+                if stat is None:
+                    continue
+                name, start_time = stat
+                key = ( pid, start_time )
+                if key in self.processes:
+                    processes[key] = self.processes[key]
+                else:
+                    process = self._read_process(pid, start_time, name)
+                    if process is not None:
+                        processes[key] = process
+                        added.append(process)
+            removed = [ self.processes[key] for key in sorted(self.processes.keys()) if not key in processes ]
+            self.processes = processes
+            return added, removed
+        finally:
+            self.lock.release()
+            
+    def get_processes(self):
+        """
+        Get a list of all of the processes found by the last scan, in process 
+        ID order
+        """
+        self.lock.acquire()
+        try:
+            return [ self.processes[key] for key in sorted(self.processes.keys()) ]
+        finally:
+            self.lock.release()
+            
+    """
+    Private
+    """
+    
+    def _read_stat(self, pid):
+        """
+        Get a tuple of the name and start time of a process, or None if it
+        has finished.
+        """
+        try:
+            # The name may contain spaces and brackets, so find the last bracket
+            stat = _read_file("/proc/%d/stat" % pid)
+            return stat[stat.index("(") + 1:stat.rindex(")")], int(stat[stat.rindex(")") + 2:].split()[19])
+        except ( IOError, OSError, ValueError, IndexError ) as e:
+            # Probably finished already
+            logger.debug("Could not read process %d", pid, exc_info = e)
+    
+    def _read_process(self, pid, start_time, name):
+        try:
+            uid = 0
+            for line in _read_file("/proc/%d/status" % pid).splitlines():
+                if line.startswith("Uid:"):
+                    uid = int(line[4:].split()[0])
+                    break
+            args = _read_file("/proc/%d/cmdline" % pid).split("\0")
+            if len(args) > 0 and args[-1] == "":
+                args = args[:-1]
+            return Process(pid, start_time, uid, name, args)
+        except ( IOError, OSError, ValueError, IndexError ) as e:
+            # Probably finished already
+            logger.debug("Could not read process %d", pid, exc_info = e)
+            
+def _read_file(path):
+    f = open(path)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
 def proclist():
     """
     Get a list of all process IDs
     """
     n = []
     for d in os.listdir("/proc"):
-        if os.path.isdir("/proc/%s" % d):
-            try:
-                n.append(int(d))
-            except ValueError:
-                pass
+        # Only process directories have numeric names, so no need to stat them
+        if d.isdigit():
+            n.append(int(d))
     return n
 
 def proc_state(pid):
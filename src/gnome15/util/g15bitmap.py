@@ -0,0 +1,244 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Device bitmap encoders
+Convert the cairo surfaces painted by a screen into the raw buffers the
+LCDs expect. All of the per pixel work is done in bulk by PIL, and the
+intermediate surfaces and output buffers are reused for every frame
+'''
+
+import sys
+import cairo
+from PIL import Image
+from PIL import ImageChops
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Bit orders for monochrome bitmaps. Both are row major, MSB_FIRST is the
+pixmap format libg15 expects, LSB_FIRST is used by the kernel framebuffer
+"""
+MSB_FIRST = "msb"
+LSB_FIRST = "lsb"
+
+"""
+PIL raw mode of a cairo ARGB32 / RGB24 buffer (native endian 32 bit words)
+"""
+CAIRO_RAWMODE = "BGRA" if sys.byteorder == "little" else "ARGB"
+
+"""
+Cairo only exposed the 16 bit format again in 1.8.6, older bindings do not
+have the constant
+"""
+FORMAT_RGB16_565 = getattr(cairo, "FORMAT_RGB16_565", 4)
+
+def to_bytes(image, rawmode):
+    """
+    Get the raw data of a PIL image using the given raw mode (PIL and Pillow
+    name this method differently)
+
+    Keyword arguments:
+    image        -- PIL image
+    rawmode      -- raw mode to pack with
+    """
+    if hasattr(image, "tobytes"):
+        return image.tobytes("raw", rawmode)
+    return image.tostring("raw", rawmode)
+
+class MonochromeEncoder(object):
+    """
+    Encodes a cairo surface as a 1 bit per pixel device bitmap. The image is
+    converted to greyscale and then either dithered (Floyd-Steinberg) or
+    thresholded, then packed into rows of bits in the requested bit order.
+    """
+
+    def __init__(self, width, height, bit_order = MSB_FIRST, line_length = None, \
+                 buffer_length = None, dither = True, threshold = 128):
+        """
+        Constructor
+
+        Keyword arguments:
+        width            -- width of bitmap in pixels
+        height           -- height of bitmap in pixels
+        bit_order        -- MSB_FIRST or LSB_FIRST
+        line_length      -- number of bytes per row in the output (defaults to packed width)
+        buffer_length    -- minimum size of the output (defaults to line_length * height)
+        dither           -- dither the image instead of using a simple threshold
+        threshold        -- grey level (0-255) at or above which a pixel is set when not dithering
+        """
+        self.width = width
+        self.height = height
+        self.bit_order = bit_order
+        self.dither = dither
+        self.row_bytes = ( width + 7 ) / 8
+        self.line_length = line_length if line_length is not None else self.row_bytes
+        self.buffer_length = max(self.line_length * height, buffer_length if buffer_length is not None else 0)
+        self.buffer = bytearray(self.buffer_length)
+        self.threshold_table = [ 255 if i >= threshold else 0 for i in range(0, 256) ]
+        self._argb_surface = None
+        self._argb_context = None
+
+    def encode(self, surface, invert = False):
+        """
+        Encode a surface, returning a string of buffer_length bytes ready to
+        be written to the device.
+
+        Keyword arguments:
+        surface        -- cairo surface
+        invert         -- invert every pixel
+        """
+        data, stride = self._get_argb_data(surface)
+        image = Image.frombuffer("RGBA", (self.width, self.height), data, "raw", CAIRO_RAWMODE, stride, 1)
+        grey = image.convert("L")
+        if self.dither:
+            mono = grey.convert("1")
+        else:
+            mono = grey.point(self.threshold_table, "1")
+
+        # Inversion and bit order are both handled by PIL's packer
+        rawmode = ( "I" if invert else "" ) + ( "R" if self.bit_order == LSB_FIRST else "" )
+        packed = to_bytes(mono, "1;%s" % rawmode if rawmode else "1")
+
+        if self.line_length == self.row_bytes and self.buffer_length == len(packed):
+            return packed
+
+        if self.line_length == self.row_bytes:
+            self.buffer[0:len(packed)] = packed
+        else:
+            for row in range(0, self.height):
+                offset = row * self.line_length
+                packed_offset = row * self.row_bytes
+                self.buffer[offset:offset + self.row_bytes] = packed[packed_offset:packed_offset + self.row_bytes]
+        return str(self.buffer)
+
+    '''
+    Private
+    '''
+
+    def _get_argb_data(self, surface):
+        """
+        Get the pixel data of the surface as 32 bit pixels of the right size,
+        using the surface's own buffer if possible.
+        """
+        if isinstance(surface, cairo.ImageSurface) and \
+           surface.get_format() in [ cairo.FORMAT_ARGB32, cairo.FORMAT_RGB24 ] and \
+           surface.get_width() == self.width and surface.get_height() == self.height:
+            surface.flush()
+            return surface.get_data(), surface.get_stride()
+
+        if self._argb_surface is None:
+            self._argb_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
+            self._argb_context = cairo.Context(self._argb_surface)
+            self._argb_context.set_operator(cairo.OPERATOR_SOURCE)
+        self._argb_context.set_source_surface(surface)
+        self._argb_context.paint()
+        self._argb_surface.flush()
+        return self._argb_surface.get_data(), self._argb_surface.get_stride()
+
+class RGB565Encoder(object):
+    """
+    Encodes a cairo surface as little endian 16 bit (5-6-5) pixels, optionally
+    transposed so the frame scans vertically (as the G19 expects). The pixels
+    are written after a fixed header into a frame buffer that is reused for
+    every frame, so the result may be handed straight to the device.
+    """
+
+    def __init__(self, width, height, transpose = False, header = None):
+        """
+        Constructor
+
+        Keyword arguments:
+        width            -- width of the source surface in pixels
+        height           -- height of the source surface in pixels
+        transpose        -- write the pixels column by column instead of row by row
+        header           -- bytes that precede the pixel data in the frame
+        """
+        self.width = width
+        self.height = height
+        self.transpose = transpose
+        self.header_length = len(header) if header is not None else 0
+        self.data_length = width * height * 2
+        self.frame = bytearray(self.header_length + self.data_length)
+        if header is not None:
+            self.frame[0:self.header_length] = header
+        self._surface = None
+        self._context = None
+        self._tables = None
+
+    def encode(self, surface):
+        """
+        Encode a surface, returning the frame (a bytearray of the header
+        followed by the pixel data). The same bytearray is returned for every
+        frame, so it must not be kept.
+
+        Keyword arguments:
+        surface        -- cairo surface
+        """
+        if self._context is None:
+            self._create_surface()
+        self._context.set_source_surface(surface, 0, 0)
+        self._context.paint()
+        self._surface.flush()
+        if self._surface.get_format() == FORMAT_RGB16_565:
+            self.frame[self.header_length:] = self._surface.get_data()
+        else:
+            self.frame[self.header_length:] = self._convert_argb()
+        return self.frame
+
+    '''
+    Private
+    '''
+
+    def _create_surface(self):
+        if self.transpose:
+            width, height = self.height, self.width
+        else:
+            width, height = self.width, self.height
+        try:
+            self._surface = cairo.ImageSurface(FORMAT_RGB16_565, width, height)
+        except Exception as e:
+            # Earlier version of Cairo, the conversion must be done by PIL
+            logger.debug("Could not create 16 bit ImageSurface, using ARGB.", exc_info = e)
+            self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        self._context = cairo.Context(self._surface)
+        if self.transpose:
+            # Swap x and y, i.e. rotate 270 degrees and flip horizontally
+            self._context.transform(cairo.Matrix(0, 1, 1, 0, 0, 0))
+        self._context.set_operator(cairo.OPERATOR_SOURCE)
+
+    def _convert_argb(self):
+        """
+        Convert the ARGB surface to 5-6-5. Each output byte is the sum of two
+        channels mapped through lookup tables whose bits do not overlap.
+        """
+        if self._tables is None:
+            r_bits = [ min(31, i * 32 / 255) for i in range(0, 256) ]
+            g_bits = [ min(63, i * 64 / 255) for i in range(0, 256) ]
+            self._tables = ( [ v << 3 for v in r_bits ],
+                             [ v >> 3 for v in g_bits ],
+                             [ ( v << 5 ) & 0xff for v in g_bits ],
+                             r_bits )
+        r_high, g_high, g_low, b_low = self._tables
+        size = ( self._surface.get_width(), self._surface.get_height() )
+        image = Image.frombuffer("RGBA", size, self._surface.get_data(), "raw", \
+                                 CAIRO_RAWMODE, self._surface.get_stride(), 1)
+        r, g, b, a = image.split()
+        low = ImageChops.add(g.point(g_low), b.point(b_low))
+        high = ImageChops.add(r.point(r_high), g.point(g_high))
+        return to_bytes(Image.merge("LA", ( low, high )), "LA")
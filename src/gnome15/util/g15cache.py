@@ -0,0 +1,163 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Caches
+Thread safe least recently used caches, limited by the number of entries
+and optionally by the total cost (e.g. size in bytes) of the entries
+'''
+
+from collections import OrderedDict
+from threading import RLock
+
+class LRUCache(object):
+    """
+    Keeps the most recently used values. When either limit is exceeded, the
+    least recently used entries are discarded until it is not.
+    """
+
+    def __init__(self, max_entries = None, max_cost = None, cost_function = None):
+        """
+        Constructor
+
+        Keyword arguments:
+        max_entries      -- maximum number of entries (None for no limit)
+        max_cost         -- maximum total cost of all entries (None for no limit)
+        cost_function    -- function that returns the cost of a value (defaults to 1 per entry)
+        """
+        self.max_entries = max_entries
+        self.max_cost = max_cost
+        self.cost_function = cost_function
+        self.entries = OrderedDict()
+        self.cost = 0
+        self.lock = RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default = None):
+        """
+        Get a value, making it the most recently used, or the default if
+        there is no value for the key.
+
+        Keyword arguments:
+        key        -- key
+        default    -- value to return if there is no entry for the key
+        """
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        """
+        Add or replace a value, making it the most recently used. A value that
+        costs more than the maximum cost on its own is not kept.
+
+        Keyword arguments:
+        key        -- key
+        value      -- value
+        """
+        cost = self.cost_function(value) if self.cost_function is not None else 1
+        self.lock.acquire()
+        try:
+            self._remove(key)
+            if self.max_cost is not None and cost > self.max_cost:
+                return
+            self.entries[key] = ( value, cost )
+            self.cost += cost
+            self._trim()
+        finally:
+            self.lock.release()
+
+    def remove(self, key):
+        """
+        Remove a value if there is one.
+
+        Keyword arguments:
+        key        -- key
+        """
+        self.lock.acquire()
+        try:
+            self._remove(key)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """
+        Remove all values.
+        """
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.cost = 0
+        finally:
+            self.lock.release()
+
+    def set_limits(self, max_entries = None, max_cost = None):
+        """
+        Change the limits, discarding entries if the cache is now too big.
+
+        Keyword arguments:
+        max_entries      -- maximum number of entries (None for no limit)
+        max_cost         -- maximum total cost of all entries (None for no limit)
+        """
+        self.lock.acquire()
+        try:
+            self.max_entries = max_entries
+            self.max_cost = max_cost
+            self._trim()
+        finally:
+            self.lock.release()
+
+    def get_statistics(self):
+        """
+        Get a dictionary of the cache counters.
+        """
+        return { "entries" : len(self.entries),
+                 "cost" : self.cost,
+                 "hits" : self.hits,
+                 "misses" : self.misses,
+                 "evictions" : self.evictions }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    '''
+    Private
+    '''
+
+    def _trim(self):
+        while ( self.max_entries is not None and len(self.entries) > self.max_entries ) or \
+              ( self.max_cost is not None and self.cost > self.max_cost ):
+            old_key, old_entry = self.entries.popitem(last = False)
+            self.cost -= old_entry[1]
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.cost -= entry[1]
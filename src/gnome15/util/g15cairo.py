@@ -27,10 +27,13 @@ import math
 import rsvg
 import urllib
 import base64
+import tempfile
+import stat
 import xdg.Mime as mime
 import g15convert
 import g15os
-import gnome15.g15globals
+import g15cache
+from gnome15 import g15globals
 
 # Logging
 import logging
@@ -38,6 +41,27 @@ logger = logging.getLogger(__name__)
 
 from cStringIO import StringIO
 
+"""
+Maximum total size in bytes of the decoded surfaces kept in memory by
+load_surface_from_file
+"""
+MAX_CACHED_SURFACE_BYTES = 16 * 1024 * 1024
+
+"""
+Maximum total size in bytes of the downloaded images kept in the user's
+cache directory
+"""
+MAX_CACHED_IMAGE_FILE_BYTES = 32 * 1024 * 1024
+
+"""
+Maximum width and height in pixels of an image loaded by load_surface_from_pixels
+"""
+MAX_PIXELS_SIZE = 2048
+
+_surfaces = g15cache.LRUCache(max_cost = MAX_CACHED_SURFACE_BYTES, 
+                              cost_function = lambda surface: surface.get_stride() * surface.get_height())
+_image_file_statistics = { "hits" : 0, "misses" : 0, "evictions" : 0 }
+
 def rotate(context, degrees):
     context.rotate(g15convert.degrees_to_radians(degrees));
     
@@ -57,6 +81,29 @@ def flip_hv_centered_on(context, fx, fy, cx, cy):
     mtrx = cairo.Matrix(fx,0,0,fy,cx*(1-fx),cy*(fy-1))
     context.transform(mtrx)
     
+def intersect_rect(rect1, rect2):
+    """
+    Get the intersection of two rectangles (x, y, width, height), or None
+    if they do not overlap
+    """
+    x1 = max(rect1[0], rect2[0])
+    y1 = max(rect1[1], rect2[1])
+    x2 = min(rect1[0] + rect1[2], rect2[0] + rect2[2])
+    y2 = min(rect1[1] + rect1[3], rect2[1] + rect2[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return ( x1, y1, x2 - x1, y2 - y1 )
+
+def to_pixel_rect(rect, width, height):
+    """
+    Expand a rectangle to whole pixels and clip it to a surface of the given
+    size. None is returned if nothing of the rectangle is on the surface
+    """
+    x = int(math.floor(rect[0]))
+    y = int(math.floor(rect[1]))
+    pixel_rect = ( x, y, int(math.ceil(rect[0] + rect[2])) - x, int(math.ceil(rect[1] + rect[3])) - y )
+    return intersect_rect(pixel_rect, ( 0, 0, width, height ))
+    
 def get_cache_filename(filename, size = None):    
     cache_file = base64.urlsafe_b64encode("%s-%s" % ( filename, str(size if size is not None else "0,0") ) )
     g15os.mkdir_p(g15globals.user_cache_dir)
@@ -67,26 +114,124 @@ def get_image_cache_file(filename, size = None):
     if os.path.exists(full_cache_path):
         return full_cache_path
     
+def get_image_cache_statistics():
+    """
+    Get a dictionary containing the counters of the cache of decoded surfaces
+    ("memory") and of the downloaded image files ("disk").
+    """
+    return { "memory" : _surfaces.get_statistics(),
+             "disk" : dict(_image_file_statistics) }
+    
+def clear_image_cache():
+    """
+    Discard all of the decoded surfaces kept in memory.
+    """
+    _surfaces.clear()
+    
 def is_url(path):
     # TODO try harder
     return "://" in path
     
 def load_surface_from_file(filename, size = None):
-    type = None
+    """
+    Load an image file or URL as a cairo surface, optionally scaled. Decoded
+    surfaces are kept in memory (keyed by the file's modification time and the
+    requested size), so the same surface may be returned to many callers and 
+    must never be painted on. Images fetched over HTTP are also kept in the
+    user's cache directory.
+    
+    Keyword arguments:
+    filename        -- file name or URL
+    size            -- size to scale to, either a single dimension or (width, height)
+    """
     if filename == None:
         logger.warning("Empty filename requested")
         return None
-        
+    
+    key = _get_surface_key(filename, size)
+    if key is not None:
+        surface = _surfaces.get(key)
+        if surface is not None:
+            return surface
+    surface = _load_surface_from_file(filename, size)
+    if surface is not None and key is not None:
+        _surfaces.put(key, surface)
+    return surface
+
+def _get_surface_key(filename, size):
+    if isinstance(size, list):
+        size = tuple(size)
+    if filename.startswith("http:") or filename.startswith("https:"):
+        # The downloaded file is never refreshed, so the URL is enough
+        return ( filename, None, size )
+    path = filename[7:] if filename.startswith("file://") else filename
+    if is_url(path):
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return ( filename, ( stat.st_mtime, stat.st_size ), size )
+
+def _write_image_cache_file(full_cache_path, data, type):
+    """
+    Write a downloaded image and its metadata. Each is written to a temporary
+    file first, so a partially written image is never read. Once written, the
+    least recently used images are removed until the cache fits its limit.
+    """
+    for path, content in [ ( full_cache_path + "m", type + "\n" ), ( full_cache_path, data ) ]:
+        fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(path), prefix = ".tmp")
+        try:
+            os.write(fd, content)
+        finally:
+            os.close(fd)
+        os.rename(temp_path, path)
+    _trim_image_cache_files()
+    
+def _trim_image_cache_files():
+    files = []
+    total = 0
+    for name in os.listdir(g15globals.user_cache_dir):
+        if name.endswith(".img"):
+            path = os.path.join(g15globals.user_cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append(( stat.st_mtime, stat.st_size, path ))
+            total += stat.st_size
+    files.sort()
+    for mtime, file_size, path in files:
+        if total <= MAX_CACHED_IMAGE_FILE_BYTES:
+            break
+        for p in [ path, path + "m" ]:
+            try:
+                os.remove(p)
+            except OSError as e:
+                logger.debug("Could not remove cached image %s", p, exc_info = e)
+        total -= file_size
+        _image_file_statistics["evictions"] += 1
+    
+def _load_surface_from_file(filename, size):
+    type = None
     if filename.startswith("http:") or filename.startswith("https:"):
         full_cache_path = get_image_cache_file(filename, size)
         if full_cache_path:
-            meta_fileobj = open(full_cache_path + "m", "r")
-            type = meta_fileobj.readline()
-            meta_fileobj.close()
-            if type == "image/svg+xml" or filename.lower().endswith(".svg"):
-                return load_svg_as_surface(filename, size)
-            else:
-                return pixbuf_to_surface(gtk.gdk.pixbuf_new_from_file(full_cache_path), size)
+            _image_file_statistics["hits"] += 1
+            try:
+                # Most recently used files are the last to be removed
+                os.utime(full_cache_path, None)
+                meta_fileobj = open(full_cache_path + "m", "r")
+                type = meta_fileobj.readline().strip()
+                meta_fileobj.close()
+                if type == "image/svg+xml" or filename.lower().endswith(".svg"):
+                    return load_svg_as_surface(full_cache_path, size)
+                else:
+                    return pixbuf_to_surface(gtk.gdk.pixbuf_new_from_file(full_cache_path), size)
+            except Exception as e:
+                logger.warning("Failed to load cached image for %s, fetching again.", filename, exc_info = e)
+        else:
+            _image_file_statistics["misses"] += 1
                 
     if is_url(filename):
         type = None
@@ -99,13 +244,7 @@ def load_surface_from_file(filename, size = None):
                 type = str(mime.get_type(filename))
             
             if filename.startswith("http:") or filename.startswith("https:"):
-                full_cache_path = get_cache_filename(filename, size)
-                cache_fileobj = open(full_cache_path, "w")
-                cache_fileobj.write(data)
-                cache_fileobj.close()
-                meta_fileobj = open(full_cache_path + "m", "w")
-                meta_fileobj.write(type + "\n")
-                meta_fileobj.close()
+                _write_image_cache_file(get_cache_filename(filename, size), data, type)
             
             if type == "image/svg+xml" or filename.lower().endswith(".svg"):
                 svg = rsvg.Handle()
@@ -173,6 +312,45 @@ def load_svg_as_surface(filename, size):
     finally:
         svg.close()
     
+def load_surface_from_pixels(fd, width, height, stride = 0, offset = 0):
+    """
+    Create a surface from raw pixels in an open regular file, such as a memfd
+    or a file in $XDG_RUNTIME_DIR shared with another process. The pixels must
+    be in cairo's ARGB32 format (premultiplied, native byte order). They are 
+    read (from the file's current position after seeking to the offset), so 
+    the file may be re-used for the next frame as soon as this returns. 
+    ValueError is raised if the file is not a regular file, or does not 
+    contain enough pixels.
+    
+    Keyword arguments:
+    fd            -- file descriptor (or file object) containing the pixels
+    width         -- width of image in pixels
+    height        -- height of image in pixels
+    stride        -- number of bytes per row (0 for the minimum for the width)
+    offset        -- byte offset of the first pixel in the file
+    """
+    min_stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    if stride == 0:
+        stride = min_stride
+    if width < 1 or height < 1 or width > MAX_PIXELS_SIZE or height > MAX_PIXELS_SIZE or \
+            stride < min_stride or stride > min_stride * 2 or stride % 4 != 0 or offset < 0:
+        raise ValueError("Invalid image dimensions %dx%d (stride %d, offset %d)" % ( width, height, stride, offset ))
+    length = stride * height
+    fileno = fd.fileno() if hasattr(fd, "fileno") else fd
+    if not stat.S_ISREG(os.fstat(fileno).st_mode):
+        # Reading anything else (e.g. a pipe) could block
+        raise ValueError("Pixels must be in a regular file")
+    
+    # The file may be truncated at any time, so it is read rather than mapped
+    os.lseek(fileno, offset, os.SEEK_SET)
+    data = bytearray()
+    while len(data) < length:
+        chunk = os.read(fileno, length - len(data))
+        if len(chunk) == 0:
+            raise ValueError("File is smaller than a %dx%d image (stride %d, offset %d)" % ( width, height, stride, offset ))
+        data.extend(chunk)
+    return cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, width, height, stride)
+    
 def image_to_surface(image, type = "ppm"):
     # TODO make better
     return pixbuf_to_surface(image_to_pixbuf(image, type))
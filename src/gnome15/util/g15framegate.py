@@ -0,0 +1,211 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Frame gate
+Sits between the screen and the driver. Frames that are identical to the
+last frame passed to the driver are dropped, and frames that arrive faster
+than the maximum frame rate are held back, with only the most recent one
+being sent when the device is next due a frame.
+'''
+
+import time
+import threading
+import cairo
+import g15scheduler
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Default maximum number of frames per second sent to a device. 0 means there
+is no limit
+"""
+DEFAULT_MAX_FPS = 25
+
+class FrameGate(object):
+    """
+    Filters the frames sent to a driver. Dropped and deferred frames are
+    counted so the effect may be monitored.
+    """
+
+    def __init__(self, driver, queue_name, max_fps = DEFAULT_MAX_FPS):
+        """
+        Constructor
+
+        Keyword arguments:
+        driver        -- driver to paint frames with
+        queue_name    -- name of queue deferred frames are sent from
+        max_fps       -- maximum frames per second (0 for no limit)
+        """
+        self.driver = driver
+        self.queue_name = queue_name
+        self.lock = threading.RLock()
+        self.last_data = None
+        self.sent_data = None
+        self.last_sent = 0
+        self.pending = None
+        self.due = 0
+        self.timer = None
+        self.requested = 0
+        self.rendered = 0
+        self.deduplicated = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, max_fps):
+        """
+        Set the maximum number of frames per second to send to the device.
+
+        Keyword arguments:
+        max_fps       -- maximum frames per second (0 for no limit)
+        """
+        self.max_fps = max(0, max_fps)
+        self.interval = 1.0 / float(self.max_fps) if self.max_fps > 0 else 0
+
+    def frame_requested(self):
+        """
+        Count a request to redraw the screen.
+        """
+        self.requested += 1
+
+    def paint(self, surface, rects = None):
+        """
+        Pass a frame to the driver, unless it is identical to the last frame or
+        the device has already received a frame too recently, in which case the
+        frame is held back until the device is due a frame.
+
+        Keyword arguments:
+        surface       -- complete frame
+        rects         -- areas changed since the last frame, or None for all of it
+        """
+        self.lock.acquire()
+        try:
+            self.rendered += 1
+            if not isinstance(surface, cairo.ImageSurface):
+                self._send(surface, rects, None)
+                return
+
+            surface.flush()
+            data = str(surface.get_data())
+            if data == self.last_data:
+                self.deduplicated += 1
+                return
+            self.last_data = data
+
+            if self.pending is not None:
+                if data == self.sent_data:
+                    # Changed back to what the device is already showing
+                    self.pending = None
+                    self.deduplicated += 1
+                else:
+                    pending_rects = self.pending[1]
+                    merged_rects = pending_rects + rects if pending_rects is not None and rects is not None else None
+                    self.pending = ( self._copy_surface(surface, data), merged_rects, data )
+                    self.coalesced += 1
+                    if time.time() >= self.due + self.interval:
+                        # The flush job has been lost (e.g. the queue was cleared)
+                        self.flush()
+                return
+
+            delay = self.last_sent + self.interval - time.time()
+            if delay <= 0:
+                self._send(surface, rects, data)
+            else:
+                self.pending = ( self._copy_surface(surface, data), rects, data )
+                self.due = self.last_sent + self.interval
+                self.timer = g15scheduler.queue(self.queue_name, "FrameGate", delay, self.flush)
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """
+        Send any frame that is being held back now.
+        """
+        self.lock.acquire()
+        try:
+            self.timer = None
+            if self.pending is not None:
+                surface, rects, data = self.pending
+                self.pending = None
+                self._send(surface, rects, data)
+        finally:
+            self.lock.release()
+
+    def requeue(self):
+        """
+        Queue the flush of any frame being held back again. This must be called
+        after the jobs on the gate's queue have been cleared, as that may have
+        discarded a flush whose timer had already fired.
+        """
+        self.lock.acquire()
+        try:
+            if self.pending is not None:
+                if self.timer is not None:
+                    self.timer.cancel()
+                delay = max(0, self.due - time.time())
+                self.timer = g15scheduler.queue(self.queue_name, "FrameGate", delay, self.flush)
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        """
+        Forget the last frame and discard any frame being held back. This must
+        be called when the device contents may have changed without the gate
+        knowing, for example when something else has painted to the driver.
+        """
+        self.lock.acquire()
+        try:
+            self.last_data = None
+            self.sent_data = None
+            self.pending = None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        finally:
+            self.lock.release()
+
+    def get_statistics(self):
+        """
+        Get a dictionary of the frame counters.
+        """
+        return { "requested" : self.requested,
+                 "rendered" : self.rendered,
+                 "deduplicated" : self.deduplicated,
+                 "coalesced" : self.coalesced,
+                 "sent" : self.sent }
+
+    '''
+    Private
+    '''
+
+    def _send(self, surface, rects, data):
+        # Only the changed areas can be sent if the device contents are known
+        full = rects is None or self.sent_data is None
+        self.last_sent = time.time()
+        self.sent_data = data
+        self.sent += 1
+        if full:
+            self.driver.paint(surface)
+        else:
+            self.driver.paint_region(surface, rects)
+
+    def _copy_surface(self, surface, data):
+        return cairo.ImageSurface.create_for_data(bytearray(data), surface.get_format(),
+                                                  surface.get_width(), surface.get_height(),
+                                                  surface.get_stride())
@@ -0,0 +1,205 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+History
+Fixed size numeric series for graphs. Appending a value never allocates,
+and longer periods are kept as averages over a fixed number of points
+'''
+
+import time
+import array
+import itertools
+
+"""
+Names of the periods a History may be viewed over, and the number of seconds
+each covers. RECENT is the raw samples, however often they are taken
+"""
+RECENT = "recent"
+MINUTE = "minute"
+HOUR = "hour"
+DAY = "day"
+WINDOWS = { MINUTE : 60, HOUR : 3600, DAY : 86400 }
+
+class RingBuffer(object):
+    """
+    A fixed number of floating point values stored in an array. Initially
+    every value is the initial value, and each new value replaces the oldest.
+    """
+
+    def __init__(self, capacity, initial = 0.0):
+        """
+        Constructor
+
+        Keyword arguments:
+        capacity        -- number of values
+        initial         -- value to start with
+        """
+        self.capacity = capacity
+        self.data = array.array("d", [ initial ]) * capacity
+        self.start = 0
+
+    def append(self, value):
+        """
+        Replace the oldest value.
+
+        Keyword arguments:
+        value           -- new value
+        """
+        self.data[self.start] = value
+        self.start += 1
+        if self.start == self.capacity:
+            self.start = 0
+
+    def latest(self):
+        """
+        Get the newest value.
+        """
+        return self.data[self.start - 1]
+
+    def maximum(self):
+        """
+        Get the largest value.
+        """
+        return max(self.data)
+
+    def values(self):
+        """
+        Get a list of the values, oldest first.
+        """
+        return self.data[self.start:].tolist() + self.data[:self.start].tolist()
+
+    def __len__(self):
+        return self.capacity
+
+    def __iter__(self):
+        return itertools.chain(self.data[self.start:], self.data[:self.start])
+
+    def __getitem__(self, index):
+        if index < -self.capacity or index >= self.capacity:
+            raise IndexError("RingBuffer index out of range")
+        return self.data[( self.start + index ) % self.capacity]
+
+class History(object):
+    """
+    The recent values of a series, plus the same series averaged over longer
+    periods. Each period is split into the same number of points as are kept
+    for the recent values, and a point is added when its part of the period
+    has passed. Time in which no values were added (e.g. while nothing was
+    being monitored) is skipped rather than shown.
+    """
+
+    def __init__(self, points, windows = WINDOWS):
+        """
+        Constructor
+
+        Keyword arguments:
+        points          -- number of points for each period
+        windows         -- dictionary of period names and their length in seconds
+        """
+        self.recent = RingBuffer(points)
+        self.windows = {}
+        for name, seconds in windows.items():
+            self.windows[name] = _Window(RingBuffer(points), float(seconds) / points)
+
+    def append(self, value, now = None):
+        """
+        Add a new value.
+
+        Keyword arguments:
+        value           -- new value
+        now             -- time of the value (defaults to the current time)
+        """
+        if now is None:
+            now = time.time()
+        self.recent.append(value)
+        for window in self.windows.values():
+            window.add(value, now)
+
+    def get(self, window = RECENT):
+        """
+        Get the RingBuffer for a period. The recent values are returned if there
+        is no such period.
+
+        Keyword arguments:
+        window          -- name of period
+        """
+        if window in self.windows:
+            return self.windows[window].values
+        return self.recent
+
+def append_path(canvas, values, x, y, width, height, max_value, min_value = 0.0, close = False):
+    """
+    Add a line through a series of values to the current path of a cairo
+    context, with the oldest value on the left and the values scaled (and
+    clipped) to fit the rectangle. When close is True, the ends of the line are
+    joined along the bottom of the rectangle, so the path may be filled.
+
+    Keyword arguments:
+    canvas          -- cairo context
+    values          -- list or RingBuffer of values
+    x               -- left of rectangle
+    y               -- top of rectangle
+    width           -- width of rectangle
+    height          -- height of rectangle
+    max_value       -- value at the top of the rectangle
+    min_value       -- value at the bottom of the rectangle
+    close           -- join the line to the bottom of the rectangle
+    """
+    count = len(values)
+    if count == 0:
+        return
+    x_step = float(width) / max(1, count - 1)
+    y_scale = float(height) / ( max_value - min_value ) if max_value > min_value else 0.0
+    bottom = y + height
+    line_to = canvas.line_to
+    if close:
+        canvas.move_to(x, bottom)
+    else:
+        canvas.move_to(x, bottom - ( min(max(values[0], min_value), max_value) - min_value ) * y_scale)
+    px = x
+    for value in values:
+        line_to(px, bottom - ( min(max(value, min_value), max_value) - min_value ) * y_scale)
+        px += x_step
+    if close:
+        line_to(px - x_step, bottom)
+        canvas.close_path()
+
+'''
+Private
+'''
+
+class _Window(object):
+
+    def __init__(self, values, interval):
+        self.values = values
+        self.interval = interval
+        self.total = 0.0
+        self.count = 0
+        self.end = None
+
+    def add(self, value, now):
+        if self.end is None:
+            self.end = now + self.interval
+        elif now >= self.end:
+            if self.count > 0:
+                self.values.append(self.total / self.count)
+            self.total = 0.0
+            self.count = 0
+            # Skip any time in which there were no values
+            self.end = now + self.interval - ( ( now - self.end ) % self.interval )
+        self.total += value
+        self.count += 1
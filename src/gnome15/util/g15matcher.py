@@ -0,0 +1,199 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Matchers
+Find which of a list of patterns matches a string without testing each
+pattern in turn. Both matchers return the index of the first pattern (in
+the order they were given) that matches, or None
+'''
+
+import re
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Python's re module limits the number of groups in a single expression, so
+regular expressions are combined in chunks of this size
+"""
+MAX_PATTERNS_PER_EXPRESSION = 40
+
+class SubstringMatcher(object):
+    """
+    Aho-Corasick automaton matching any number of substrings in a single
+    pass over the text.
+    """
+
+    def __init__(self, patterns):
+        """
+        Constructor
+
+        Keyword arguments:
+        patterns        -- list of substrings to search for
+        """
+        self.goto = [ {} ]
+        self.fail = [ 0 ]
+        self.best = [ None ]
+        self.empty = None
+        for i, pattern in enumerate(patterns):
+            if len(pattern) == 0:
+                if self.empty is None:
+                    self.empty = i
+                continue
+            state = 0
+            for c in pattern:
+                next_state = self.goto[state].get(c)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                    self.goto[state][c] = next_state
+                state = next_state
+            if self.best[state] is None:
+                self.best[state] = i
+        self._build_fail_links()
+
+    def match(self, text):
+        """
+        Get the index of the first pattern that is contained in the text, or
+        None if none are.
+
+        Keyword arguments:
+        text            -- text to search
+        """
+        best = self.empty
+        if best == 0:
+            return best
+        goto = self.goto
+        fail = self.fail
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            found = self.best[state]
+            if found is not None and ( best is None or found < best ):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+    '''
+    Private
+    '''
+
+    def _build_fail_links(self):
+        # Breadth first, so the fail state of each node is complete before its children
+        queue = list(self.goto[0].values())
+        i = 0
+        while i < len(queue):
+            state = queue[i]
+            i += 1
+            for c, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and c not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                link = self.goto[fallback].get(c, 0)
+                self.fail[child] = link if link != child else 0
+                inherited = self.best[self.fail[child]]
+                if inherited is not None and ( self.best[child] is None or inherited < self.best[child] ):
+                    self.best[child] = inherited
+
+class RegexMatcher(object):
+    """
+    Combines a list of regular expressions (searched for anywhere in the text,
+    as re.search does) into as few compiled expressions as possible. Each
+    pattern is tried as a look-ahead from the start of the text, so the first
+    pattern in the list wins regardless of where in the text it matches.
+    Patterns that cannot be combined (numbered back references, inline flags
+    that would apply to every pattern, or that do not compile) are tested on
+    their own.
+    """
+
+    def __init__(self, patterns):
+        """
+        Constructor
+
+        Keyword arguments:
+        patterns        -- list of regular expressions (None entries never match)
+        """
+        self.expressions = []
+        chunk = []
+        for i, pattern in enumerate(patterns):
+            if pattern is None:
+                continue
+            if re.search(r"\\[1-9]", pattern) or re.search(r"\(\?[iLmsux]+\)", pattern) or \
+                    not self._valid(pattern):
+                self._add_chunk(chunk)
+                chunk = []
+                self._add_single(i, pattern)
+                continue
+            chunk.append(( i, pattern ))
+            if len(chunk) == MAX_PATTERNS_PER_EXPRESSION:
+                self._add_chunk(chunk)
+                chunk = []
+        self._add_chunk(chunk)
+
+    def match(self, text):
+        """
+        Get the index of the first pattern that is found in the text, or None
+        if none are.
+
+        Keyword arguments:
+        text            -- text to search
+        """
+        for expression, indexes in self.expressions:
+            if expression is None:
+                continue
+            m = expression.match(text)
+            if m is not None:
+                return indexes[m.lastgroup]
+
+    '''
+    Private
+    '''
+
+    def _valid(self, pattern):
+        try:
+            re.compile(pattern)
+            return True
+        except re.error as e:
+            logger.warning("Invalid pattern '%s'", pattern, exc_info = e)
+            return False
+
+    def _add_single(self, index, pattern):
+        try:
+            expression = re.compile(r"(?=[\s\S]*?(?:%s))(?P<_m%d>)" % ( pattern, index ))
+        except re.error:
+            # Never matches, as re.search would have failed anyway
+            expression = None
+        self.expressions.append(( expression, { "_m%d" % index : index } ))
+
+    def _add_chunk(self, chunk):
+        if len(chunk) == 0:
+            return
+        try:
+            expression = re.compile("|".join([ r"(?=[\s\S]*?(?:%s))(?P<_m%d>)" % ( pattern, i ) for i, pattern in chunk ]))
+            self.expressions.append(( expression, dict([ ( "_m%d" % i, i ) for i, pattern in chunk ]) ))
+        except re.error as e:
+            # Patterns can interfere with each other, e.g. a clashing group name
+            logger.debug("Could not combine patterns, testing separately", exc_info = e)
+            for i, pattern in chunk:
+                self._add_single(i, pattern)
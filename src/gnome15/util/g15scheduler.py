@@ -31,8 +31,8 @@ scheduler = jobqueue.JobScheduler()
 
 '''
 Task scheduler. Tasks may be added to the queue to execute
-after a specified interval. The timer is done by the gobject
-event loop, which then executes the job on a different thread
+after a specified interval. The timers are all run by a single
+timer thread, which then executes the job on the job's queue
 '''
 
 def clear_jobs(queue_name = None):
@@ -51,6 +51,12 @@ def run_on_gobject(function, *args):
         gobject.idle_add(function, *args)
         return True
 
+def get_queue_size(queue_name):
+    return scheduler.get_queue_size(queue_name)
+
+def get_statistics():
+    return scheduler.get_statistics()
+
 def stop_queue(queue_name):
     scheduler.stop_queue(queue_name)
 
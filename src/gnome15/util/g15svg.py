@@ -150,3 +150,42 @@ def get_bounds(element):
         h = float(v)
     return (x, y, w, h)
 
+
+def get_matrix(element):
+    """
+    Get the transformation from the user space of an element to that of the
+    document, or None if the element or any of its ancestors are rotated or
+    skewed (which get_transforms does not support).
+    
+    Keyword arguments:
+    element        -- element
+    """
+    matrix = cairo.Matrix()
+    while element != None:
+        transform_val = element.get("transform")
+        if transform_val != None and ( "rotate" in transform_val or "skew" in transform_val ):
+            return None
+        for t in reversed(get_transforms(element, position_only = True)):
+            matrix = matrix.multiply(t)
+        element = element.getparent()
+    return matrix
+
+def get_document_bounds(element, matrix = None):
+    """
+    Get the rectangle (x, y, width, height) in document space that encloses
+    the x, y, width and height attributes of an element, or None if it cannot
+    be calculated.
+    
+    Keyword arguments:
+    element        -- element
+    matrix         -- the element's transformation if already known
+    """
+    if matrix is None:
+        matrix = get_matrix(element)
+        if matrix is None:
+            return None
+    x, y, w, h = get_bounds(element)
+    points = [ matrix.transform_point(px, py) for px, py in [ ( x, y ), ( x + w, y ), ( x, y + h ), ( x + w, y + h ) ] ]
+    xs = [ p[0] for p in points ]
+    ys = [ p[1] for p in points ]
+    return ( min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys) )
@@ -17,15 +17,24 @@
 import Queue
 import threading
 import traceback
-import sys
-import gobject
+import heapq
+import select
+import os
 import time
-from threading import RLock
 from threading import local
 
 # Can be adjusted to speed up time to aid debugging.
 TIME_FACTOR=1
 
+# Capture the stack of every job submitted, so errors can be traced back to
+# where the job came from. This is also done when debug logging is enabled.
+DEBUG_STACKS=False
+
+# Timers may run early by this fraction of their interval (up to MAX_TIMER_TOLERANCE
+# seconds), so that timers due at about the same time share a single wakeup.
+TIMER_TOLERANCE=0.05
+MAX_TIMER_TOLERANCE=0.05
+
 # Logging
 import logging
 logger = logging.getLogger(__name__)
@@ -60,60 +69,172 @@ class GTimer:
         self.scheduler = scheduler
         self.task_queue = task_queue
         self.task_name = task_name
-        self.source = gobject.timeout_add(int(float(interval) * 1000.0 * TIME_FACTOR), self.exec_item, function, *args)
+        self.args = args
         self.complete = False
-        self.scheduler.all_jobs.append(self)
+        self.cancelled = False
+        self.in_heap = False
+        interval = float(interval) * TIME_FACTOR
+        self.due = time.time() + interval
+        self.tolerance = min(MAX_TIMER_TOLERANCE, interval * TIMER_TOLERANCE)
+        self.scheduler.timers.add(self)
         
-    def exec_item(self, function, *args):
-        try:
-            logger.debug("Executing GTimer %s", str(self.task_name))
-            ji = self.task_queue.run(self.stack, function, *args)
-            logger.debug("Executed GTimer %s", str(self.task_name))
-        finally:
-            self.scheduler.all_jobs_lock.acquire()
-            try:
-                if self in self.scheduler.all_jobs:
-                    self.scheduler.all_jobs.remove(self)
-                self.complete = True
-            finally:
-                self.scheduler.all_jobs_lock.release()
-                # Destroy the timeout, don't execute this function again.
-                return False
+    def exec_item(self):
+        self.complete = True
+        logger.debug("Executing GTimer %s", str(self.task_name))
+        self.task_queue.run(self.stack, self.function, *self.args)
+        logger.debug("Executed GTimer %s", str(self.task_name))
         
     def is_complete(self):
         return self.complete
         
     def cancel(self, *args):
-        self.scheduler.all_jobs_lock.acquire()
-        try:
-            if self in self.scheduler.all_jobs:
-                self.scheduler.all_jobs.remove(self)
-            # Check if callback function was executed, if yes this means that the timeout
-            # was automatically destroyed since the callback function returns False.
-            # Avoid thousands of warnings from source_remove().
-            if not self.is_complete():
-                gobject.source_remove(self.source)
+        if self.function != None and self.scheduler.timers.remove(self):
             logger.debug("Cancelled GTimer %s", str(self.task_name))
+        
+class TimerQueue():
+    """
+    Runs the timers for all queues from a single thread. Timers are kept in
+    a heap ordered by the time they are due, and the thread sleeps in select()
+    until the first is due, or until a new timer is added that is due before
+    it. Cancelled timers are just marked, and skipped when they reach the top
+    of the heap (the heap is rebuilt if they make up most of it). Any other
+    timers that are due within their tolerance are run in the same wakeup.
+    """
+    
+    def __init__(self, name = "Timers"):
+        self.name = name
+        self.heap = []
+        self.sequence = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.wakeups = 0
+        self.dispatched = 0
+        self.coalesced = 0
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        
+    def add(self, timer):
+        self.lock.acquire()
+        try:
+            heapq.heappush(self.heap, ( timer.due, self.sequence, timer ))
+            timer.in_heap = True
+            self.sequence += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target = self._run)
+                self.thread.name = self.name
+                self.thread.setDaemon(True)
+                self.thread.start()
+            elif self.heap[0][2] is timer:
+                # Now the first timer due, so the thread must wait less
+                os.write(self._wakeup_write, "x")
+        finally:
+            self.lock.release()
+            
+    def remove(self, timer):
+        """
+        Cancel a timer, returning True if it had not already been run or 
+        cancelled. A timer that has been taken from the heap but not yet 
+        dispatched will not be run.
+        
+        Keyword arguments:
+        timer        -- timer to cancel
+        """
+        self.lock.acquire()
+        try:
+            if timer.complete or timer.cancelled:
+                return False
+            timer.cancelled = True
+            if timer.in_heap:
+                self.cancelled += 1
+                if self.cancelled > 64 and self.cancelled > len(self.heap) / 2:
+                    self.heap = [ entry for entry in self.heap if not entry[2].cancelled ]
+                    heapq.heapify(self.heap)
+                    self.cancelled = 0
+            return True
+        finally:
+            self.lock.release()
+            
+    def get_timers(self):
+        self.lock.acquire()
+        try:
+            return [ entry[2] for entry in sorted(self.heap) if not entry[2].cancelled ]
         finally:
-            self.scheduler.all_jobs_lock.release()
+            self.lock.release()
+            
+    def get_statistics(self):
+        return { "pending" : float(len(self.heap) - self.cancelled),
+                 "wakeups" : float(self.wakeups),
+                 "dispatched" : float(self.dispatched),
+                 "coalesced" : float(self.coalesced) }
+            
+    def _run(self):
+        while True:
+            self.lock.acquire()
+            try:
+                while len(self.heap) > 0 and self.heap[0][2].cancelled:
+                    heapq.heappop(self.heap)[2].in_heap = False
+                    self.cancelled -= 1
+                timeout = max(0, self.heap[0][0] - time.time()) if len(self.heap) > 0 else None
+            finally:
+                self.lock.release()
+                
+            try:
+                ready = select.select([ self._wakeup_read ], [], [], timeout)[0]
+                if len(ready) > 0:
+                    os.read(self._wakeup_read, 4096)
+            except select.error as e:
+                # Interrupted by a signal
+                logger.debug("Timer wait interrupted", exc_info = e)
+                
+            # Take every timer that is due, or will be within its tolerance
+            due = []
+            self.lock.acquire()
+            try:
+                now = time.time()
+                while len(self.heap) > 0 and self.heap[0][0] - self.heap[0][2].tolerance <= now:
+                    timer = heapq.heappop(self.heap)[2]
+                    timer.in_heap = False
+                    if timer.cancelled:
+                        self.cancelled -= 1
+                    else:
+                        due.append(timer)
+            finally:
+                self.lock.release()
+                
+            if len(due) > 0:
+                self.wakeups += 1
+                self.dispatched += len(due)
+                self.coalesced += len(due) - 1
+            for timer in due:
+                # May have been cancelled since it was taken from the heap
+                self.lock.acquire()
+                try:
+                    if timer.cancelled:
+                        continue
+                    timer.complete = True
+                finally:
+                    self.lock.release()
+                try:
+                    timer.exec_item()
+                except Exception as e:
+                    logger.debug("Error running timer %s", str(timer.task_name), exc_info = e)
         
 '''
 Task scheduler. Tasks may be added to the queue to execute
-after a specified interval. The timer is done by the gobject
-event loop, which then executes the job on a different thread
+after a specified interval. The timers are all run by a single
+timer thread, which then executes the job on the job's queue
 '''
 
 class JobScheduler():
     
     def __init__(self):
         self.queues = {}
-        self.all_jobs = []
-        self.all_jobs_lock = RLock()
+        self.timers = TimerQueue()
         
     def print_all_jobs(self):
         print "Scheduled"
         print "------"
-        for j in self.all_jobs:
+        for j in self.timers.get_timers():
             print "    %s - %s" % ( j.task_name, str(j.function))
         print
         print "Running"
@@ -133,6 +254,20 @@ class JobScheduler():
         if queue_name in self.queues:
             self.queues[queue_name].clear()
             
+    def get_queue_size(self, queue_name):
+        return self.queues[queue_name].work_queue.qsize() if queue_name in self.queues else 0
+    
+    def get_statistics(self):
+        """
+        Get a dictionary of statistics for each queue (see JobQueue.get_statistics()),
+        keyed by queue name. The timer thread's statistics are under "timers"
+        """
+        stats = {}
+        for queue_name, job_queue in self.queues.items():
+            stats[queue_name] = job_queue.get_statistics()
+        stats["timers"] = self.timers.get_statistics()
+        return stats
+            
     def stop_queue(self, queue_name):
         if queue_name in self.queues:
             self.queues[queue_name].stop()
@@ -145,10 +280,9 @@ class JobScheduler():
         self.queues[queue_name].run(self._get_stack(), function, *args)        
         
     def _get_stack(self):
-        try: 1/0
-        except:
-            tb = sys.exc_info()[2]
-            return traceback.extract_stack()[:-5]
+        # Capturing the stack is expensive, and it is only used to log errors
+        if DEBUG_STACKS or logger.isEnabledFor(logging.DEBUG):
+            return traceback.extract_stack()[:-2]
     
     def queue(self, queue_name, name, interval, function, *args):
         if not hasattr(function, "__call__"):
@@ -168,7 +302,9 @@ class JobScheduler():
 
 class JobQueue():
     
-    class JobItem():
+    class JobItem(object):
+        __slots__ = ( "args", "item", "queued", "started", "finished", "stack" )
+        
         def __init__(self, stack, item, args = None):
             self.args = args
             self.item = item
@@ -180,11 +316,17 @@ class JobQueue():
     def __init__(self,number_of_workers=1, name="JobQueue"):
         logger.debug("Creating job queue %s with %d workers", name, number_of_workers)
         self.work_queue = Queue.Queue()
-        self.queued_jobs = []
+        self.queued_jobs = set()
         self.name = name
         self.stopping = False
-        self.all_jobs_lock = threading.Lock()
         self.number_of_workers = number_of_workers
+        self.jobs_run = 0
+        self.jobs_failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+        self.high_water_mark = 0
         self.threads = []
         for __ in range(number_of_workers):
             t = threading.Thread(target = self.worker)
@@ -195,9 +337,32 @@ class JobQueue():
             
     def print_all_jobs(self):
         print "Queue %s" % self.name
-        for s in self.queued_jobs:
+        for s in list(self.queued_jobs):
             print "     %s - %s" % (str(s.item), str(s.queued))
             
+    def get_statistics(self):
+        """
+        Get a dictionary of statistics for this queue. Times are in seconds.
+        
+        jobs              -- number of jobs run
+        failed            -- number of jobs that raised an exception
+        backlog           -- number of jobs waiting to run
+        high_water_mark   -- largest number of jobs that have been waiting to run
+        average_latency   -- average time between a job being queued and started
+        max_latency       -- longest time between a job being queued and started
+        average_run_time  -- average time taken to run a job
+        max_run_time      -- longest time taken to run a job
+        """
+        jobs = self.jobs_run
+        return { "jobs" : float(jobs),
+                 "failed" : float(self.jobs_failed),
+                 "backlog" : float(self.work_queue.qsize()),
+                 "high_water_mark" : float(self.high_water_mark),
+                 "average_latency" : self.total_latency / jobs if jobs > 0 else 0.0,
+                 "max_latency" : self.max_latency,
+                 "average_run_time" : self.total_run_time / jobs if jobs > 0 else 0.0,
+                 "max_run_time" : self.max_run_time }
+            
     def stop(self):
         logger.info("Stopping queue %s", self.name)
         self.stopping = True
@@ -223,8 +388,7 @@ class JobQueue():
                                  str(item.queued),
                                  str(item.started),
                                  str(item.finished))
-                    if item in self.queued_jobs:
-                        self.queued_jobs.remove(item)
+                    self.queued_jobs.discard(item)
             except Queue.Empty as e:
                 logger.debug("The queue is already empty", exc_info = e)
                 pass
@@ -237,18 +401,14 @@ class JobQueue():
             logger.warning("Attempt to run empty job.")
             traceback.print_stack()
             return
-        self.all_jobs_lock.acquire()
-        try :
-            logger.debug("Queued task on %s", self.name)
-            ji = self.JobItem(stack, item, args)
-            self.queued_jobs.append(ji)
-            self.work_queue.put(ji)
-            jobs = self.work_queue.qsize()
-            if jobs > 1:
-                logger.debug("Queue %s filling, now at %d jobs.", self.name, jobs)
-                
-        finally :
-            self.all_jobs_lock.release()
+        ji = self.JobItem(stack, item, args)
+        self.queued_jobs.add(ji)
+        self.work_queue.put(ji)
+        jobs = self.work_queue.qsize()
+        if jobs > self.high_water_mark:
+            self.high_water_mark = jobs
+        if jobs > 1:
+            logger.debug("Queue %s filling, now at %d jobs.", self.name, jobs)
         return ji
             
     def worker(self):
@@ -257,23 +417,25 @@ class JobQueue():
             item = self.work_queue.get()
             try:
                 if item != None:
+                    item.started = time.time()
                     try:
-                        logger.debug("Running task on %s", self.name)
-                        item.started = time.time()
                         if item.args and len(item.args) > 0:
                             item.item(*item.args)
                         else:
                             item.item()
                         item.finished = time.time()
-                        logger.debug("Ran task on %s", self.name)
                     finally:
-                        if item in self.queued_jobs: 
-                            self.queued_jobs.remove(item)
+                        self.queued_jobs.discard(item)
+                        self._update_statistics(item)
             except Exception as a:
+                self.jobs_failed += 1
                 try:
                     logger.debug("Error on worker", exc_info = a)
                     logger.debug("Caused by job")
-                    logger.debug("%s\n", item.stack)
+                    if item.stack is None:
+                        logger.debug("Stack of job not captured, enable debug logging or jobqueue.DEBUG_STACKS to see it.\n")
+                    else:
+                        logger.debug("%s\n", item.stack)
                 except Exception as e:
                     logger.debug("Could not log error on worker", exc_info = e)
                     pass
@@ -284,4 +446,14 @@ class JobQueue():
                 logger.info("Exited queue %s", self.name)
             except Exception as e:
                 pass
- 
+            
+    def _update_statistics(self, item):
+        latency = item.started - item.queued
+        run_time = ( item.finished if item.finished is not None else time.time() ) - item.started
+        self.jobs_run += 1
+        self.total_latency += latency
+        self.total_run_time += run_time
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if run_time > self.max_run_time:
+            self.max_run_time = run_time
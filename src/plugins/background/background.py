@@ -42,6 +42,7 @@ copyright="Copyright (C)2010 Brett Smith"
 site="http://www.russo79.com/gnome15"
 has_preferences=True
 unsupported_models = [ g15driver.MODEL_G110, g15driver.MODEL_G11, g15driver.MODEL_G930, g15driver.MODEL_G35 ]
+needs_gobject_thread=True
 
 def create(gconf_key, gconf_client, screen):
     return G15Background(gconf_key, gconf_client, screen)
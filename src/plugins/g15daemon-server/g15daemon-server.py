@@ -464,6 +464,12 @@ class G15DaemonServer():
     def join(self, client):
         self.clients.append(client)
                     
+    def is_handling_keys(self):
+        for client in list(self.clients):
+            if client.enable_keys:
+                return True
+        return False
+                    
     def handle_key(self, keys, state, post):
         if ( not post and self.take_over_macro_keys ) or ( post and not self.take_over_macro_keys ):
             visible = self.screen.get_visible_page()    
@@ -298,7 +298,7 @@ class ContactMenu(g15theme.Menu):
         page -- page object
         mode -- display mode
         """
-        g15theme.Menu.__init__(self, "menu")
+        g15theme.Menu.__init__(self, "menu", virtual = True)
         self.mode = mode
         self.on_update = None
         if not self.mode:
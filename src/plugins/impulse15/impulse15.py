@@ -39,6 +39,7 @@ copyright="Copyright (C)2010 Brett Smith, Ian Halpern"
 site="https://launchpad.net/impulse.bzr"
 unsupported_models = [ g15driver.MODEL_G930, g15driver.MODEL_G35 ]
 has_preferences=True
+needs_gobject_thread=True
 
 def get_source_index(source_name):
     status, output = g15os.get_command_output("pacmd list-sources")
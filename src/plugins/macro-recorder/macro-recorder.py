@@ -147,6 +147,9 @@ class G15MacroRecorder():
                 self._cancel_macro(None)
                 return True
     
+    def is_handling_keys(self):
+        return self._record_thread is not None
+    
     def handle_key(self, keys, state, post):
         # Memory keys
                             
@@ -280,6 +283,7 @@ class G15MacroRecorder():
         self._key_down = None
         self._record_key = None
         self._record_thread = None
+        self._screen.key_handler.resume_fast_path(self)
         
     def _cancel_macro(self,event = None,data=None):
         self._halt_recorder()
@@ -303,6 +307,9 @@ class G15MacroRecorder():
         self.icon = "media-record"
         self._message = None
         self._redraw()
+        
+        # The key to record to must reach this plugin, even if it is mapped to uinput
+        self._screen.key_handler.suspend_fast_path(self)
         self._record_thread = RecordThread(self._record_callback)
         self._record_thread.start()
         self._lights_control = self._screen.driver.acquire_control_with_hint(g15driver.HINT_MKEYS)
@@ -45,6 +45,7 @@ copyright=_("Copyright (C)2011 Brett Smith")
 site="http://www.russo79.com/gnome15"
 has_preferences=True
 unsupported_models = [ g15driver.MODEL_G110, g15driver.MODEL_G11, g15driver.MODEL_G930, g15driver.MODEL_G35 ]
+needs_gobject_thread=True
 actions={ 
          g15driver.PREVIOUS_SELECTION : _("Previous mount"), 
          g15driver.NEXT_SELECTION : _("Next mount"),
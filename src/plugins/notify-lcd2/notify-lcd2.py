@@ -477,6 +477,9 @@ class G15NotifyLCD():
     def destroy(self):
         pass 
                     
+    def is_handling_keys(self):
+        return self._screen.get_page("NotifyLCD") is not None
+                    
     def handle_key(self, keys, state, post):
         if not post and state == g15driver.KEY_STATE_UP:            
             page = self._screen.get_page("NotifyLCD")
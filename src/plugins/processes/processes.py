@@ -23,6 +23,7 @@ import gnome15.util.g15icontools as g15icontools
 import gnome15.g15theme as g15theme
 import gnome15.g15driver as g15driver
 import gnome15.g15plugin as g15plugin
+import gnome15.g15top as g15top
 import os
 import dbus
 import time
@@ -117,6 +118,8 @@ class G15Processes(g15plugin.G15MenuPlugin):
         self._mode = "applications"
         self._timer = None
         self._matches = []
+        self._process_table = g15top.ProcessTable()
+        self._items_mode = None
         g15plugin.G15MenuPlugin.activate(self)
         self.screen.key_handler.action_listeners.append(self)
         if self.bamf_matcher is not None:        
@@ -154,8 +157,9 @@ class G15Processes(g15plugin.G15MenuPlugin):
                 return True
     
     def create_menu(self):
-        menu = g15plugin.G15MenuPlugin.create_menu(self)
+        menu = g15theme.Menu("menu", virtual = True)
         menu.on_move = self._reschedule
+        self._items_mode = None
         return menu
     
     def create_page(self):
@@ -301,8 +305,8 @@ class G15Processes(g15plugin.G15MenuPlugin):
         if not self.active:
             return
         
-        this_items = {}        
         if self._mode == "applications":
+            this_items = {}
             if self.bamf_matcher != None:            
                 for window in self.bamf_matcher.RunningApplications():
                     try:
@@ -324,31 +328,17 @@ class G15Processes(g15plugin.G15MenuPlugin):
                         if pixbuf:
                             item.icon = g15cairo.pixbuf_to_surface(pixbuf)
                                 
+            # Remove any missing items
+            for item in self.menu.get_children():
+                if not item.id in this_items:
+                    self.menu.remove_child(item)
+            self._items_mode = self._mode
         else:
-            for process_id in gtop.proclist():
-                process_id = "%d" %  process_id
-                try :
-                    pid = int(process_id)
-                    proc_state = gtop.proc_state(pid)
-                    proc_args = gtop.proc_args(pid)
-                    if self._mode == "all" or ( self._mode != "all" and proc_state.uid == os.getuid()):                      
-                        item = self._get_menu_item(pid)
-                        item.icon = None
-                        item.process_name = self._get_process_name(proc_args, proc_state.cmd)
-                        this_items[item.id] = item
-                except Exception as e:
-                    logger.debug("Process may have disappeared", exc_info = e)
-                    # In case the process disappears
-                    pass
- 
-        # Remove any missing items
-        for item in self.menu.get_children():
-            if not item.id in this_items:
-                self.menu.remove_child(item)
+            self._update_process_items()
         
         # Make sure selected still exists
         if self.menu.selected != None and self.menu.get_child_by_id(self.menu.selected.id) is None:
-            if len(self.menu.get_child_count()) > 0:
+            if self.menu.get_child_count() > 0:
                 self.menu.selected  = self.menu.get_children()[0]
             else:
                 self.menu.selected = None
@@ -356,6 +346,31 @@ class G15Processes(g15plugin.G15MenuPlugin):
         self.page.mark_dirty()
         self.screen.redraw(self.page)
         
+    def _update_process_items(self):
+        """
+        Only processes that have started or finished since the last refresh
+        are looked at, unless the menu contains items from a different mode
+        in which case it is rebuilt from the whole process table.
+        """
+        added, removed = self._process_table.scan()
+        if self._items_mode != self._mode:
+            self.menu.remove_all_children()
+            added = self._process_table.get_processes()
+            removed = []
+            self._items_mode = self._mode
+            
+        for process in removed:
+            item = self.menu.get_child_by_id("process-%s" % process.pid)
+            if item is not None:
+                self.menu.remove_child(item)
+                
+        uid = os.getuid()
+        for process in added:
+            if self._mode == "all" or process.uid == uid:
+                item = self._get_menu_item(process.pid)
+                item.icon = None
+                item.process_name = self._get_process_name(process.args, process.name)
+        
     def _on_move(self):
         self._reschedule()
         
@@ -215,7 +215,7 @@ class G15FeedPage(g15theme.G15Page):
         self._selected_icon_embedded = None
         self.url = url
         self.index = -1
-        self._menu = g15theme.Menu("menu")
+        self._menu = g15theme.Menu("menu", virtual = True)
         self._menu.on_selected = self._on_selected
         g15theme.G15Page.__init__(self, "Feed " + str(plugin._page_serial), self._screen,
                                      thumbnail_painter=self._paint_thumbnail,
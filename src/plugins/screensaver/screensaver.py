@@ -153,6 +153,9 @@ class G15ScreenSaver():
         if self._session_bus:
             self._session_bus.remove_signal_receiver(self._screensaver_changed_handler, dbus_interface = self._dbus_interface, signal_name = "ActiveChanged")
         
+    def is_handling_keys(self):
+        return self._page is not None
+        
     def handle_key(self, keys, state, post):
         # Sinks all keyboard events when the page is active
         return self._page is not None
@@ -164,6 +167,7 @@ class G15ScreenSaver():
         if self._page != None:
             self._screen.del_page(self._page)
             self._page = None
+            self._screen.key_handler.resume_fast_path(self)
             
     def _check_page(self):
         if self._in_screensaver:
@@ -174,6 +178,9 @@ class G15ScreenSaver():
                                               theme_properties_callback = self._get_theme_properties,
                                               originating_plugin = self)
                 self._page.key_handlers.append(self)
+                
+                # All keys are sunk while the screensaver is showing
+                self._screen.key_handler.suspend_fast_path(self)
                 self._screen.add_page(self._page)
                 self._screen.redraw(self._page)
             if not self.dimmed and g15gconf.get_bool_or_default(self._gconf_client, "%s/dim_keyboard" % self._gconf_key, True):
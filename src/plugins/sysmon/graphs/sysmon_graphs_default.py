@@ -17,8 +17,7 @@
 import gnome15.g15theme as g15theme
 import gnome15.g15driver as g15driver
 import gnome15.util.g15convert as g15convert
-import cairoplot
-import cairo
+import gnome15.util.g15history as g15history
 
 def create(theme):
     page = theme.component
@@ -34,6 +33,10 @@ def destroy(theme):
 #    page.remove_child(page.get_child_by_id("mem"))
     
 class G15Graph(g15theme.Component):
+    """
+    Area graph of one or more series, each drawn as a single path straight
+    from the plugin's history without copying the values
+    """
     
     def __init__(self, component_id, plugin):
         g15theme.Component.__init__(self, component_id)
@@ -46,35 +49,51 @@ class G15Graph(g15theme.Component):
             highlight_color = self.plugin.screen.driver.get_color_as_ratios(g15driver.HINT_HIGHLIGHT, (255, 0, 0 ))
             return (highlight_color[0],highlight_color[1],highlight_color[2], 1.0), \
                    (highlight_color[0],highlight_color[1],highlight_color[2], 0.50)
+            
+    def get_alt_colors(self, series_color, fill_color):
+        if self.plugin.screen.driver.get_bpp() == 1:
+            return (1.0,1.0,1.0,1.0), (1.0,1.0,1.0,1.0)
+        return g15convert.get_alt_color(series_color), g15convert.get_alt_color(fill_color)
         
-    def create_plot(self, graph_surface):
+    def get_series(self):
+        """
+        Get a list of ( values, series_color, fill_color ) tuples to draw
+        """
+        raise Exception("Not implemented")
+    
+    def get_y_bounds(self):
         raise Exception("Not implemented")
+    
+    def get_y_labels(self):
+        return []
         
     def paint(self, canvas):
         g15theme.Component.paint(self, canvas)    
         if self.view_bounds:
-            graph_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 
-                                               int(self.view_bounds[2]), 
-                                               int(self.view_bounds[3]))
-            plot =  self.create_plot(graph_surface)
+            x, y, width, height = self.view_bounds
+            min_y, max_y = self.get_y_bounds()
+            mono = self.plugin.screen.driver.get_bpp() == 1
             
-            if self.plugin.screen.driver.get_bpp() == 1:
-                plot.line_color = (1.0,1.0,1.0)
-                plot.line_width = 1.0
-                plot.display_labels = False
-            else:
-                plot.line_width = 2.0
-                plot.bounding_box = False
-                plot.line_color = self.plugin.screen.driver.get_color_as_ratios(g15driver.HINT_FOREGROUND, (255, 255, 255))
-                plot.label_color = self.plugin.screen.driver.get_color_as_ratios(g15driver.HINT_FOREGROUND, (255, 255, 255))
-            plot.shadow = True
-            plot.render()
-            plot.commit()
+            canvas.save()
+            canvas.rectangle(x, y, width, height)
+            canvas.clip()
+            canvas.set_line_width(1.0 if mono else 2.0)
+            for values, series_color, fill_color in self.get_series():
+                g15history.append_path(canvas, values, x, y, width, height, max_y, min_y, close = True)
+                canvas.set_source_rgba(*fill_color)
+                canvas.fill()
+                g15history.append_path(canvas, values, x, y, width, height, max_y, min_y)
+                canvas.set_source_rgba(*series_color)
+                canvas.stroke()
             
-            canvas.save()    
-            canvas.translate(self.view_bounds[0], self.view_bounds[1])
-            canvas.set_source_surface(graph_surface, 0.0, 0.0)
-            canvas.paint()
+            if not mono:
+                labels = self.get_y_labels()
+                if len(labels) > 1:
+                    canvas.set_source_rgb(*self.plugin.screen.driver.get_color_as_ratios(g15driver.HINT_FOREGROUND, (255, 255, 255)))
+                    canvas.set_font_size(10.0)
+                    for i, label in enumerate(labels):
+                        canvas.move_to(x + 2, y + height - 2 - ( height - 12 ) * i / ( len(labels) - 1 ))
+                        canvas.show_text(label.strip())
             canvas.restore()
 
 class G15CPUGraph(G15Graph):
@@ -82,18 +101,15 @@ class G15CPUGraph(G15Graph):
     def __init__(self, component_id, plugin):
         G15Graph.__init__(self, component_id, plugin)
         
-    def create_plot(self, graph_surface):
-        series_colors, fill_colors = self.get_colors()
-        return cairoplot.AreaPlot(graph_surface, self.plugin.selected_cpu.history, 
-                                 self.view_bounds[2], 
-                                 self.view_bounds[3], 
-                                 background = None,
-                                 grid = False, 
-                                 x_labels = [],
-                                 y_labels = ["%-6d" % 0, "%-6d" % 50, "%-6d" % 100],
-                                 y_bounds = (0, 100),
-                                 series_colors = [ series_colors ],
-                                 fill_colors = [ fill_colors ])
+    def get_series(self):
+        series_color, fill_color = self.get_colors()
+        return [ ( self.plugin.selected_cpu.history.get(self.plugin.graph_window), series_color, fill_color ) ]
+    
+    def get_y_bounds(self):
+        return 0, 100
+    
+    def get_y_labels(self):
+        return [ "%-6d" % 0, "%-6d" % 50, "%-6d" % 100 ]
 
 
 class G15NetGraph(G15Graph):
@@ -101,28 +117,27 @@ class G15NetGraph(G15Graph):
     def __init__(self, component_id, plugin):
         G15Graph.__init__(self, component_id, plugin)
         
-    def create_plot(self, graph_surface):
+    def get_series(self):
+        net = self.plugin.selected_net
+        if net is None:
+            return []
+        series_color, fill_color = self.get_colors()
+        alt_series_color, alt_fill_color = self.get_alt_colors(series_color, fill_color)
+        return [ ( net.send_history.get(self.plugin.graph_window), series_color, fill_color ),
+                 ( net.recv_history.get(self.plugin.graph_window), alt_series_color, alt_fill_color ) ]
+    
+    def get_y_bounds(self):
+        net = self.plugin.selected_net
+        if net is None:
+            return 0, 102400
+        return 0, max(max(net.max_send, net.max_recv), 102400)
+        
+    def get_y_labels(self):
         y_labels = []
-        max_y = max(max(self.plugin.selected_net.max_send, self.plugin.selected_net.max_recv), 102400)
+        max_y = self.get_y_bounds()[1]
         for x in range(0, int(max_y), int(max_y / 4)):
             y_labels.append("%-3.2f" % ( float(x) / 102400.0 ) )
-        series_color, fill_color = self.get_colors()            
-        if self.plugin.screen.driver.get_bpp() == 1:
-            alt_series_color = (1.0,1.0,1.0,1.0)
-            alt_fill_color = (1.0,1.0,1.0,1.0)
-        else:
-            alt_series_color = g15convert.get_alt_color(series_color)
-            alt_fill_color = g15convert.get_alt_color(fill_color)
-        return cairoplot.AreaPlot( graph_surface, [ self.plugin.selected_net.send_history, self.plugin.selected_net.recv_history ], 
-                                      self.view_bounds[2], 
-                                      self.view_bounds[3], 
-                                      background = None,
-                                      grid = False, 
-                                      x_labels = [],
-                                      y_labels = y_labels,
-                                      y_bounds = (0, max_y ),
-                                      series_colors = [ series_color, alt_series_color ],
-                                      fill_colors = [ fill_color, alt_fill_color ]  )
+        return y_labels
 
 class G15MemGraph(G15Graph):
     """
@@ -131,26 +146,18 @@ class G15MemGraph(G15Graph):
     def __init__(self, component_id, plugin):
         G15Graph.__init__(self, component_id, plugin)
         
-    def create_plot(self, graph_surface):
+    def get_series(self):
+        series_color, fill_color = self.get_colors()
+        alt_series_color, alt_fill_color = self.get_alt_colors(series_color, fill_color)
+        return [ ( self.plugin.used_history.get(self.plugin.graph_window), series_color, fill_color ),
+                 ( self.plugin.cached_history.get(self.plugin.graph_window), alt_series_color, alt_fill_color ) ]
+    
+    def get_y_bounds(self):
+        return 0, self.plugin.max_total_mem
+        
+    def get_y_labels(self):
         y_labels = []
         max_y = self.plugin.max_total_mem
         for x in range(0, int(max_y), int(max_y / 4)):
             y_labels.append("%-4d" % int( float(x) / 1024.0 / 1024.0 ) )
-        series_color, fill_color = self.get_colors()
-        
-        if self.plugin.screen.driver.get_bpp() == 1:
-            alt_series_color = (1.0,1.0,1.0,1.0)
-            alt_fill_color = (1.0,1.0,1.0,1.0)
-        else:
-            alt_series_color = g15convert.get_alt_color(series_color)
-            alt_fill_color = g15convert.get_alt_color(fill_color)
-        return cairoplot.AreaPlot( graph_surface, [ self.plugin.used_history, self.plugin.cached_history ], 
-                                      self.view_bounds[2], 
-                                      self.view_bounds[3], 
-                                      background = None,
-                                      grid = False, 
-                                      x_labels = [],
-                                      y_labels = y_labels,
-                                      y_bounds = (0, max_y ),
-                                      series_colors = [ series_color, alt_series_color ],
-                                      fill_colors = [ fill_color, alt_fill_color ]  )
\ No newline at end of file
+        return y_labels
@@ -22,6 +22,7 @@ import gnome15.util.g15uigconf as g15uigconf
 import gnome15.util.g15gconf as g15gconf
 import gnome15.util.g15cairo as g15cairo
 import gnome15.util.g15icontools as g15icontools
+import gnome15.util.g15history as g15history
 import gnome15.g15driver as g15driver
 import gnome15.g15plugin as g15plugin
 import time
@@ -69,6 +70,7 @@ def show_preferences(parent, driver, gconf_client, gconf_key):
     dialog = widget_tree.get_object("SysmonDialog")
     dialog.set_transient_for(parent)    
     g15uigconf.configure_checkbox_from_gconf(gconf_client, gconf_key + "/show_cpu_on_panel", "ShowCPUUsageOnPanel", True, widget_tree)
+    g15uigconf.configure_combo_from_gconf(gconf_client, gconf_key + "/graph_window", "GraphWindow", g15history.RECENT, widget_tree)
     dialog.run()
     dialog.hide()
     
@@ -82,8 +84,8 @@ class Net():
         self.last_net_list = None
         self.max_send = 0.0001  
         self.max_recv = 0.0001
-        self.send_history = [0] * GRAPH_SIZE
-        self.recv_history =  [0] * GRAPH_SIZE
+        self.send_history = g15history.History(GRAPH_SIZE)
+        self.recv_history = g15history.History(GRAPH_SIZE)
         self.last_net_list = None
         self.last_time = 0
         
@@ -117,12 +119,8 @@ class Net():
             self.max_send = self.send_bps
                         
         # History
-        self.send_history.append(self.recv_bps)
-        while len(self.send_history) > GRAPH_SIZE:
-            del self.send_history[0]
-        self.recv_history.append(self.send_bps)
-        while len(self.recv_history) > GRAPH_SIZE:
-            del self.recv_history[0]
+        self.send_history.append(self.recv_bps, now)
+        self.recv_history.append(self.send_bps, now)
             
         self.last_net_list = this_net_list 
         self.last_time = now
@@ -144,7 +142,7 @@ class CPU():
     def __init__(self, number):
         self.number = number 
         self.name = "cpu%d" % number if number >= 0 else "cpu"
-        self.history = [0] * GRAPH_SIZE
+        self.history = g15history.History(GRAPH_SIZE)
         self.value = 0
         self.times = None
         self.last_times = None
@@ -167,10 +165,7 @@ class CPU():
         
         self.last_times = time_list
         
-        # Update the history and trim it to the graph data size
         self.history.append(self.pc)
-        while len(self.history) > GRAPH_SIZE:
-            del self.history[0]       
         
     def get_pc(self, times):
         sum_l = sum(times)
@@ -240,12 +235,14 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         self.cached = 0
         self.free = 0
         self.used = 0
-        self.cached_history = [0] * GRAPH_SIZE
-        self.used_history =  [0] * GRAPH_SIZE 
+        self.cached_history = g15history.History(GRAPH_SIZE)
+        self.used_history = g15history.History(GRAPH_SIZE)
         
+        self._load_graph_window()
         g15plugin.G15RefreshingPlugin.activate(self)
         self._set_panel()
         self.watch(["show_cpu_on_panel","theme"], self._config_changed)
+        self.watch("graph_window", self._graph_window_changed)
         self.screen.key_handler.action_listeners.append(self)
         
         # Start refreshing
@@ -290,8 +287,9 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         '''
         CPU
         '''
+        cpu_times = gtop.cpu()
         for c in self.cpu_data:            
-            c.new_times(self._get_time_list(c))
+            c.new_times(self._get_time_list(c, cpu_times))
         
         '''
         Net
@@ -312,13 +310,8 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         self.used = self.total - self.free
         self.cached = float(mem.cached)
         self.noncached = self.total - self.free - self.cached
-        self.used_history.append(self.used + self.cached)
-        
-        while len(self.used_history) > GRAPH_SIZE:
-            del self.used_history[0]
-        self.cached_history.append(self.cached)
-        while len(self.cached_history) > GRAPH_SIZE:
-            del self.cached_history[0]
+        self.used_history.append(self.used + self.cached, now)
+        self.cached_history.append(self.cached, now)
         
         self.last_time = now
     
@@ -328,6 +321,13 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         self.reload_theme()
         self._reschedule_refresh()
             
+    def _graph_window_changed(self, client, connection_id, entry, args):
+        self._load_graph_window()
+        self.screen.redraw(self.page)
+        
+    def _load_graph_window(self):
+        self.graph_window = g15gconf.get_string_or_default(self.gconf_client, self.gconf_key + "/graph_window", g15history.RECENT)
+            
     def _set_panel(self, client = None, connection_id = None, entry = None, args = None):        
         self.page.panel_painter = self._paint_panel if g15gconf.get_bool_or_default(self.gconf_client, self.gconf_key + "/show_cpu_on_panel", True) else None
         
@@ -450,7 +450,7 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         return ifs, nets
 
     
-    def _get_time_list(self, cpu):
+    def _get_time_list(self, cpu, all_cpu_times):
         '''
         Returns a 4 element list containing the amount of time the CPU has 
         spent performing the different types of work
@@ -463,9 +463,9 @@ class G15SysMon(g15plugin.G15RefreshingPlugin):
         Values are in USER_HZ or Jiffies
         ''' 
         if cpu.number == -1:
-            cpu_times = gtop.cpu()
+            cpu_times = all_cpu_times
         else:
-            cpu_times = gtop.cpu().cpus[cpu.number]
+            cpu_times = all_cpu_times.cpus[cpu.number]
         return [cpu_times.user, cpu_times.nice, cpu_times.sys, cpu_times.idle]
     
     def _get_mem_info(self):
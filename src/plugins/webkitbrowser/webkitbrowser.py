@@ -32,6 +32,7 @@ copyright="Copyright (C)2010 Brett Smith"
 site="http://www.gnome15.org/"
 has_preferences=False
 supported_models = [ g15driver.MODEL_G19 ]
+needs_gobject_thread=True
 
 def create(gconf_key, gconf_client, screen):
     return G15WebkitBrowser(gconf_client, gconf_key, screen)
@@ -25,6 +25,11 @@ import logging
 import array
 logger = logging.getLogger(__name__)
 
+# Header that must precede the pixel data of every frame
+FRAME_HEADER = bytearray([0x10, 0x0F, 0x00, 0x58, 0x02, 0x00, 0x00, 0x00,
+                          0x00, 0x00, 0x00, 0x3F, 0x01, 0xEF, 0x00, 0x0F] + range(16, 256) + range(256))
+FRAME_DATA_LENGTH = 320 * 240 * 2
+
 class G19(object):
     '''Simple access to Logitech G19 features.
 
@@ -42,13 +47,6 @@ class G19(object):
         self.__usbDeviceMutex = threading.Lock()
         self.__keyReceiver = G19Receiver(self)
         self.__threadDisplay = None
-        
-        self.__frame_content = [0x10, 0x0F, 0x00, 0x58, 0x02, 0x00, 0x00, 0x00,
-                 0x00, 0x00, 0x00, 0x3F, 0x01, 0xEF, 0x00, 0x0F]
-        for i in range(16, 256):
-            self.__frame_content.append(i)
-        for i in range(256):
-            self.__frame_content.append(i)
 
     @staticmethod
     def convert_image_to_frame(filename):
@@ -215,11 +213,27 @@ class G19(object):
         (data[239 * 2], data[239 * 2 + 1]) the lower left one.
 
         '''
-        if len(data) != (320 * 240 * 2):
+        if len(data) != FRAME_DATA_LENGTH:
             raise ValueError("illegal frame size: " + str(len(data))
-                    + " should be 320x240x2=" + str(320 * 240 * 2))
-        frame = list(self.__frame_content)
-        frame += data
+                    + " should be 320x240x2=" + str(FRAME_DATA_LENGTH))
+        frame = bytearray(FRAME_HEADER)
+        frame.extend(data)
+        self.send_frame_buffer(frame)
+
+    def send_frame_buffer(self, frame):
+        '''Sends a complete frame to the display.
+
+        @param frame FRAME_HEADER followed by the frame data as described
+        in send_frame(), as a string or bytearray. This is written to the
+        device as is, so callers may reuse the same buffer for every frame.
+
+        '''
+        if len(frame) != len(FRAME_HEADER) + FRAME_DATA_LENGTH:
+            raise ValueError("illegal frame size: " + str(len(frame))
+                    + " should be " + str(len(FRAME_HEADER) + FRAME_DATA_LENGTH))
+        if isinstance(frame, bytearray):
+            # Both pyusb APIs copy a string in a single pass
+            frame = str(frame)
 
         self.__usbDeviceMutex.acquire()
         try:
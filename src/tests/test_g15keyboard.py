@@ -0,0 +1,118 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Checks that keys mapped to uinput only bypass the macro queue when no legacy
+key handler may want them. Run with "python -m unittest discover src/tests"
+'''
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gnome15"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import g15keyboard
+import g15driver
+
+class Macro(object):
+    type = "keyboard"
+    def get_uinput_code(self):
+        return 30
+    
+class Device(object):
+    uid = "test"
+    
+class Driver(object):
+    def get_action_keys(self):
+        return {}
+    
+class Screen(object):
+    device = Device()
+    driver = Driver()
+    conf_client = None
+    
+class Handler(object):
+    def __init__(self, handling = None):
+        self.handling = handling
+        self.keys = []
+        if handling is not None:
+            self.is_handling_keys = lambda: self.handling
+        
+    def handle_key(self, keys, state_id, post):
+        self.keys.append(( keys, state_id, post ))
+        return True
+
+class FastPathTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.emitted = []
+        self.queued = []
+        self._emit = g15keyboard.g15uinput.emit
+        self._execute = g15keyboard.g15scheduler.execute
+        g15keyboard.g15uinput.emit = lambda t, code, value: self.emitted.append(( code, value ))
+        g15keyboard.g15scheduler.execute = lambda queue_name, name, function, *args: self.queued.append(args[:2])
+        self.key_handler = g15keyboard.G15KeyHandler(Screen())
+        self.key_handler._G15KeyHandler__macro_index.passthrough_macros[g15driver.G_KEY_G1] = Macro()
+        
+    def tearDown(self):
+        g15keyboard.g15uinput.emit = self._emit
+        g15keyboard.g15scheduler.execute = self._execute
+        
+    def press(self, state_id):
+        self.key_handler.key_received([ g15driver.G_KEY_G1 ], state_id)
+        
+    def test_fast_path(self):
+        self.key_handler.key_handlers.append(Handler(False))
+        self.press(g15driver.KEY_STATE_DOWN)
+        self.press(g15driver.KEY_STATE_HELD)
+        self.press(g15driver.KEY_STATE_UP)
+        self.assertEqual([ ( 30, 1 ), ( 30, 0 ) ], self.emitted)
+        self.assertEqual([], self.queued)
+        
+    def test_claimed_key_is_never_emitted(self):
+        for handler in [ Handler(), Handler(True) ]:
+            self.setUp()
+            self.key_handler.key_handlers.append(handler)
+            for state_id in [ g15driver.KEY_STATE_DOWN, g15driver.KEY_STATE_HELD, g15driver.KEY_STATE_UP ]:
+                self.press(state_id)
+            self.assertEqual([], self.emitted)
+            self.assertEqual(3, len(self.queued))
+            self.tearDown()
+        
+    def test_suspended(self):
+        self.key_handler.suspend_fast_path(self)
+        self.press(g15driver.KEY_STATE_DOWN)
+        self.assertEqual([], self.emitted)
+        self.key_handler.resume_fast_path(self)
+        self.press(g15driver.KEY_STATE_DOWN)
+        self.assertEqual([ ( 30, 1 ) ], self.emitted)
+        
+    def test_release_follows_press(self):
+        # A handler that starts wanting keys mid press does not see just the release 
+        handler = Handler(False)
+        self.key_handler.key_handlers.append(handler)
+        self.press(g15driver.KEY_STATE_DOWN)
+        handler.handling = True
+        self.press(g15driver.KEY_STATE_HELD)
+        self.press(g15driver.KEY_STATE_UP)
+        self.assertEqual([ ( 30, 1 ), ( 30, 0 ) ], self.emitted)
+        self.assertEqual([], self.queued)
+        self.press(g15driver.KEY_STATE_DOWN)
+        self.assertEqual(1, len(self.queued))
+        
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Checks the matchers give the same result as testing each pattern in turn.
+Run with "python -m unittest discover src/tests"
+'''
+
+import os
+import re
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gnome15", "util"))
+
+import g15matcher
+
+PATTERNS = [ "Foo", "(?i)bar", "^Terminal", "\\d+ - Mozilla Firefox$", "(a)\\1", "Gimp.*Image",
+             "[", None, "(?P<x>name)", "(?P<x>other)", "(?s)line.end", "(?m)^second", "x|y" ]
+
+TEXTS = [ "", "foo", "Foo", "BAR", "a bar", "Terminal - bash", "bash - Terminal", "12 - Mozilla Firefox",
+          "Mozilla Firefox", "aa", "ab", "Gimp - Image 1", "name", "other", "line\nend", "first\nsecond",
+          "zzz", "y" ]
+
+def first_match(patterns, text):
+    for i, pattern in enumerate(patterns):
+        if pattern is None:
+            continue
+        try:
+            if re.search(pattern, text):
+                return i
+        except re.error:
+            pass
+
+class RegexMatcherTest(unittest.TestCase):
+    
+    def test_same_as_search(self):
+        # Every ordering of the patterns, so each may end up in a chunk with any other
+        for start in range(len(PATTERNS)):
+            patterns = PATTERNS[start:] + PATTERNS[:start]
+            matcher = g15matcher.RegexMatcher(patterns)
+            for text in TEXTS:
+                self.assertEqual(first_match(patterns, text), matcher.match(text), 
+                                 "%s in %s" % ( repr(text), patterns ))
+                
+    def test_inline_flags_do_not_leak(self):
+        matcher = g15matcher.RegexMatcher([ "Foo", "(?i)bar" ])
+        self.assertEqual(None, matcher.match("foo"))
+        self.assertEqual(1, matcher.match("BAR"))
+        
+class SubstringMatcherTest(unittest.TestCase):
+    
+    def test_same_as_find(self):
+        patterns = [ "abc", "bc", "", "c", "xyz", "abcd" ]
+        for start in range(len(patterns)):
+            rotated = patterns[start:] + patterns[:start]
+            matcher = g15matcher.SubstringMatcher(rotated)
+            for text in [ "", "abcd", "xbc", "c", "xy", "zzxyz" ]:
+                expected = None
+                for i, pattern in enumerate(rotated):
+                    if pattern in text:
+                        expected = i
+                        break
+                self.assertEqual(expected, matcher.match(text))
+        
+if __name__ == "__main__":
+    unittest.main()
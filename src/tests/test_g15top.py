@@ -0,0 +1,93 @@
+#  Gnome15 - Suite of tools for the Logitech G series keyboards and headsets
+#  Copyright (C) 2010 Brett Smith <tanktarta@blueyonder.co.uk>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Checks the process table reports the processes that start and finish
+between scans, including when a process ID is re-used.
+Run with "python -m unittest discover src/tests"
+'''
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gnome15"))
+
+import g15top
+
+class FakeProcessTable(g15top.ProcessTable):
+    """
+    Reads processes from a dictionary of process ID to start time instead
+    of /proc, counting how many processes have their details read
+    """
+    def __init__(self):
+        g15top.ProcessTable.__init__(self)
+        self.running = {}
+        self.reads = 0
+
+    def _list_pids(self):
+        return self.running.keys()
+
+    def _read_stat(self, pid):
+        if pid in self.running:
+            return "proc%d" % pid, self.running[pid]
+
+    def _read_process(self, pid, start_time, name):
+        self.reads += 1
+        return g15top.Process(pid, start_time, 0, name, [ name ])
+
+def keys(processes):
+    return sorted([ ( p.pid, p.start_time ) for p in processes ])
+
+class ProcessTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeProcessTable()
+        self.proclist = g15top.proclist
+        g15top.proclist = self.table._list_pids
+
+    def tearDown(self):
+        g15top.proclist = self.proclist
+
+    def test_added_and_removed(self):
+        self.table.running = { 1 : 10, 2 : 20 }
+        added, removed = self.table.scan()
+        self.assertEqual(keys(added), [ ( 1, 10 ), ( 2, 20 ) ])
+        self.assertEqual(removed, [])
+
+        self.table.running = { 2 : 20, 3 : 30 }
+        added, removed = self.table.scan()
+        self.assertEqual(keys(added), [ ( 3, 30 ) ])
+        self.assertEqual(keys(removed), [ ( 1, 10 ) ])
+        self.assertEqual(keys(self.table.get_processes()), [ ( 2, 20 ), ( 3, 30 ) ])
+
+    def test_unchanged_processes_are_not_read_again(self):
+        self.table.running = { 1 : 10, 2 : 20 }
+        self.table.scan()
+        added, removed = self.table.scan()
+        self.assertEqual(( added, removed ), ( [], [] ))
+        self.assertEqual(self.table.reads, 2)
+
+    def test_reused_pid(self):
+        self.table.running = { 1 : 10, 2 : 20 }
+        self.table.scan()
+        self.table.running = { 1 : 10, 2 : 25 }
+        added, removed = self.table.scan()
+        self.assertEqual(keys(added), [ ( 2, 25 ) ])
+        self.assertEqual(keys(removed), [ ( 2, 20 ) ])
+        self.assertEqual(keys(self.table.get_processes()), [ ( 1, 10 ), ( 2, 25 ) ])
+
+if __name__ == '__main__':
+    unittest.main()